@@ -0,0 +1,201 @@
+"""
+Usage analytics updated as jobs finish.
+
+Every line appended to the job ledger is counted once, into running totals
+and into fixed time buckets (10 minutes by default) per room, team and
+printer:
+    - jobs, pages and sheets printed (ledger status printed or manual_done)
+    - seconds the printer spent on jobs (every attempt that reached it,
+      split across the buckets it overlapped), for utilisation
+
+Only the most recent buckets are kept, so memory and the cost of a query
+depend on the number of rooms, teams, printers and buckets, not on how
+many jobs have run. The counters are saved in the server's state snapshot
+together with the ledger position they cover; on start-up only the ledger
+lines after that position are counted, and without a snapshot the
+counters are rebuilt from the whole ledger once.
+"""
+
+import copy
+import heapq
+import json
+import os
+import threading
+import time
+
+from job_ledger import PRINTED, MANUAL, MANUAL_DONE
+
+DEFAULT_BUCKET_SECONDS = 600
+DEFAULT_KEEP_BUCKETS = 144   # 24 hours of 10-minute buckets
+DEFAULT_WINDOW = 6           # Buckets returned by summary() unless asked otherwise
+DEFAULT_TOP = 10             # Teams listed as top consumers
+DIMENSIONS = ("room", "team", "printer")
+DEFAULT_PRINTER = "default"  # Jobs printed without a named printer (e.g. simulated printing)
+MANUAL_PRINTER = "manual"    # Jobs printed by hand by organisers
+
+
+def _counter(dimension):
+    counter = {"jobs": 0, "pages": 0, "sheets": 0}
+    if dimension == "printer":
+        counter["busy_seconds"] = 0.0
+    return counter
+
+
+class UsageAnalytics:
+    """Running totals and time-bucketed counters per room, team and printer."""
+
+    def __init__(self, bucket_seconds=DEFAULT_BUCKET_SECONDS, keep_buckets=DEFAULT_KEEP_BUCKETS, state=None):
+        self.bucket_seconds = bucket_seconds
+        self.keep_buckets = keep_buckets
+        self._lock = threading.Lock()
+        self._reset()
+        if state is not None and state["bucket_seconds"] == bucket_seconds:
+            self._totals = state["totals"]
+            self._buckets = state["buckets"]
+            self._team_rooms = state["team_rooms"]
+            self._offset = state["offset"]
+        self.replayed = 0
+
+    def _reset(self):
+        self._totals = {dimension: {} for dimension in DIMENSIONS}
+        self._buckets = {}     # bucket start -> {dimension: {key: counter}}
+        self._team_rooms = {}  # team -> room
+        self._offset = 0       # Bytes of the ledger file counted so far
+
+    @property
+    def offset(self):
+        with self._lock:
+            return self._offset
+
+    def state(self):
+        """The counters and ledger position, for a snapshot (copies)."""
+        with self._lock:
+            return copy.deepcopy({"bucket_seconds": self.bucket_seconds, "totals": self._totals,
+                                  "buckets": self._buckets, "team_rooms": self._team_rooms,
+                                  "offset": self._offset})
+
+    # --- Counting ---
+
+    def catch_up(self, ledger_file, end):
+        """Count the ledger lines between the counted position and byte `end`; returns how many."""
+        with self._lock:
+            if self._offset > end:
+                print("WARNING: Job ledger is shorter than the analytics counted; recounting")
+                self._reset()
+            if not os.path.exists(ledger_file):
+                return 0
+            count = 0
+            with open(ledger_file, 'rb') as f:
+                f.seek(self._offset)
+                while self._offset < end:
+                    line = f.readline()
+                    if not line:
+                        break
+                    count += 1
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        self._offset += len(line)
+                        continue
+                    self._add(record, self._offset + len(line))
+            self.replayed += count
+            return count
+
+    def add(self, record, offset=None):
+        """Count one ledger line; `offset` is the ledger position after it."""
+        with self._lock:
+            self._add(record, offset)
+
+    def _bucket(self, timestamp):
+        return int(timestamp // self.bucket_seconds) * self.bucket_seconds
+
+    def _count(self, timestamp, keys, **amounts):
+        # Caller holds the lock
+        targets = [self._totals]
+        bucket = self._bucket(timestamp)
+        newest = max(self._buckets, default=bucket)
+        oldest = max(bucket, newest) - (self.keep_buckets - 1) * self.bucket_seconds
+        if bucket >= oldest:
+            if bucket not in self._buckets:
+                self._buckets[bucket] = {dimension: {} for dimension in DIMENSIONS}
+                for start in [start for start in self._buckets if start < oldest]:
+                    del self._buckets[start]
+            targets.append(self._buckets[bucket])
+        for counters in targets:
+            for dimension, key in keys.items():
+                counter = counters[dimension].setdefault(key, _counter(dimension))
+                for name, amount in amounts.items():
+                    counter[name] += amount
+
+    def _add(self, record, offset):
+        # Caller holds the lock
+        status = record.get("status")
+        team = record.get("team", "")
+        room = record.get("room") or ""
+        self._team_rooms[team] = room
+        if status in (PRINTED, MANUAL) and record.get("started_at") and record.get("finished_at"):
+            # A printer attempt (a failed one kept the printer busy too)
+            printer = record.get("printer") or DEFAULT_PRINTER
+            start, end = record["started_at"], record["finished_at"]
+            while start < end:
+                stop = min(end, self._bucket(start) + self.bucket_seconds)
+                self._count(start, {"printer": printer}, busy_seconds=stop - start)
+                start = stop
+        if status in (PRINTED, MANUAL_DONE):
+            printer = (record.get("printer") or DEFAULT_PRINTER) if status == PRINTED else MANUAL_PRINTER
+            when = (record.get("finished_at") if status == PRINTED else record.get("resolved_at")) \
+                or record.get("recorded_at") or time.time()
+            self._count(when, {"room": room, "team": team, "printer": printer},
+                        jobs=1, pages=record.get("pages") or 0, sheets=record.get("sheets") or 0)
+        if offset is not None:
+            self._offset = offset
+
+    # --- Queries ---
+
+    def rooms(self):
+        """Rooms that have printed anything."""
+        with self._lock:
+            return sorted(self._totals["room"])
+
+    def summary(self, room=None, window=DEFAULT_WINDOW, top=DEFAULT_TOP, now=None):
+        """Totals, the top teams by sheets and the last `window` buckets, optionally for one room."""
+        now = time.time() if now is None else now
+        window = max(1, min(window, self.keep_buckets))
+        current = self._bucket(now)
+        starts = [current - i * self.bucket_seconds for i in range(window - 1, -1, -1)]
+        with self._lock:
+            rooms = {key: dict(counter) for key, counter in self._totals["room"].items()
+                     if room is None or key == room}
+            teams = [dict(counter, team=key, room=self._team_rooms.get(key, ""))
+                     for key, counter in self._totals["team"].items()
+                     if room is None or self._team_rooms.get(key) == room]
+            printers = {key: dict(counter, busy_seconds=round(counter["busy_seconds"], 1))
+                        for key, counter in self._totals["printer"].items()}
+            buckets = [(start, copy.deepcopy(self._buckets.get(start))) for start in starts]
+
+        series = []
+        busy = {}
+        for start, bucket in buckets:
+            bucket = bucket or {dimension: {} for dimension in DIMENSIONS}
+            elapsed = min(self.bucket_seconds, max(now - start, 1))
+            bucket_printers = {}
+            for key, counter in bucket["printer"].items():
+                busy[key] = busy.get(key, 0) + counter["busy_seconds"]
+                bucket_printers[key] = dict(counter, busy_seconds=round(counter["busy_seconds"], 1), utilisation=round(min(1.0, counter["busy_seconds"] / elapsed), 3))
+            series.append({
+                "start": start,
+                "rooms": {key: counter for key, counter in bucket["room"].items() if room is None or key == room},
+                "printers": bucket_printers,
+            })
+        window_seconds = max(now - starts[0], 1)
+        for key, counter in printers.items():
+            counter["utilisation"] = round(min(1.0, busy.get(key, 0) / window_seconds), 3)
+        return {
+            "bucket_seconds": self.bucket_seconds,
+            "window_start": starts[0],
+            "generated_at": now,
+            "rooms": rooms,
+            "printers": printers,
+            "top_teams": heapq.nlargest(top, teams, key=lambda counter: (counter["sheets"], counter["pages"])),
+            "series": series,
+        }
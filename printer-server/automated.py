@@ -1,13 +1,44 @@
-from flask import Flask, request, render_template, redirect, url_for
+from flask import Flask, request, render_template, redirect, url_for, Response, stream_with_context, send_file
+from werkzeug.security import safe_join
+import mimetypes
+import functools
+import hmac
+import ipaddress
 import os
+import json
+import atexit
+import math
 import platform
+import time
 from datetime import datetime
 
+STARTED_AT = time.perf_counter()
+
 # Import utility modules
-from utils import load_teams, get_team_info, move_to_completed
-from quota_manager import load_quota, get_team_quota, update_team_quota, reset_team_quota
-from pdf_utils import count_pdf_pages, validate_pdf, text_to_pdf_with_header
-from print_utils import print_pdf, get_default_printer, list_available_printers, check_sumatra_pdf, WINDOWS_PRINTING
+from utils import (load_teams, move_to_completed, file_stamp, reserve_path, file_sha256,
+                   parse_upload_name, original_uploads)
+from team_search import get_team_index, index_cache_state, restore_index_cache, DEFAULT_LIMIT as TEAM_SEARCH_LIMIT
+from quota_manager import (get_team_quota, update_team_quota, reset_team_quota, get_quota_snapshot,
+                           quota_cache_state, restore_quota_cache)
+from pdf_optimize import optimize_pdf
+from pdf_sandbox import SandboxPool, PdfRejected, RESOURCE_LIMITS
+from imposition import impose_pdf, sides_for, sheets_for, ALLOWED_NUP
+from pdf_utils import (count_pdf_pages, validate_pdf, text_to_pdf_with_header, stamp_pdf_header,
+                       parse_page_ranges, select_pages, subset_pdf, PageLimitExceeded)
+from print_utils import print_pdf, printer_ready, get_default_printer, list_available_printers, check_sumatra_pdf, duplex_supported, WINDOWS_PRINTING
+from page_cache import CachedPage, serve_cached, etag_for, init_static_fingerprints
+from rate_limit import TokenBucket, KeyedRateLimiter
+from scheduler import make_scheduler
+from job_queue import PrintQueue, PrintJob, JobJournal, JobFailed, CONVERTING, PRINTING, DONE, FINISHED_STATES
+from job_ledger import JobLedger, PRINTED, REJECTED, MANUAL, MANUAL_DONE, STATUSES
+from reconciler import Reconciler
+from quota_lease import LeaseClient, QuotaUnavailable
+from state_snapshot import Snapshotter, load_snapshot
+from watch_folder import FolderWatcher
+from retention import UploadArchive, Retention
+from analytics import UsageAnalytics
+from export_archive import (select_files, select_archived, select_records, selected_teams, build_manifest, stream_archive,
+                            archive_name, parse_time, FORMATS as EXPORT_FORMATS, MIMETYPES as EXPORT_MIMETYPES)
 
 # Check for reportlab
 try:
@@ -22,23 +53,647 @@ except ImportError:
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 UPLOAD_DIR = os.path.join(SCRIPT_DIR, "uploads")
 QUOTA_FILE = os.path.join(SCRIPT_DIR, "quota.json")
+JOB_LEDGER_FILE = os.path.join(SCRIPT_DIR, "jobs.jsonl")
+QUEUE_JOURNAL_FILE = os.path.join(SCRIPT_DIR, "queue.journal.jsonl")
+SNAPSHOT_FILE = os.path.join(SCRIPT_DIR, "state.snapshot")
 SEAT_PLAN_CSV = os.path.join(SCRIPT_DIR, "seat-plan.csv")
-MAX_PAGES = 50  # Maximum pages per team
+NODE_LEASE_FILE = os.path.join(SCRIPT_DIR, "quota_leases.json")
+ARCHIVE_DIR = os.path.join(SCRIPT_DIR, "archive")
+MAX_PAGES = 50  # Maximum sheets per team (one page per sheet unless printed n-up or duplex)
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+OPTIMIZE_PDFS = True  # Shrink uploaded PDFs (shared fonts, compressed streams, capped image DPI) before spooling
+MAX_IMAGE_DPI = 150  # Images above this resolution are downsampled (None keeps all images)
+OPTIMIZE_JPEG_QUALITY = 80  # JPEG quality for downsampled photos
+SANDBOX_PDF_PARSING = True  # Read and process uploaded PDFs (subset, stamp, n-up, optimise) only in resource-limited worker processes
+PDF_SANDBOX_WORKERS = 2  # Sandbox worker processes
+PDF_SANDBOX_TIMEOUT = 10  # Seconds a PDF may take to read before it is rejected
+PDF_SANDBOX_MEMORY_MB = 512  # Address-space cap per sandbox worker (POSIX only)
+PDF_SANDBOX_CPU_SECONDS = 10  # CPU time to read a PDF (POSIX only)
+PDF_SANDBOX_SECONDS_PER_PAGE = 0.25  # Processing (subset, stamp, n-up, optimise) may take the above plus this per page
+STAMP_PDF_HEADERS = True  # Stamp "Room / Desk / Team" onto every page of uploaded PDFs
+DEFAULT_NUP = 1  # Pages per printed side: 1, 2 or 4 (2-up code listings use two columns)
+DEFAULT_DUPLEX = False  # Print on both sides of the sheet
+ALLOW_JOB_LAYOUT = True  # Let teams pick pages per side and duplex on the upload form
 PRINT_RETRIES = 3  # Number of print attempts
 PRINT_TIMEOUT = 60  # Seconds to wait for print job
+SCHEDULER_POLICY = "fifo"  # Print order: "fifo", "sjf" (fewest pages first) or "fair" (share across rooms/teams)
+SCHEDULER_MAX_WAIT = 600  # Seconds after which any job prints next regardless of policy
+PREPARE_AHEAD = 10  # Prepared jobs waiting for the printer; beyond this new uploads wait to be prepared
+SJF_AGING_SECONDS = 20  # sjf: seconds of waiting that count as one page less
+ROOM_WEIGHTS = {}  # fair: relative printer share per room, e.g. {"Lab-1": 2}; default 1
+TEAM_WEIGHTS = {}  # fair: relative printer share per team; default 1
+TEAM_UPLOAD_RATE = 6 / 60  # Sustained uploads per second per team (6 per minute)
+TEAM_UPLOAD_BURST = 3  # Uploads a team may send back to back
+GLOBAL_UPLOAD_RATE = 2.0  # Sustained uploads per second across all teams
+GLOBAL_UPLOAD_BURST = 30  # Room for the contest-start rush
+QUEUE_HIGH_WATER = 100  # Queued jobs at which new uploads get 429
+MAX_RETRY_AFTER = 600  # Upper bound on the Retry-After hint (seconds)
+TEAM_DROPDOWN_LIMIT = 200  # Above this many teams the upload form uses a search box
+RECONCILE_FAILED_PRINTS = True  # Retry failed prints in the background once the printer is ready again
+RECONCILE_INTERVAL = 30  # Seconds between reconciler passes
+RECONCILE_BATCH_SIZE = 5  # Failed prints retried per pass
+RECONCILE_MAX_ATTEMPTS = 5  # Print attempts before a job is left to organisers
+ORPHAN_GRACE_SECONDS = 300  # Unqueued uploads older than this are re-queued (e.g. after a crash)
+SNAPSHOT_STATE = True  # Save queue, ledger indexes and caches periodically so restarts resume quickly
+SNAPSHOT_INTERVAL = 30  # Seconds between snapshots (only taken when something changed)
+WATCH_UPLOAD_FOLDER = True  # Print files saved into uploads/ by other tools (e.g. simple.py) as they arrive
+WATCH_SETTLE_SECONDS = 2  # A watched file must stay unchanged this long before it is queued
+ANALYTICS_BUCKET_MINUTES = 10  # Width of the time buckets on /analytics
+ANALYTICS_KEEP_HOURS = 24  # How far back per-bucket analytics are kept (totals cover the whole contest)
+ANALYTICS_WINDOW = 6  # Buckets shown on /analytics by default (?buckets= for more)
+ANALYTICS_TOP_TEAMS = 10  # Teams listed as top consumers
+JOB_HISTORY_LIMIT = 100  # Default number of jobs returned by /api/jobs
+MAX_JOB_HISTORY_LIMIT = 1000  # Upper bound for ?limit= on /api/jobs
+SSE_KEEPALIVE = 15  # Seconds between keep-alive comments on job event streams
+RETENTION_ENABLED = True  # Clean up and archive printed files in the background while the printer is idle
+REMOVE_ARTEFACTS_AFTER = 600  # Seconds after printing before generated copies (.pdf of code, stamped, n-up) are deleted (None keeps them)
+ARCHIVE_AFTER = 6 * 3600  # Seconds after printing before completed files move into compressed per-team archives (None keeps them)
+ARCHIVE_SEGMENT_MB = 64  # Size at which a team's archive segment is closed and a new one started
+RETENTION_INTERVAL = 300  # Seconds between retention passes
+NODE_ROOMS = []  # Rooms this server prints for, e.g. ["Lab-1"] with one server per lab; empty serves every room
+QUOTA_AUTHORITY_URL = None  # Central quota service shared by all print nodes, e.g. "http://10.0.0.5:8090" (None: quota.json only)
+NODE_NAME = platform.node()  # This print node's name at the quota service
+QUOTA_LEASE_SHEETS = 10  # Sheets leased from the quota service at a time
+ORGANISER_TOKEN = None  # Lets organisers download submissions from other machines (?token= or X-Organiser-Token header); None: only from this machine
+
+ALLOWED_EXTENSIONS = ['.pdf', '.txt', '.cpp', '.c', '.java', '.py', '.js', '.cs', '.h', '.hpp']
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
+init_static_fingerprints(app)
+
+# --- Print pipeline ---
+def pdf_step(func, *args, pages=0, **kwargs):
+    """Run a step that parses an uploaded PDF of `pages` pages, in the sandbox when it is enabled."""
+    if SANDBOX_PDF_PARSING:
+        return pdf_sandbox.run(func, *args, pages=pages, **kwargs)
+    return func(*args, **kwargs)
+
+
+def team_usage(team):
+    """Sheets a team has used and has left, counting its jobs still waiting to print.
+
+    With a quota service the figures are contest-wide (prepared jobs already
+    took their sheets from this node's lease). Raises QuotaUnavailable.
+    """
+    if quota_leases is None:
+        used = get_team_quota(team, QUOTA_FILE) + print_queue.reserved_sheets(team)
+        return used, MAX_PAGES - used
+    usage = quota_leases.usage()["teams"].get(team, {"used": 0, "available": MAX_PAGES})
+    return usage["used"], usage["available"]
+
+
+def charge_sheets(team, sheets):
+    """Charge a job's sheets to its team; returns the team's quota figures (or None).
+
+    With a quota service the sheets were taken from the lease when the job
+    was prepared, so only the figures are looked up.
+    """
+    if quota_leases is None:
+        used = update_team_quota(team, sheets, QUOTA_FILE) if sheets else get_team_quota(team, QUOTA_FILE)
+        return {"used": used, "max": MAX_PAGES, "remaining": MAX_PAGES - used}
+    try:
+        used, remaining = team_usage(team)
+    except QuotaUnavailable:
+        return None
+    return {"used": used, "max": MAX_PAGES, "remaining": remaining}
+
+
+def prepare_job(job):
+    """Convert, validate, count and select pages and check quota for a queued job (worker thread)."""
+    if job.quota_charged:
+        return  # Retry of a failed print: already prepared and charged
+
+    team = job.team
+    team_info = job.team_info
+    file_path = job.file_path
+    pdf_to_print = file_path
+
+    print_queue.update(job, state=CONVERTING)
+    job.sha256 = file_sha256(file_path)
+    if job.duplex and not duplex_supported():
+        # Charge and print one sheet per side rather than find out after printing
+        print(f"WARNING: Duplex is not available (needs SumatraPDF); job {job.id} prints single-sided")
+        job.duplex = False
+
+    def discard():
+        if pdf_to_print != file_path and os.path.exists(pdf_to_print):
+            os.remove(pdf_to_print)
+        if job.owns_file:
+            os.remove(file_path)
+        else:
+            # Saved by another tool: leave it, and let the ledger record own it
+            job.files = [upload_path(file_path)]
+
+    def use_derived(path):
+        # Each stage writes a new file; keep a single derived copy next to the upload
+        nonlocal pdf_to_print
+        if pdf_to_print != file_path:
+            os.replace(path, pdf_to_print)
+        else:
+            pdf_to_print = path
+
+    # Sheets already used, counting this team's jobs still waiting to print
+    try:
+        current_quota, remaining = team_usage(team)
+    except QuotaUnavailable as e:
+        print(f"WARNING: {e}")
+        discard()
+        raise JobFailed("The quota service cannot be reached right now. Please try again in a minute.")
+    sides_per_sheet = 2 if job.duplex else 1
+    # Code listings printed 2-up are rendered as two columns per page instead of imposed
+    two_column_text = job.is_text_file and job.nup == 2
+
+    def quota_exceeded(pages_text):
+        if job.nup == 1 and not job.duplex:
+            needs = f"This file has {pages_text} pages."
+        else:
+            needs = f"This file needs {pages_text} sheets."
+        return JobFailed(f"Quota exceeded. You have used {current_quota}/{MAX_PAGES} pages. {needs}",
+                         quota_info={
+                             "used": current_quota,
+                             "max": MAX_PAGES,
+                             "remaining": remaining
+                         })
+
+    if remaining <= 0:
+        discard()
+        raise quota_exceeded("at least 1")
+
+    if job.is_text_file:
+        # Convert text file to PDF with header, stopping once it outgrows the quota
+        print(f"Converting text file to PDF with team header...")
+        pdf_path = file_path + ".pdf"
+        # Stop rendering once the pages could no longer fit on the remaining sheets
+        pages_per_sheet = sides_per_sheet * (1 if two_column_text else job.nup)
+        try:
+            pages = text_to_pdf_with_header(file_path, pdf_path, team_info,
+                                            max_pages=remaining * pages_per_sheet,
+                                            columns=2 if two_column_text else 1)
+            pdf_to_print = pdf_path
+            print(f"Created PDF: {pdf_path}")
+        except PageLimitExceeded:
+            discard()
+            raise quota_exceeded(f"more than {remaining}")
+        except Exception as e:
+            discard()
+            raise JobFailed(f"Failed to process text file: {str(e)}")
+    elif SANDBOX_PDF_PARSING:
+        # Read the whole PDF in a disposable, resource-limited process first,
+        # so a malicious file cannot stall or exhaust the print worker
+        try:
+            pages = pdf_sandbox.inspect(file_path)["pages"]
+        except PdfRejected as e:
+            discard()
+            raise JobFailed(str(e))
+    else:
+        # Validate PDF
+        if not validate_pdf(file_path):
+            discard()
+            raise JobFailed("Invalid or corrupted PDF file")
+
+        # Count pages
+        try:
+            pages = count_pdf_pages(pdf_to_print)
+        except ValueError as e:
+            discard()
+            raise JobFailed(str(e))
+
+    job.source_pages = pages
+    selected = None
+    if job.page_range and pages:
+        # Only the selected pages are printed and charged
+        try:
+            selected = select_pages(parse_page_ranges(job.page_range), pages)
+        except ValueError as e:
+            discard()
+            raise JobFailed(str(e))
+        pages = len(selected)
+
+    if pages == 0:
+        discard()
+        raise JobFailed("File has no pages")
+
+    sides = pages if two_column_text else sides_for(pages, job.nup)
+    sheets = sheets_for(sides, job.duplex)
+
+    # Check quota
+    if current_quota + sheets > MAX_PAGES:
+        discard()
+        raise quota_exceeded(sheets)
+
+    if selected is not None and pages < job.source_pages:
+        # Copy out just the selected pages before anything else touches them
+        subset_path = file_path + ".pages.pdf"
+        try:
+            pdf_step(subset_pdf, pdf_to_print, subset_path, selected, pages=job.source_pages)
+            use_derived(subset_path)
+        except Exception as e:
+            if os.path.exists(subset_path):
+                os.remove(subset_path)
+            discard()
+            raise JobFailed(f"Could not extract pages {job.page_range}: {str(e)}")
+
+    if not job.is_text_file and STAMP_PDF_HEADERS and REPORTLAB_AVAILABLE:
+        # Text conversions already carry the header; stamp it onto uploaded PDFs
+        stamped_path = file_path + ".stamped.pdf"
+        try:
+            pdf_step(stamp_pdf_header, pdf_to_print, stamped_path, team_info, pages=pages)
+            use_derived(stamped_path)
+        except Exception as e:
+            print(f"WARNING: Could not stamp header onto {file_path}, printing it unchanged: {e}")
+            if os.path.exists(stamped_path):
+                os.remove(stamped_path)
+
+    if job.nup > 1 and not two_column_text:
+        # Lay several (already stamped) pages onto each side
+        imposed_path = file_path + ".nup.pdf"
+        try:
+            pdf_step(impose_pdf, pdf_to_print, imposed_path, job.nup, pages=pages)
+            use_derived(imposed_path)
+        except Exception as e:
+            if os.path.exists(imposed_path):
+                os.remove(imposed_path)
+            discard()
+            raise JobFailed(f"Could not print {job.nup} pages per sheet: {str(e)}. Please upload again with 1 page per sheet.")
+
+    if not job.is_text_file and OPTIMIZE_PDFS:
+        # Shrink the spool file; text conversions are already compact
+        optimized_path = file_path + ".opt.pdf"
+        try:
+            stats = pdf_step(optimize_pdf, pdf_to_print, optimized_path, max_image_dpi=MAX_IMAGE_DPI,
+                             jpeg_quality=OPTIMIZE_JPEG_QUALITY, pages=pages)
+            job.spool.update(stats)
+            if stats["used"]:
+                use_derived(optimized_path)
+                print(f"Optimized PDF: {stats['original_bytes']} -> {stats['optimized_bytes']} bytes in {stats['seconds']}s")
+        except Exception as e:
+            print(f"WARNING: Could not optimize {pdf_to_print}, printing it unchanged: {e}")
+            if os.path.exists(optimized_path):
+                os.remove(optimized_path)
+
+    if quota_leases is not None:
+        # Federation: take the sheets from this node's lease on the team's quota
+        try:
+            lease = quota_leases.reserve(team, sheets)
+        except QuotaUnavailable as e:
+            print(f"WARNING: {e}")
+            discard()
+            raise JobFailed("The quota service cannot be reached right now. Please try again in a minute.")
+        if not lease["granted"]:
+            discard()
+            used = MAX_PAGES - lease["available"]
+            raise JobFailed(f"Quota exceeded. You have {lease['available']} of {MAX_PAGES} sheets left; "
+                            f"this file needs {sheets}.",
+                            quota_info={"used": used, "max": MAX_PAGES, "remaining": lease["available"]})
+
+    job.spool.setdefault("original_bytes", os.path.getsize(pdf_to_print))
+    job.spool.setdefault("optimized_bytes", os.path.getsize(pdf_to_print))
+    job.pdf_path = pdf_to_print
+    job.pages = pages
+    job.sides = sides
+    job.sheets = sheets
+
+
+def print_job(job):
+    """Print a prepared job, charge quota and file it as completed (worker thread)."""
+    team = job.team
+    team_info = job.team_info
+    file_path = job.file_path
+    pdf_to_print = job.pdf_path
+    pages = job.pages
+    sheets = job.sheets
+
+    print_queue.update(job, state=PRINTING)
+    job.printer = get_default_printer()
+    # Files stay in the team folder until the print succeeds
+    job.files = [upload_path(path) for path in dict.fromkeys([file_path, pdf_to_print])]
+
+    # Print the PDF
+    spool_started = time.perf_counter()
+    try:
+        print_pdf(pdf_to_print, PRINT_RETRIES, PRINT_TIMEOUT, duplex=job.duplex)
+        job.spool["spool_seconds"] = round(time.perf_counter() - spool_started, 3)
+    except Exception as e:
+        print_error = str(e)
+        print(f"PRINTING FAILED: {print_error}")
+        # Don't delete files on print failure - keep for a retry or manual printing
+        if job.quota_charged:
+            raise JobFailed(f"Printing failed again: {print_error}. File has been saved for another attempt.")
+        # Still update quota to prevent abuse
+        quota_info = charge_sheets(team, sheets)
+        job.quota_charged = True
+        later = ("will be printed automatically once the printer recovers" if RECONCILE_FAILED_PRINTS
+                 else "will be printed manually by organizers")
+        raise JobFailed(f"Printing failed: {print_error}. File has been saved and {later}. Your quota has been updated.",
+                        quota_info=quota_info)
+
+    # Update quota only after successful print (retries were charged when they first failed)
+    job.quota_info = charge_sheets(team, 0 if job.quota_charged else sheets)
+    job.quota_charged = True
+
+    # Move files to completed directory
+    job.files = file_completed(team, [file_path, pdf_to_print])
+
+    total = f" Total: {job.quota_info['used']}/{MAX_PAGES}" if job.quota_info else ""
+    print(f"Successfully printed {pages} pages on {sheets} sheets for {team} ({team_info['room']}, Desk {team_info['desk']}).{total}")
+
+
+def upload_path(path):
+    """Path of an uploaded or derived file relative to the upload folder."""
+    return os.path.relpath(path, UPLOAD_DIR)
+
+
+def file_completed(team, paths):
+    """Move a printed job's files to the team's completed folder.
+
+    Returns the files' new relative paths; a file that could not be moved
+    keeps its old path, so the ledger still owns it.
+    """
+    files = []
+    for path in dict.fromkeys(paths):
+        if os.path.exists(path):
+            path = move_to_completed(path, team, UPLOAD_DIR) or path
+        files.append(upload_path(path))
+    return files
+
+
+def record_job(job):
+    """Write a finished job to the ledger (worker thread)."""
+    if job.state == DONE:
+        status = PRINTED
+    elif job.started_at is not None:
+        status = MANUAL  # Reached the printer and failed; files were kept
+    else:
+        status = REJECTED
+    if job.attempts > 1:
+        # Automatic retry: update the original record rather than adding a job
+        job_ledger.update(job.id, status=status, state=job.state, error=job.error, printer=job.printer,
+                          files=job.files, attempts=job.attempts, started_at=job.started_at,
+                          finished_at=job.finished_at, spool=dict(job.spool))
+        return
+    job_ledger.record(dict(job.to_dict(), status=status, sha256=job.sha256, files=job.files))
+
+
+snapshot = load_snapshot(SNAPSHOT_FILE) if SNAPSHOT_STATE else None
+if snapshot:
+    restore_index_cache(snapshot["team_index"])
+    restore_quota_cache(snapshot["quota"])
+
+usage_analytics = UsageAnalytics(ANALYTICS_BUCKET_MINUTES * 60,
+                                 keep_buckets=ANALYTICS_KEEP_HOURS * 60 // ANALYTICS_BUCKET_MINUTES,
+                                 state=snapshot and snapshot["analytics"])
+job_ledger = JobLedger(JOB_LEDGER_FILE, state=snapshot and snapshot["ledger"], on_append=usage_analytics.add)
+usage_analytics.catch_up(JOB_LEDGER_FILE, job_ledger.offset)
+
+quota_leases = None
+if QUOTA_AUTHORITY_URL:
+    quota_leases = LeaseClient(QUOTA_AUTHORITY_URL, NODE_NAME, NODE_LEASE_FILE, lease_sheets=QUOTA_LEASE_SHEETS)
+    quota_leases.start()
+    atexit.register(quota_leases.release_all)
+
+pdf_sandbox = SandboxPool(PDF_SANDBOX_WORKERS, PDF_SANDBOX_TIMEOUT,
+                          PDF_SANDBOX_MEMORY_MB, PDF_SANDBOX_CPU_SECONDS, PDF_SANDBOX_SECONDS_PER_PAGE)
+
+print_queue = PrintQueue(prepare_job, print_job,
+                         make_scheduler(SCHEDULER_POLICY, max_wait=SCHEDULER_MAX_WAIT,
+                                        aging=SJF_AGING_SECONDS,
+                                        room_weights=ROOM_WEIGHTS, team_weights=TEAM_WEIGHTS),
+                         on_finished=record_job, journal=JobJournal(QUEUE_JOURNAL_FILE),
+                         prepare_ahead=PREPARE_AHEAD)
+
+
+def finished_before_restart(job):
+    """Whether the ledger already has the outcome of this job (attempt)."""
+    record = job_ledger.get(job.id)
+    return record is not None and record.get("attempts", 1) >= job.attempts
+
+
+resumed_jobs = print_queue.recover(snapshot and snapshot["queue"], is_finished=finished_before_restart)
+print_queue.start()
+
+
+def collect_state():
+    """Everything saved in a snapshot."""
+    return {
+        "queue": print_queue.snapshot(),
+        "ledger": job_ledger.state(),
+        "analytics": usage_analytics.state(),
+        "team_index": index_cache_state(),
+        "quota": quota_cache_state(),
+    }
+
+
+snapshotter = Snapshotter(SNAPSHOT_FILE, collect_state, interval=SNAPSHOT_INTERVAL,
+                          marker=lambda: (print_queue.version(), job_ledger.offset))
+if SNAPSHOT_STATE:
+    snapshotter.start()
+
+
+def saved_file_job(path, team_info, options=None):
+    """A print job for a file found in a team folder rather than uploaded, or None.
+
+    The file gets the upload form's checks (type, size). `options` is the
+    queue journal record of the upload that created it, if any: its
+    filename, layout and page range are kept, and only then does the
+    server own (and may delete) the file.
+    """
+    name = os.path.basename(path)
+    if options is not None:
+        filename = options['filename']
+    else:
+        parsed = parse_upload_name(name, team_info)
+        filename = parsed['filename'] if parsed else name
+    filename_lower = filename.lower()
+    is_text_file = any(filename_lower.endswith(ext) for ext in ALLOWED_EXTENSIONS if ext != '.pdf')
+    if not (is_text_file or filename_lower.endswith('.pdf')):
+        print(f"Not printing {path}: unsupported file type")
+        return None
+    if is_text_file and not REPORTLAB_AVAILABLE:
+        print(f"Not printing {path}: text file printing is not available")
+        return None
+    size = os.path.getsize(path)
+    if size == 0 or size > MAX_FILE_SIZE:
+        print(f"Not printing {path}: file is empty or larger than {MAX_FILE_SIZE / (1024*1024):.1f} MB")
+        return None
+    if options is None:
+        return PrintJob(team_info['team'], team_info, filename, path, is_text_file,
+                        nup=DEFAULT_NUP, duplex=DEFAULT_DUPLEX, owns_file=False)
+    return PrintJob(team_info['team'], team_info, filename, path, is_text_file,
+                    nup=options.get('nup', DEFAULT_NUP), duplex=options.get('duplex', DEFAULT_DUPLEX),
+                    page_range=options.get('page_range'))
+
+
+def ingest_watched_files(paths):
+    """Queue files that other tools saved into the upload folder (watcher thread).
+
+    Files are checked like uploads to the form; those this server queued
+    itself, derived files and files the ledger already knows are skipped.
+    """
+    queued = {job.file_path for job in print_queue.unfinished_jobs()}
+    team_index = get_team_index(SEAT_PLAN_CSV)
+    jobs = []
+    for path in paths:
+        folder, name = os.path.split(path)
+        team = os.path.basename(folder)
+        if path in queued or job_ledger.owner(upload_path(path)) is not None:
+            continue
+        if name not in original_uploads(os.listdir(folder)):
+            continue
+        seat = team_index.get(team)
+        if seat is None:
+            print(f"Not printing {path}: '{team}' is not in the seat plan")
+            continue
+        if not serves_room(seat['room']):
+            continue  # Printed by the node for that room
+        job = saved_file_job(path, {'room': seat['room'], 'desk': seat['desk'], 'team': team})
+        if job is not None:
+            jobs.append(job)
+    print_queue.submit_many(jobs)
+    for job in jobs:
+        print(f"Queued {job.file_path} from the upload folder as job {job.id}")
+
+
+folder_watcher = FolderWatcher(UPLOAD_DIR, ingest_watched_files, settle=WATCH_SETTLE_SECONDS)
+if WATCH_UPLOAD_FOLDER:
+    folder_watcher.start()
+
+
+def printed_at(path):
+    """When the job owning a file (relative to the upload folder) was printed, or None."""
+    job_id = job_ledger.owner(path)
+    record = job_ledger.get(job_id) if job_id is not None else None
+    if record is None:
+        return None
+    return record.get("resolved_at") or record.get("finished_at")
+
+
+upload_archive = UploadArchive(ARCHIVE_DIR, segment_bytes=ARCHIVE_SEGMENT_MB * 1024 * 1024)
+retention = Retention(UPLOAD_DIR, upload_archive, printed_at=printed_at,
+                      is_idle=lambda: print_queue.depth() == 0,
+                      archive_after=ARCHIVE_AFTER, artefact_grace=REMOVE_ARTEFACTS_AFTER,
+                      interval=RETENTION_INTERVAL)
+if RETENTION_ENABLED:
+    retention.start()
+
+startup_ms = (time.perf_counter() - STARTED_AT) * 1000
+print(f"Restored state in {startup_ms:.0f} ms ({'from snapshot' if snapshot else 'no snapshot'}): "
+      f"{len(resumed_jobs)} jobs resumed, {job_ledger.replayed} ledger lines replayed")
+
+
+def serves_room(room):
+    """Whether this server prints for teams seated in `room`."""
+    return not NODE_ROOMS or room in NODE_ROOMS
+
+
+def orphan_job(path, team_info):
+    """Print job for an orphaned upload, with the options it was uploaded with (reconciler thread)."""
+    return saved_file_job(path, team_info, print_queue.journal.find(path))
+
+
+def team_lookup(team):
+    """Team info for a team folder name, or None if it is not a team (of this node)."""
+    seat = get_team_index(SEAT_PLAN_CSV).get(team)
+    if seat is None or not serves_room(seat['room']):
+        return None
+    return {'room': seat['room'], 'desk': seat['desk'], 'team': team}
+
+
+reconciler = Reconciler(print_queue, job_ledger, UPLOAD_DIR, team_lookup, printer_ready, orphan_job,
+                        interval=RECONCILE_INTERVAL, batch_size=RECONCILE_BATCH_SIZE,
+                        max_attempts=RECONCILE_MAX_ATTEMPTS, orphan_grace=ORPHAN_GRACE_SECONDS)
+if RECONCILE_FAILED_PRINTS:
+    reconciler.start()
+
+
+def organiser_request():
+    """True for requests from this machine, or carrying ORGANISER_TOKEN."""
+    try:
+        if ipaddress.ip_address(request.remote_addr or "").is_loopback:
+            return True
+    except ValueError:
+        pass
+    token = request.headers.get("X-Organiser-Token") or request.args.get("token")
+    return bool(ORGANISER_TOKEN) and token is not None and hmac.compare_digest(token, ORGANISER_TOKEN)
+
+
+def organiser_only(view):
+    """Answer 403 unless the request comes from an organiser (see organiser_request)."""
+    @functools.wraps(view)
+    def guarded(*args, **kwargs):
+        if not organiser_request():
+            print(f"Refused {request.path} to {request.remote_addr}")
+            return {"error": "Organisers only: open this on the print server or pass the organiser token"}, 403
+        return view(*args, **kwargs)
+    return guarded
+
+
+def wants_json():
+    """True when the client asked for a JSON response instead of HTML."""
+    if request.args.get("format") == "json":
+        return True
+    best = request.accept_mimetypes.best_match(["application/json", "text/html"])
+    return best == "application/json" and request.accept_mimetypes[best] > request.accept_mimetypes["text/html"]
+
+
+def upload_error(error, status=400, headers=None):
+    """Render an upload rejection as HTML or JSON."""
+    if wants_json():
+        return {"success": False, "error": error}, status, headers or {}
+    return render_template("automated_result.html", success=False, error=error), status, headers or {}
+
+
+def too_many_requests(error, retry_after):
+    """429 rejection with a Retry-After hint in whole seconds."""
+    retry_after = max(1, math.ceil(min(retry_after, MAX_RETRY_AFTER)))
+    return upload_error(f"{error} Please try again in {retry_after} seconds.", 429,
+                        {"Retry-After": str(retry_after)})
+
+
+team_limiter = KeyedRateLimiter(TEAM_UPLOAD_RATE, TEAM_UPLOAD_BURST)
+global_limiter = TokenBucket(GLOBAL_UPLOAD_RATE, GLOBAL_UPLOAD_BURST)
+
+
+_index_cache = {}  # (seat plan stamp, duplex available) -> CachedPage
+
+
+def index_page():
+    """Rendered upload form, re-rendered only when the seat plan changes."""
+    stamp = file_stamp(SEAT_PLAN_CSV)
+    duplex_available = duplex_supported()
+    page = _index_cache.get((stamp, duplex_available))
+    if page is None:
+        team_index = get_team_index(SEAT_PLAN_CSV)
+        # Small seat plans keep the plain dropdown; large ones use the typeahead
+        teams = ([row['team'] for row in team_index.rows if serves_room(row['room'])]
+                 if len(team_index) <= TEAM_DROPDOWN_LIMIT else None)
+        body = render_template("automated_index.html", teams=teams, team_count=len(team_index),
+                               max_pages=MAX_PAGES, allow_layout=ALLOW_JOB_LAYOUT,
+                               layouts=ALLOWED_NUP, default_nup=DEFAULT_NUP, default_duplex=DEFAULT_DUPLEX,
+                               duplex_available=duplex_available)
+        page = CachedPage(body, etag_for("index", stamp, MAX_PAGES, ALLOW_JOB_LAYOUT, DEFAULT_NUP, DEFAULT_DUPLEX,
+                                          duplex_available, tuple(NODE_ROOMS)))
+        _index_cache.clear()
+        _index_cache[(stamp, duplex_available)] = page
+    return page
+
 
 # --- Routes ---
 @app.route("/", methods=["GET", "POST"])
 def upload_file():
-    teams = load_teams(SEAT_PLAN_CSV)
-    
     if request.method == "POST":
+        # Admission control before the upload body is parsed: shed load the
+        # printers cannot drain instead of queueing it
+        if print_queue.depth() >= QUEUE_HIGH_WATER:
+            return too_many_requests("The print queue is full.", print_queue.estimated_drain())
+        
+        admitted, retry_after = global_limiter.try_acquire()
+        if not admitted:
+            return too_many_requests("The print server is busy.", retry_after)
+        
+        submitted = False
         try:
             # Get form data
             team = request.form.get("team", "").strip()
@@ -46,39 +701,59 @@ def upload_file():
             
             # Validation
             if not team:
-                return render_template("automated_result.html", 
-                                     success=False, 
-                                     error="Team name is required")
+                return upload_error("Team name is required")
             
             if not file or file.filename == '':
-                return render_template("automated_result.html", 
-                                     success=False, 
-                                     error="No file selected")
+                return upload_error("No file selected")
             
-            if team not in teams:
-                return render_template("automated_result.html", 
-                                     success=False, 
-                                     error="Invalid team name")
+            seat = get_team_index(SEAT_PLAN_CSV).get(team)
+            if seat is None:
+                return upload_error("Invalid team name")
+            if not serves_room(seat['room']):
+                return upload_error(f"This printer serves {', '.join(NODE_ROOMS)}. "
+                                    f"Please upload from the print server in {seat['room']}.")
+            
+            admitted, retry_after = team_limiter.try_acquire(team)
+            if not admitted:
+                return too_many_requests("Too many uploads from your team.", retry_after)
             
             # Get team info
-            team_info = get_team_info(team, SEAT_PLAN_CSV)
+            team_info = {'room': seat['room'], 'desk': seat['desk'], 'team': team}
             
             # Check file extension - support PDF, txt, and code files
             filename_lower = file.filename.lower()
-            allowed_extensions = ['.pdf', '.txt', '.cpp', '.c', '.java', '.py', '.js', '.cs', '.h', '.hpp']
-            is_text_file = any(filename_lower.endswith(ext) for ext in allowed_extensions if ext != '.pdf')
+            is_text_file = any(filename_lower.endswith(ext) for ext in ALLOWED_EXTENSIONS if ext != '.pdf')
             is_pdf = filename_lower.endswith('.pdf')
             
             if not (is_pdf or is_text_file):
-                return render_template("automated_result.html", 
-                                     success=False, 
-                                     error="Only PDF, TXT, and code files (.cpp, .c, .java, .py, etc.) are allowed")
+                return upload_error("Only PDF, TXT, and code files (.cpp, .c, .java, .py, etc.) are allowed")
             
             # For text files, check if reportlab is available
             if is_text_file and not REPORTLAB_AVAILABLE:
-                return render_template("automated_result.html", 
-                                     success=False, 
-                                     error="Text file printing is not available. Please convert to PDF first or contact organizers.")
+                return upload_error("Text file printing is not available. Please convert to PDF first or contact organizers.")
+            
+            # Optional page selection (PDFs only; code listings print in full)
+            page_range = request.form.get("page_range", "").strip() or None
+            if page_range:
+                if is_text_file:
+                    return upload_error("Page ranges can only be selected for PDF files")
+                try:
+                    parse_page_ranges(page_range)
+                except ValueError as e:
+                    return upload_error(str(e))
+            
+            # Print layout: pages per side and duplex
+            nup, duplex = DEFAULT_NUP, DEFAULT_DUPLEX
+            if ALLOW_JOB_LAYOUT:
+                try:
+                    nup = int(request.form.get("layout", DEFAULT_NUP))
+                except ValueError:
+                    nup = None
+                if nup not in ALLOWED_NUP:
+                    return upload_error("Pages per sheet must be 1, 2 or 4")
+                if "duplex" in request.form:
+                    # The form sends a hidden "0" ahead of the checkbox; the last value wins
+                    duplex = request.form.getlist("duplex")[-1].lower() in ("1", "on", "true", "yes")
             
             # Create team folder
             team_folder = os.path.join(UPLOAD_DIR, team)
@@ -87,155 +762,267 @@ def upload_file():
             # Save file with timestamp
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             safe_filename = f"{timestamp}_{file.filename}"
-            file_path = os.path.join(team_folder, safe_filename)
+            file_path = reserve_path(team_folder, safe_filename)
             file.save(file_path)
             
             print(f"Received file from {team}: {file_path}")
             
-            # Process based on file type
-            pdf_to_print = file_path
-            
-            if is_text_file:
-                # Convert text file to PDF with header
-                print(f"Converting text file to PDF with team header...")
-                pdf_path = file_path + ".pdf"
-                try:
-                    text_to_pdf_with_header(file_path, pdf_path, team_info)
-                    pdf_to_print = pdf_path
-                    print(f"Created PDF: {pdf_path}")
-                except Exception as e:
-                    os.remove(file_path)
-                    return render_template("automated_result.html", 
-                                         success=False, 
-                                         error=f"Failed to process text file: {str(e)}")
-            else:
-                # Validate PDF
-                if not validate_pdf(file_path):
-                    os.remove(file_path)
-                    return render_template("automated_result.html", 
-                                         success=False, 
-                                         error="Invalid or corrupted PDF file")
-            
-            # Count pages
-            try:
-                pages = count_pdf_pages(pdf_to_print)
-            except ValueError as e:
-                os.remove(file_path)
-                if is_text_file and os.path.exists(pdf_to_print):
-                    os.remove(pdf_to_print)
-                return render_template("automated_result.html", 
-                                     success=False, 
-                                     error=str(e))
-            
-            if pages == 0:
-                os.remove(file_path)
-                if is_text_file and os.path.exists(pdf_to_print):
-                    os.remove(pdf_to_print)
-                return render_template("automated_result.html", 
-                                     success=False, 
-                                     error="File has no pages")
-            
-            # Check quota
-            current_quota = get_team_quota(team, QUOTA_FILE)
-            if current_quota + pages > MAX_PAGES:
-                os.remove(file_path)
-                if is_text_file and os.path.exists(pdf_to_print):
-                    os.remove(pdf_to_print)
-                return render_template("automated_result.html", 
-                                     success=False, 
-                                     error=f"Quota exceeded. You have used {current_quota}/{MAX_PAGES} pages. This file has {pages} pages.",
-                                     quota_info={
-                                         "used": current_quota,
-                                         "max": MAX_PAGES,
-                                         "remaining": MAX_PAGES - current_quota
-                                     })
-            
-            # Print the PDF
-            print_success = False
-            print_error = None
-            try:
-                print_pdf(pdf_to_print, PRINT_RETRIES, PRINT_TIMEOUT)
-                print_success = True
-            except Exception as e:
-                print_error = str(e)
-                print(f"PRINTING FAILED: {print_error}")
-                # Don't delete files on print failure - keep for manual printing
-                # Still update quota to prevent abuse
-                new_quota = update_team_quota(team, pages, QUOTA_FILE)
-                
-                return render_template("automated_result.html", 
-                                     success=False, 
-                                     error=f"Printing failed: {print_error}. File has been saved and will be printed manually by organizers. Your quota has been updated.",
-                                     quota_info={
-                                         "used": new_quota,
-                                         "max": MAX_PAGES,
-                                         "remaining": MAX_PAGES - new_quota
-                                     },
-                                     team=team,
-                                     team_info=team_info,
-                                     filename=file.filename,
-                                     pages=pages)
-            
-            # Update quota only after successful print
-            new_quota = update_team_quota(team, pages, QUOTA_FILE)
-            
-            # Move files to completed directory
-            move_to_completed(file_path, team, UPLOAD_DIR)
-            if is_text_file and os.path.exists(pdf_to_print) and pdf_to_print != file_path:
-                move_to_completed(pdf_to_print, team, UPLOAD_DIR)
+            # Hand off to the print worker and answer right away
+            job = print_queue.submit(PrintJob(team, team_info, file.filename, file_path, is_text_file,
+                                              nup=nup, duplex=duplex, page_range=page_range))
+            submitted = True
+            status = print_queue.status(job.id)
             
-            print(f"Successfully printed {pages} pages for {team} ({team_info['room']}, Desk {team_info['desk']}). Total: {new_quota}/{MAX_PAGES}")
+            if wants_json():
+                return {
+                    "success": True,
+                    "job_id": job.id,
+                    "status_url": url_for('job_status', job_id=job.id),
+                    "events_url": url_for('job_events', job_id=job.id),
+                    "job": status
+                }, 202
             
-            return render_template("automated_result.html", 
-                                 success=True, 
-                                 team=team,
-                                 team_info=team_info,
-                                 filename=file.filename,
-                                 pages=pages,
-                                 quota_info={
-                                     "used": new_quota,
-                                     "max": MAX_PAGES,
-                                     "remaining": MAX_PAGES - new_quota
-                                 })
+            return render_template("automated_status.html", job=status, max_pages=MAX_PAGES), 202
         
         except Exception as e:
             print(f"Error processing upload: {e}")
             import traceback
             traceback.print_exc()
-            return render_template("automated_result.html", 
-                                 success=False, 
-                                 error=f"Server error: {str(e)}. Please try again or contact organizers.")
+            return upload_error(f"Server error: {str(e)}. Please try again or contact organizers.", 500)
+        finally:
+            if not submitted:
+                # Only queued uploads use up the shared allowance; rejected ones hand it back
+                global_limiter.refund()
     
     # GET request - show upload form
-    return render_template("automated_index.html", teams=teams, max_pages=MAX_PAGES)
+    return serve_cached(index_page(), "text/html")
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    """Current state of a print job as JSON."""
+    status = print_queue.status(job_id)
+    if status is None:
+        # Finished jobs dropped from the in-memory table are still in the ledger
+        status = job_ledger.get(job_id)
+        if status is None:
+            return {"error": "Unknown job"}, 404
+        status.pop("files", None)
+    return status
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    """Server-Sent Events stream of a job's state until it finishes."""
+    if print_queue.status(job_id) is None:
+        return {"error": "Unknown job"}, 404
+
+    def stream():
+        version = None
+        last = None
+        while True:
+            status = print_queue.status(job_id)
+            if status is None:
+                return
+            if status != last:
+                yield f"event: status\ndata: {json.dumps(status)}\n\n"
+                last = status
+            if status["state"] in FINISHED_STATES:
+                return
+            new_version = print_queue.wait_for_update(version, timeout=SSE_KEEPALIVE)
+            if new_version == version:
+                yield ": keep-alive\n\n"
+            version = new_version
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def cached_response(snapshot, key, mimetype, build):
+    """Serve a body cached on the quota snapshot with its ETag (304 when unchanged).
+
+    A `key` of None builds the body without caching it.
+    """
+    page = snapshot["rendered"].get(key) if key else None
+    if page is None:
+        page = CachedPage(build(), snapshot["etag"])
+        if key:
+            snapshot["rendered"][key] = page
+    return serve_cached(page, mimetype)
+
+def quota_snapshot():
+    """Quota rows for /quota and /api/quota; contest-wide figures when a quota service is used."""
+    usage = quota_leases.usage()["teams"] if quota_leases is not None else None
+    return get_quota_snapshot(QUOTA_FILE, SEAT_PLAN_CSV, MAX_PAGES, usage=usage)
 
 @app.route("/quota")
 def show_quota():
     """Show quota status for all teams."""
-    quota = load_quota(QUOTA_FILE)
-    teams = load_teams(SEAT_PLAN_CSV)
-    
-    quota_info = []
-    for team in teams:
-        used = quota.get(team, 0)
-        quota_info.append({
-            "team": team,
-            "used": used,
-            "remaining": MAX_PAGES - used,
-            "percentage": (used / MAX_PAGES * 100) if MAX_PAGES > 0 else 0
-        })
-    
-    return render_template("quota_status.html", 
-                         quota_info=quota_info, 
-                         max_pages=MAX_PAGES)
+    try:
+        snapshot = quota_snapshot()
+    except QuotaUnavailable:
+        return {"error": "The quota service cannot be reached right now"}, 503
+    return cached_response(snapshot, "html", "text/html",
+                           lambda: render_template("quota_status.html",
+                                                   quota_info=snapshot["teams"],
+                                                   max_pages=MAX_PAGES))
+
+@app.route("/api/quota")
+def api_quota():
+    """Quota status as JSON, optionally filtered with ?team= and/or ?room= (repeatable)."""
+    try:
+        snapshot = quota_snapshot()
+    except QuotaUnavailable:
+        return {"error": "The quota service cannot be reached right now"}, 503
+    teams = request.args.getlist("team")
+    rooms = request.args.getlist("room")
+
+    def build():
+        by_team = snapshot["by_team"]
+        if teams:
+            rows = [by_team[t] for t in dict.fromkeys(teams)
+                    if t in by_team and (not rooms or by_team[t]["room"] in rooms)]
+        elif rooms:
+            rows = [r for room in dict.fromkeys(rooms) for r in snapshot["by_room"].get(room, [])]
+        else:
+            rows = snapshot["teams"]
+        return json.dumps({"max_pages": MAX_PAGES, "teams": rows})
+
+    # Only the unfiltered body is cached; filtered views are cheap index lookups
+    key = None if (teams or rooms) else "json"
+    return cached_response(snapshot, key, "application/json", build)
+
+@app.route("/api/teams")
+def api_teams():
+    """Team name typeahead: ?q= prefix/substring query, optional ?room= and ?limit=."""
+    query = request.args.get("q", "")
+    room = request.args.get("room") or None
+    limit = request.args.get("limit", TEAM_SEARCH_LIMIT, type=int)
+    rows, truncated = get_team_index(SEAT_PLAN_CSV).search(query, limit=limit, room=room)
+    return {"query": query, "teams": rows, "truncated": truncated}
+
+@app.route("/api/scheduler")
+def api_scheduler():
+    """Waiting-time statistics for the active policy and all policies replayed on recent jobs."""
+    return print_queue.scheduling_report()
 
 @app.route("/reset-quota/<team>")
 def reset_quota_route(team):
     """Reset quota for a specific team (admin function)."""
+    if QUOTA_AUTHORITY_URL:
+        return {"error": f"Quota is kept by the quota service: use {QUOTA_AUTHORITY_URL}/reset-quota/<team>"}, 409
     reset_team_quota(team, QUOTA_FILE)
     print(f"Reset quota for team: {team}")
     return redirect(url_for('show_quota'))
 
+@app.route("/api/jobs")
+@organiser_only
+def api_jobs():
+    """Finished jobs from the ledger, by ?team= (newest first) and/or ?status= (admin function)."""
+    team = request.args.get("team", "").strip()
+    status = request.args.get("status", "").strip()
+    limit = request.args.get("limit", JOB_HISTORY_LIMIT, type=int)
+    limit = max(1, min(limit, MAX_JOB_HISTORY_LIMIT))
+    if status and status not in STATUSES:
+        return {"error": f"Unknown status. Choose from: {', '.join(STATUSES)}"}, 400
+    if team:
+        jobs = job_ledger.team_history(team)
+        if status:
+            jobs = [job for job in jobs if job["status"] == status]
+        jobs = jobs[:limit]
+    elif status:
+        jobs = job_ledger.with_status(status, limit)
+    else:
+        return {"error": "Pass ?team= and/or ?status="}, 400
+    return {"count": len(jobs), "jobs": jobs}
+
+@app.route("/api/report")
+def api_report():
+    """Contest totals from the job ledger."""
+    return job_ledger.report()
+
+@app.route("/api/analytics")
+def api_analytics():
+    """Usage counters: totals, top teams and the last ?buckets= time buckets, optionally for one ?room=."""
+    room = request.args.get("room") or None
+    window = request.args.get("buckets", ANALYTICS_WINDOW, type=int)
+    top = request.args.get("top", ANALYTICS_TOP_TEAMS, type=int)
+    return usage_analytics.summary(room=room, window=window, top=max(1, min(top, 100)))
+
+@app.route("/analytics")
+def show_analytics():
+    """Usage dashboard: pages per room per time bucket, top teams and printer utilisation."""
+    room = request.args.get("room") or None
+    window = request.args.get("buckets", ANALYTICS_WINDOW, type=int)
+    summary = usage_analytics.summary(room=room, window=window, top=ANALYTICS_TOP_TEAMS)
+    for bucket in summary["series"]:
+        bucket["label"] = datetime.fromtimestamp(bucket["start"]).strftime("%H:%M")
+    return render_template("analytics.html", summary=summary, room=room, rooms=usage_analytics.rooms(),
+                           bucket_minutes=ANALYTICS_BUCKET_MINUTES)
+
+@app.route("/mark-printed/<job_id>", methods=["POST"])
+@organiser_only
+def mark_printed_route(job_id):
+    """Record that organisers printed a failed job by hand (admin function)."""
+    record = job_ledger.get(job_id)
+    if record is None:
+        return {"error": "Unknown job"}, 404
+    if record["status"] != MANUAL:
+        return {"error": f"Job is {record['status']}, not waiting for a manual print"}, 409
+    live = print_queue.status(job_id)
+    if live is not None and live["state"] not in FINISHED_STATES:
+        return {"error": "Job is being retried right now"}, 409
+    # File it like any printed job
+    files = file_completed(record["team"], [os.path.join(UPLOAD_DIR, path) for path in record.get("files") or []])
+    record = job_ledger.update(job_id, status=MANUAL_DONE, files=files, resolved_at=time.time())
+    print(f"Job {job_id} for {record['team']} printed manually")
+    return {"success": True, "job": record}
+
+@app.route("/export")
+@organiser_only
+def export_route():
+    """Stream selected teams' files and a job manifest as a ZIP or tar.gz (admin function).
+
+    Filters: ?team= and ?room= (repeatable), ?since= and ?until= (e.g. 2026-01-24 09:00).
+    """
+    fmt = request.args.get("format", "zip")
+    if fmt not in EXPORT_FORMATS:
+        return {"error": f"format must be one of: {', '.join(EXPORT_FORMATS)}"}, 400
+    try:
+        since, until = parse_time(request.args.get("since")), parse_time(request.args.get("until"))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    team_names, rooms = request.args.getlist("team"), request.args.getlist("room")
+    teams = selected_teams(get_team_index(SEAT_PLAN_CSV).rows, team_names, rooms)
+    entries = select_files(UPLOAD_DIR, teams, since, until)
+    archived = select_archived(upload_archive, teams, since, until)
+    manifest = build_manifest(select_records(job_ledger.records(), teams, since, until))
+    print(f"Exporting {len(entries)} files and {len(archived)} archived files as {fmt}")
+    filename = archive_name(fmt, team_names, rooms)
+    return Response(stream_with_context(stream_archive(fmt, entries, manifest, archived)), mimetype=EXPORT_MIMETYPES[fmt],
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.route("/files/<path:path>")
+@organiser_only
+def fetch_file_route(path):
+    """Download an uploaded file, from the upload folder or the retention archive (admin function)."""
+    disk_path = safe_join(UPLOAD_DIR, path)
+    if disk_path is not None and os.path.isfile(disk_path):
+        return send_file(disk_path, as_attachment=True)
+    entry = upload_archive.get(path)
+    if entry is None:
+        return {"error": "File not found"}, 404
+    return Response(stream_with_context(upload_archive.read_chunks(entry)),
+                    mimetype=mimetypes.guess_type(path)[0] or "application/octet-stream",
+                    headers={"Content-Disposition": f'attachment; filename="{os.path.basename(path)}"',
+                             "Content-Length": str(entry["size"])})
+
+@app.route("/reconcile", methods=["POST"])
+@organiser_only
+def reconcile_route():
+    """Run a reconciliation pass now (admin function)."""
+    if not RECONCILE_FAILED_PRINTS:
+        return {"error": "Reconciler is disabled"}, 409
+    reconciler.wake()
+    return {"success": True, "pending_manual": len(job_ledger.with_status(MANUAL))}
+
 @app.route("/printer-status")
 def printer_status():
     """Check printer status and configuration."""
@@ -245,7 +1032,17 @@ def printer_status():
         "reportlab_available": REPORTLAB_AVAILABLE,
         "default_printer": None,
         "available_printers": [],
-        "sumatra_pdf": False
+        "sumatra_pdf": False,
+        "spool": print_queue.spool_report(),
+        "reconciler": dict(reconciler.stats, enabled=RECONCILE_FAILED_PRINTS),
+        "folder_watcher": dict(folder_watcher.stats, enabled=WATCH_UPLOAD_FOLDER),
+        "retention": dict(retention.stats, enabled=RETENTION_ENABLED, archive=upload_archive.stats),
+        "federation": {"node": NODE_NAME, "rooms": NODE_ROOMS, "quota_authority": QUOTA_AUTHORITY_URL,
+                       **(dict(quota_leases.stats, leases=quota_leases.leases()) if quota_leases else {})},
+        "snapshot": dict(snapshotter.stats, enabled=SNAPSHOT_STATE, startup_ms=round(startup_ms),
+                         resumed_jobs=len(resumed_jobs), ledger_lines_replayed=job_ledger.replayed,
+                         analytics_lines_replayed=usage_analytics.replayed),
+        "pdf_sandbox": dict(pdf_sandbox.stats, enabled=SANDBOX_PDF_PARSING)
     }
     
     if WINDOWS_PRINTING:
@@ -261,8 +1058,9 @@ def health_check():
     return {
         "status": "ok",
         "timestamp": datetime.now().isoformat(),
-        "teams_loaded": len(load_teams(SEAT_PLAN_CSV)),
-        "printer_available": WINDOWS_PRINTING or True  # True for simulation mode
+        "teams_loaded": len(get_team_index(SEAT_PLAN_CSV)),
+        "printer_available": WINDOWS_PRINTING or True,  # True for simulation mode
+        "queue_depth": print_queue.depth()
     }
 
 if __name__ == "__main__":
@@ -270,12 +1068,37 @@ if __name__ == "__main__":
     print("Breaking Code 2.0 - Automated Print Server")
     print("="*60)
     print(f"Upload directory: {UPLOAD_DIR}")
-    print(f"Quota file: {QUOTA_FILE}")
+    if not QUOTA_AUTHORITY_URL:
+        print(f"Quota file: {QUOTA_FILE}")
     print(f"Seat plan: {SEAT_PLAN_CSV}")
     print(f"Max pages per team: {MAX_PAGES}")
     print(f"Max file size: {MAX_FILE_SIZE / (1024*1024):.1f} MB")
     print(f"Print retries: {PRINT_RETRIES}")
     print(f"Print timeout: {PRINT_TIMEOUT}s")
+    print(f"Upload rate: {TEAM_UPLOAD_RATE * 60:.0f}/min per team (burst {TEAM_UPLOAD_BURST}), "
+          f"{GLOBAL_UPLOAD_RATE * 60:.0f}/min overall (burst {GLOBAL_UPLOAD_BURST})")
+    print(f"Queue high-water mark: {QUEUE_HIGH_WATER} jobs")
+    print(f"Scheduling policy: {SCHEDULER_POLICY} (max wait {SCHEDULER_MAX_WAIT}s)")
+    print(f"Default layout: {DEFAULT_NUP} page(s) per side, {'duplex' if DEFAULT_DUPLEX else 'single-sided'}"
+          f"{' (teams may change it)' if ALLOW_JOB_LAYOUT else ''}")
+    if SANDBOX_PDF_PARSING:
+        limits = (f"{PDF_SANDBOX_MEMORY_MB} MB, {PDF_SANDBOX_CPU_SECONDS}s CPU, " if RESOURCE_LIMITS
+                  else "no memory/CPU caps on this platform, ")
+        print(f"PDF sandbox: {PDF_SANDBOX_WORKERS} workers ({limits}{PDF_SANDBOX_TIMEOUT}s timeout)")
+    else:
+        print("PDF sandbox: disabled (PDFs are parsed in the server process)")
+    if NODE_ROOMS:
+        print(f"Print node {NODE_NAME} for rooms: {', '.join(NODE_ROOMS)}")
+    if QUOTA_AUTHORITY_URL:
+        print(f"Quota service: {QUOTA_AUTHORITY_URL} (leases of {QUOTA_LEASE_SHEETS} sheets)")
+    if RETENTION_ENABLED:
+        print(f"Retention: generated copies removed after {REMOVE_ARTEFACTS_AFTER}s, "
+              f"completed files archived to {ARCHIVE_DIR} after {ARCHIVE_AFTER}s")
+    if WATCH_UPLOAD_FOLDER:
+        print(f"Watching {UPLOAD_DIR} for files from other tools ({folder_watcher.backend})")
+    if SNAPSHOT_STATE:
+        print(f"State snapshot: {SNAPSHOT_FILE} every {SNAPSHOT_INTERVAL}s "
+              f"(startup took {startup_ms:.0f} ms, {len(resumed_jobs)} jobs resumed)")
     print()
     
     # Check critical files
@@ -335,7 +1158,19 @@ if __name__ == "__main__":
     print("Access from any device on the network")
     print("\nEndpoints:")
     print("  /          - Upload page")
+    print("  /jobs/<id> - Job status (JSON), /jobs/<id>/events for live updates")
     print("  /quota     - Quota status")
+    print("  /api/quota - Quota status (JSON, ?team= / ?room= filters)")
+    print("  /api/teams - Team search (JSON, ?q= typeahead)")
+    print("  /api/scheduler - Print queue waiting times per scheduling policy")
+    print("  /api/jobs  - Job history (?team=, ?status=manual for prints awaiting organisers; organisers only)")
+    print("  /api/report - Contest print totals")
+    print("  /analytics - Usage dashboard (pages per room over time, top teams, printer use)")
+    print("  /api/analytics - Usage counters (JSON, ?room=, ?buckets=, ?top=)")
+    print("  /mark-printed/<id> - Mark a failed print as printed by hand (POST, organisers only)")
+    print("  /reconcile - Retry failed prints now (POST, organisers only)")
+    print("  /files/<team>/<file> - Download an uploaded file (also from the archive; organisers only)")
+    print("  /export    - Download submissions as ZIP or tar.gz (?format=, ?team=, ?room=, ?since=, ?until=; organisers only)")
     print("  /printer-status - Printer configuration")
     print("  /health    - Health check")
     print("="*60)
@@ -0,0 +1,312 @@
+"""
+Bulk export of submissions as a streamed ZIP or tar.gz archive.
+
+The archive holds the selected teams' folders from uploads/ (including
+their completed/ subfolders and files already moved to the retention
+archive) plus a manifest.csv with the pages and
+outcome of every job from the job ledger. Archives are generated chunk by
+chunk: files are read in fixed-size pieces and each piece is passed on
+as soon as it is compressed, so memory use does not depend on the size
+of the export and nothing is written to disk.
+
+Used by the /export route in automated.py, and from the command line:
+
+    python export_archive.py --format tar.gz --room Lab-1 --since "2026-01-24 09:00" -o lab1.tar.gz
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import tarfile
+import time
+import zipfile
+import zlib
+from datetime import datetime
+
+from retention import UploadArchive
+from utils import load_seat_plan, parse_upload_name
+
+CHUNK_SIZE = 64 * 1024
+FORMATS = ("zip", "tar.gz")
+MIMETYPES = {"zip": "application/zip", "tar.gz": "application/gzip"}
+STORED_EXTENSIONS = ('.pdf', '.png', '.jpg', '.jpeg', '.zip', '.gz')  # Already compressed
+TAR_RECORD_SIZE = tarfile.RECORDSIZE
+MANIFEST_NAME = "manifest.csv"
+MANIFEST_FIELDS = ["job_id", "team", "room", "desk", "filename", "status", "state", "pages",
+                   "source_pages", "page_range", "nup", "duplex", "sides", "sheets", "attempts",
+                   "printer", "created_at", "finished_at", "error", "files"]
+
+
+def parse_time(value):
+    """A time filter as epoch seconds: a number or "YYYY-MM-DD[ HH:MM[:SS]]"; None if empty."""
+    if value is None or str(value).strip() == "":
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError(f"Invalid time '{value}'. Use e.g. 2026-01-24 09:00")
+
+
+def upload_time(path):
+    """When a file was uploaded: the timestamp in its name, else its mtime."""
+    parsed = parse_upload_name(os.path.basename(path))
+    if parsed is not None:
+        try:
+            return datetime.strptime(parsed['timestamp'], "%Y%m%d_%H%M%S").timestamp()
+        except ValueError:
+            pass
+    return os.path.getmtime(path)
+
+
+def select_files(upload_dir, teams=None, since=None, until=None):
+    """Files of the selected teams uploaded in [since, until), as (path, arcname) pairs.
+
+    `teams=None` selects every team folder.
+    """
+    entries = []
+    if not os.path.isdir(upload_dir):
+        return entries
+    for team in sorted(os.listdir(upload_dir)):
+        team_folder = os.path.join(upload_dir, team)
+        if not os.path.isdir(team_folder) or (teams is not None and team not in teams):
+            continue
+        for folder, dirs, names in os.walk(team_folder):
+            dirs.sort()
+            for name in sorted(names):
+                path = os.path.join(folder, name)
+                uploaded = upload_time(path)
+                if (since is not None and uploaded < since) or (until is not None and uploaded >= until):
+                    continue
+                entries.append((path, os.path.relpath(path, upload_dir).replace(os.sep, "/")))
+    return entries
+
+
+def select_archived(archive, teams=None, since=None, until=None):
+    """Archived files (see retention.py) of the selected teams uploaded in [since, until).
+
+    Returns (arcname, size, mtime, chunks) tuples; `chunks()` yields the contents.
+    """
+    selected = []
+    for entry in archive.entries(teams):
+        parsed = parse_upload_name(os.path.basename(entry["path"]))
+        uploaded = entry["mtime"]
+        if parsed is not None:
+            uploaded = datetime.strptime(parsed['timestamp'], "%Y%m%d_%H%M%S").timestamp()
+        if (since is not None and uploaded < since) or (until is not None and uploaded >= until):
+            continue
+        selected.append((entry["path"], entry["size"], entry["mtime"],
+                         lambda entry=entry: archive.read_chunks(entry)))
+    return selected
+
+
+def select_records(records, teams=None, since=None, until=None):
+    """Ledger records of the selected teams created in [since, until)."""
+    return [record for record in records
+            if (teams is None or record["team"] in teams)
+            and (since is None or record.get("created_at", 0) >= since)
+            and (until is None or record.get("created_at", 0) < until)]
+
+
+def build_manifest(records):
+    """CSV of pages and outcome per job."""
+    out = io.StringIO()
+    writer = csv.DictWriter(out, MANIFEST_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for record in records:
+        row = dict(record)
+        for key in ("created_at", "finished_at"):
+            if row.get(key):
+                row[key] = datetime.fromtimestamp(row[key]).isoformat(timespec="seconds")
+        row["files"] = ";".join(row.get("files") or [])
+        writer.writerow(row)
+    return out.getvalue().encode("utf-8")
+
+
+def _read_chunks(path):
+    """File contents in CHUNK_SIZE pieces."""
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            yield chunk
+
+
+def _exactly(chunks, size):
+    """Cut or zero-pad `chunks` to `size` bytes (the tar header already has the size)."""
+    remaining = size
+    for chunk in chunks:
+        if remaining <= 0:
+            break
+        chunk = chunk[:remaining]
+        remaining -= len(chunk)
+        yield chunk
+    if remaining > 0:
+        yield b"\0" * remaining
+
+
+def _sources(entries, archived):
+    """(arcname, size, mtime, chunks) for files on disk, then archived files."""
+    for path, arcname in entries:
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            print(f"Export: skipping {path}: {e}")
+            continue
+        yield arcname, st.st_size, st.st_mtime, lambda path=path: _read_chunks(path)
+    yield from archived
+
+
+class _Sink:
+    """Write-only stream that collects output until it is drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(entries, manifest, archived=()):
+    """Yield a ZIP archive of `entries` (path, arcname) and `archived` files with the manifest first."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(MANIFEST_NAME, manifest)
+        yield sink.drain()
+        for arcname, size, mtime, chunks in _sources(entries, archived):
+            info = zipfile.ZipInfo(arcname, time.localtime(mtime)[:6])
+            info.file_size = size
+            info.external_attr = 0o644 << 16
+            info.compress_type = (zipfile.ZIP_STORED if arcname.lower().endswith(STORED_EXTENSIONS)
+                                  else zipfile.ZIP_DEFLATED)
+            with archive.open(info, 'w') as dest:
+                for chunk in chunks():
+                    dest.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
+
+
+def stream_tar_gz(entries, manifest, archived=()):
+    """Yield a gzip-compressed tar archive of `entries` (path, arcname) and `archived` files with the manifest first."""
+    gzip = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip header and trailer
+    written = 0
+
+    def member(name, size, mtime, chunks):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = mtime
+        info.mode = 0o644
+        yield info.tobuf(format=tarfile.PAX_FORMAT, encoding="utf-8", errors="surrogateescape")
+        yield from chunks
+        yield b"\0" * (-size % tarfile.BLOCKSIZE)
+
+    def compress(pieces):
+        nonlocal written
+        for piece in pieces:
+            written += len(piece)
+            data = gzip.compress(piece)
+            if data:
+                yield data
+
+    yield from compress(member(MANIFEST_NAME, len(manifest), time.time(), [manifest]))
+    for arcname, size, mtime, chunks in _sources(entries, archived):
+        yield from compress(member(arcname, size, mtime, _exactly(chunks(), size)))
+    end = 2 * tarfile.BLOCKSIZE
+    end += -(written + end) % TAR_RECORD_SIZE
+    yield from compress([b"\0" * end])
+    yield gzip.flush()
+
+
+def stream_archive(fmt, entries, manifest, archived=()):
+    """Archive chunks in the given format ("zip" or "tar.gz")."""
+    if fmt == "zip":
+        return stream_zip(entries, manifest, archived)
+    if fmt == "tar.gz":
+        return stream_tar_gz(entries, manifest, archived)
+    raise ValueError(f"Unknown archive format '{fmt}'. Use one of: {', '.join(FORMATS)}")
+
+
+def archive_name(fmt, teams=None, rooms=None):
+    """Download filename, e.g. submissions_Lab-1_20260124_1800.zip."""
+    parts = ["submissions"] + list(rooms or []) + (list(teams) if teams and len(teams) <= 3 else [])
+    safe = "_".join("".join(c if c.isalnum() or c in "-." else "-" for c in part) for part in parts)
+    return f"{safe}_{datetime.now().strftime('%Y%m%d_%H%M')}.{fmt}"
+
+
+def read_ledger(ledger_file):
+    """Latest record per job from a ledger file, oldest first (read-only)."""
+    records = {}
+    if os.path.exists(ledger_file):
+        with open(ledger_file, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                records.pop(record["job_id"], None)
+                records[record["job_id"]] = record
+    return sorted(records.values(), key=lambda record: record.get("created_at", 0))
+
+
+def selected_teams(seat_plan_rows, teams=None, rooms=None):
+    """Team names matching the team and room filters, or None for all teams."""
+    if not teams and not rooms:
+        return None
+    selected = set(teams or [])
+    if rooms:
+        selected.update(row['team'] for row in seat_plan_rows if row['room'] in rooms)
+    return selected
+
+
+def main(argv=None):
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Export submitted files and a job manifest as an archive.")
+    parser.add_argument("--format", choices=FORMATS, default="zip")
+    parser.add_argument("--team", action="append", help="Team to include (repeatable)")
+    parser.add_argument("--room", action="append", help="Room to include (repeatable)")
+    parser.add_argument("--since", help="Only files uploaded at or after this time")
+    parser.add_argument("--until", help="Only files uploaded before this time")
+    parser.add_argument("--upload-dir", default=os.path.join(script_dir, "uploads"))
+    parser.add_argument("--ledger", default=os.path.join(script_dir, "jobs.jsonl"))
+    parser.add_argument("--seat-plan", default=os.path.join(script_dir, "seat-plan.csv"))
+    parser.add_argument("--archive-dir", default=os.path.join(script_dir, "archive"),
+                        help="Retention archive to include files from")
+    parser.add_argument("-o", "--output", help="Archive file to write (default: standard output)")
+    args = parser.parse_args(argv)
+
+    try:
+        since, until = parse_time(args.since), parse_time(args.until)
+    except ValueError as e:
+        parser.error(str(e))
+    teams = selected_teams(load_seat_plan(args.seat_plan), args.team, args.room)
+    entries = select_files(args.upload_dir, teams, since, until)
+    archived = select_archived(UploadArchive(args.archive_dir, readonly=True), teams, since, until)
+    records = select_records(read_ledger(args.ledger), teams, since, until)
+
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in stream_archive(args.format, entries, build_manifest(records), archived):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+    print(f"Exported {len(entries) + len(archived)} files and {len(records)} jobs", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+N-up imposition and sheet accounting for print jobs.
+
+Several logical pages are scaled onto one physical side (2-up side by side
+on a landscape sheet, 4-up in a 2x2 grid), and duplex jobs print on both
+sides of each sheet. Quota is charged per physical sheet.
+"""
+
+import math
+
+from PyPDF2 import PdfReader, PdfWriter, PageObject, Transformation
+from PyPDF2.generic import RectangleObject
+
+ALLOWED_NUP = (1, 2, 4)
+SHEET_MARGIN = 18  # Points kept clear around each cell
+
+
+def sides_for(pages, nup):
+    """Printed sides needed for `pages` logical pages at `nup` per side."""
+    return math.ceil(pages / nup)
+
+
+def sheets_for(sides, duplex):
+    """Physical sheets needed for `sides` printed sides."""
+    return math.ceil(sides / 2) if duplex else sides
+
+
+def _grid(nup, width, height):
+    """Sheet size and cell layout (columns, rows) for an n-up sheet.
+
+    2-up turns the sheet to landscape so two portrait pages sit side by
+    side; 4-up keeps the source orientation.
+    """
+    if nup == 2:
+        return (height, width), (2, 1) if height >= width else (1, 2)
+    return (width, height), (2, 2)
+
+
+def impose_pdf(pdf_path, output_pdf, nup):
+    """Lay out `nup` pages per side of `pdf_path` into `output_pdf`.
+
+    The sheet size follows the first page. Returns the number of sides written.
+    """
+    if nup not in ALLOWED_NUP:
+        raise ValueError(f"Unsupported layout: {nup} pages per sheet")
+
+    reader = PdfReader(pdf_path)
+    writer = PdfWriter()
+    pages = list(reader.pages)
+    if not pages:
+        raise ValueError("PDF has no pages")
+
+    first = pages[0]
+    if first.rotation:
+        first.transfer_rotation_to_content()
+    (sheet_w, sheet_h), (cols, rows) = _grid(nup, float(first.mediabox.width), float(first.mediabox.height))
+    cell_w = (sheet_w - SHEET_MARGIN * (cols + 1)) / cols
+    cell_h = (sheet_h - SHEET_MARGIN * (rows + 1)) / rows
+
+    sheet = None
+    for i, page in enumerate(pages):
+        slot = i % nup
+        if slot == 0:
+            sheet = PageObject.create_blank_page(width=sheet_w, height=sheet_h)
+        if page.rotation:
+            page.transfer_rotation_to_content()
+        box = page.mediabox
+        width, height = float(box.width), float(box.height)
+        scale = min(cell_w / width, cell_h / height)
+
+        # Reading order: left to right, top to bottom; centre within the cell
+        col, row = slot % cols, slot // cols
+        x = SHEET_MARGIN + col * (cell_w + SHEET_MARGIN) + (cell_w - width * scale) / 2
+        y = sheet_h - (row + 1) * (cell_h + SHEET_MARGIN) + (cell_h - height * scale) / 2
+        page.add_transformation(Transformation()
+                                .translate(-float(box.left), -float(box.bottom))
+                                .scale(scale, scale)
+                                .translate(x, y))
+        # merge_page() clips to the merged page's box, so move the box with the content
+        cell = RectangleObject([x, y, x + width * scale, y + height * scale])
+        page.mediabox = cell
+        page.cropbox = cell
+        sheet.merge_page(page)
+        if slot == nup - 1 or i == len(pages) - 1:
+            writer.add_page(sheet)
+
+    with open(output_pdf, 'wb') as f:
+        writer.write(f)
+    return len(writer.pages)
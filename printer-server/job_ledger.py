@@ -0,0 +1,186 @@
+"""
+Append-only ledger of finished print jobs.
+
+Every finished job is written as one JSON line to the ledger file; a later
+line for the same job (e.g. an organiser marking a manual print as done)
+supersedes the earlier one. The file is replayed on start-up into
+in-memory indexes by team, status and file, so job history, the list of
+prints waiting for organisers and contest totals are dictionary lookups
+instead of directory walks. Each record keeps the upload's SHA-256.
+
+The indexes can be exported with state() and passed back in on the next
+start, in which case only the lines written after that point are replayed.
+`on_append(record, offset)` is called for every line written while running
+(e.g. to update analytics counters).
+"""
+
+import copy
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from utils import truncate_torn_tail
+
+# Ledger statuses
+PRINTED = "printed"        # Printed and charged
+REJECTED = "rejected"      # Failed before reaching the printer (quota, invalid file, ...)
+MANUAL = "manual"          # Printer failed; file kept for organisers to print by hand
+MANUAL_DONE = "manual_done"  # Printed by hand by organisers
+
+STATUSES = (PRINTED, REJECTED, MANUAL, MANUAL_DONE)
+
+INDEXES = ("_records", "_by_team", "_by_status", "_by_file")
+
+
+class JobLedger:
+    """JSON-lines job ledger with team and status indexes."""
+
+    def __init__(self, path, fsync=True, state=None, on_append=None):
+        self.path = path
+        self.fsync = fsync
+        self.on_append = on_append
+        self._lock = threading.Lock()
+        self._records = {}                                     # job_id -> latest record
+        self._by_team = {}                                     # team -> OrderedDict of job_ids
+        self._by_status = {status: OrderedDict() for status in STATUSES}
+        self._by_file = {}                                     # file (relative path) -> job_id
+        self._offset = 0                                       # Bytes of the file indexed so far
+        if truncate_torn_tail(path):
+            print(f"WARNING: Dropped a partly written last line from {path}")
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if state is not None and state["offset"] <= size:
+            self.__dict__.update({key: state[key] for key in INDEXES})
+            self._offset = state["offset"]
+        self.replayed = self._load()
+
+    def _load(self):
+        """Index the lines after the current offset; returns how many were read."""
+        if not os.path.exists(self.path):
+            return 0
+        count = 0
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            for line in f:
+                self._offset += len(line)
+                count += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    print(f"WARNING: Skipping unreadable ledger line at byte {self._offset - len(line)} in {self.path}")
+                    continue
+                self._index(record)
+        return count
+
+    @property
+    def offset(self):
+        """Bytes of the ledger file indexed so far."""
+        with self._lock:
+            return self._offset
+
+    def state(self):
+        """The indexes and file position, for a snapshot (copies)."""
+        with self._lock:
+            state = {key: copy.deepcopy(getattr(self, key)) for key in INDEXES}
+            state["offset"] = self._offset
+            return state
+
+    def _index(self, record):
+        # Caller holds the lock (or is still in __init__)
+        job_id = record["job_id"]
+        previous = self._records.get(job_id)
+        if previous is not None:
+            self._by_status[previous["status"]].pop(job_id, None)
+            for path in previous.get("files") or ():
+                self._by_file.pop(path, None)
+        self._records[job_id] = record
+        for path in record.get("files") or ():
+            self._by_file[path] = job_id
+        self._by_team.setdefault(record["team"], OrderedDict())[job_id] = None
+        self._by_status.setdefault(record["status"], OrderedDict())[job_id] = None
+
+    def _append(self, record):
+        # Caller holds the lock
+        line = (json.dumps(record, separators=(',', ':')) + "\n").encode('utf-8')
+        with open(self.path, 'ab') as f:
+            f.write(line)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        self._offset += len(line)
+        self._index(record)
+        if self.on_append is not None:
+            try:
+                self.on_append(record, self._offset)
+            except Exception as e:
+                print(f"WARNING: Ledger listener failed for job {record['job_id']}: {e}")
+
+    def record(self, record):
+        """Append a job record; it must carry job_id, team and status."""
+        record = dict(record, recorded_at=time.time())
+        with self._lock:
+            self._append(record)
+        return record
+
+    def update(self, job_id, **fields):
+        """Append a new version of a job's record with `fields` changed; None if unknown."""
+        with self._lock:
+            current = self._records.get(job_id)
+            if current is None:
+                return None
+            record = dict(current, **fields, recorded_at=time.time())
+            self._append(record)
+            return record
+
+    def get(self, job_id):
+        with self._lock:
+            record = self._records.get(job_id)
+            return dict(record) if record is not None else None
+
+    def owner(self, path):
+        """Job ID whose record lists `path` (relative to the upload folder), or None."""
+        with self._lock:
+            return self._by_file.get(path)
+
+    def records(self):
+        """Every job's latest record, in the order jobs were first recorded."""
+        with self._lock:
+            return [dict(record) for record in self._records.values()]
+
+    def team_history(self, team, limit=None):
+        """A team's jobs, newest first."""
+        with self._lock:
+            job_ids = list(self._by_team.get(team, ()))
+            job_ids.reverse()
+            return [dict(self._records[job_id]) for job_id in job_ids[:limit]]
+
+    def with_status(self, status, limit=None):
+        """Jobs currently in `status`, oldest first."""
+        with self._lock:
+            job_ids = list(self._by_status.get(status, ()))[:limit]
+            return [dict(self._records[job_id]) for job_id in job_ids]
+
+    def report(self):
+        """Contest totals: jobs per status, and pages and sheets printed per room."""
+        with self._lock:
+            records = list(self._records.values())
+            by_status = {status: len(ids) for status, ids in self._by_status.items()}
+        rooms = {}
+        for record in records:
+            if record["status"] not in (PRINTED, MANUAL_DONE):
+                continue
+            room = rooms.setdefault(record.get("room", ""), {"jobs": 0, "pages": 0, "sheets": 0, "teams": set()})
+            room["jobs"] += 1
+            room["pages"] += record.get("pages") or 0
+            room["sheets"] += record.get("sheets") or 0
+            room["teams"].add(record["team"])
+        for room in rooms.values():
+            room["teams"] = len(room["teams"])
+        return {
+            "jobs": len(records),
+            "by_status": by_status,
+            "pages_printed": sum(r["pages"] for r in rooms.values()),
+            "sheets_printed": sum(r["sheets"] for r in rooms.values()),
+            "by_room": rooms,
+        }
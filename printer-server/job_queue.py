@@ -0,0 +1,520 @@
+"""
+In-memory print job queue for the automated print server.
+
+Uploads are accepted immediately and handed to a single worker thread. The
+worker prepares jobs in arrival order (conversion, validation, page count,
+quota check); prepared jobs then wait for the printer, and a pluggable
+scheduler (see scheduler.py) decides which one prints next. At most
+`prepare_ahead` prepared jobs wait at a time: beyond that the worker prints
+before preparing more, so a steady stream of uploads cannot keep prepared
+jobs from the printer. Status reads
+(JSON polling and Server-Sent Events) only touch the in-memory job table.
+
+Every submitted job is appended to a journal, and `snapshot()` captures the
+unfinished jobs with the journal position, so `recover()` can put jobs
+that were still waiting or in progress back in the queue after a restart.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from scheduler import Scheduler, simulate, wait_stats, SCHEDULERS
+from utils import truncate_torn_tail
+
+
+# Job states, in the order a job normally moves through them
+QUEUED = "queued"
+CONVERTING = "converting"
+PRINTING = "printing"
+DONE = "done"
+FAILED = "failed"
+
+FINISHED_STATES = (DONE, FAILED)
+
+DEFAULT_SECONDS_PER_PAGE = 3.0  # Per printed side, used until the printer has finished a job
+DEFAULT_PAGES_PER_JOB = 3       # Guess for queued jobs whose sides are not counted yet
+THROUGHPUT_SAMPLES = 20         # Recent jobs used for the throughput estimate
+HISTORY_SIZE = 500              # Recent printed jobs kept for scheduling statistics
+MAX_FINISHED_JOBS = 1000        # Finished jobs kept for status lookups
+DEFAULT_PREPARE_AHEAD = 10      # Prepared jobs waiting for the printer before preparing pauses
+
+
+class JobFailed(Exception):
+    """Raised by the job processor to fail a job with a user-facing message."""
+
+    def __init__(self, message, quota_info=None):
+        super().__init__(message)
+        self.quota_info = quota_info
+
+
+class PrintJob:
+    """A single upload moving through the print pipeline."""
+
+    def __init__(self, team, team_info, filename, file_path, is_text_file, nup=1, duplex=False,
+                 page_range=None, owns_file=True):
+        self.id = uuid.uuid4().hex[:12]
+        self.team = team
+        self.team_info = team_info
+        self.filename = filename
+        self.file_path = file_path
+        self.is_text_file = is_text_file
+        self.nup = nup            # Logical pages per printed side
+        self.duplex = duplex
+        self.page_range = page_range  # Pages to print, e.g. "1-3, 7"; None prints all
+        self.owns_file = owns_file    # False for files saved by other tools: never deleted, even if rejected
+        self.pdf_path = None
+        self.spool = {}  # Spool file sizes and timings
+        self.sha256 = None   # Digest of the uploaded file
+        self.printer = None
+        self.files = []      # Where the job's files ended up (relative to the upload folder)
+        self.quota_charged = False
+        self.attempts = 1    # Print attempts, counting automatic retries
+        self.state = QUEUED
+        self.pages = None
+        self.source_pages = None  # Pages in the uploaded document
+        self.sides = None   # Printed sides after imposition
+        self.sheets = None  # Physical sheets, the unit charged against quota
+        self.error = None
+        self.quota_info = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def room(self):
+        return self.team_info.get("room", "")
+
+    def to_record(self):
+        """All fields, for the journal and snapshots."""
+        return dict(vars(self), spool=dict(self.spool), files=list(self.files))
+
+    @classmethod
+    def from_record(cls, record):
+        job = cls.__new__(cls)
+        job.__dict__.update(dict({"owns_file": True}, **record))
+        return job
+
+    def to_dict(self):
+        """Public view of the job (no server paths)."""
+        return {
+            "job_id": self.id,
+            "team": self.team,
+            "room": self.room,
+            "desk": self.team_info.get("desk", ""),
+            "filename": self.filename,
+            "state": self.state,
+            "pages": self.pages,
+            "source_pages": self.source_pages,
+            "page_range": self.page_range,
+            "nup": self.nup,
+            "duplex": self.duplex,
+            "sides": self.sides,
+            "sheets": self.sheets,
+            "error": self.error,
+            "quota_info": self.quota_info,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "spool": dict(self.spool),
+            "printer": self.printer,
+            "attempts": self.attempts,
+        }
+
+
+class JobJournal:
+    """Append-only JSON-lines file of submitted jobs."""
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        if truncate_torn_tail(path):
+            print(f"WARNING: Dropped a partly written last line from {path}")
+        self.offset = os.path.getsize(path) if os.path.exists(path) else 0
+
+    def append(self, *jobs):
+        """Write jobs with a single sync."""
+        data = b"".join((json.dumps(job.to_record(), separators=(',', ':')) + "\n").encode('utf-8')
+                        for job in jobs)
+        with open(self.path, 'ab') as f:
+            f.write(data)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        self.offset += len(data)
+
+    def find(self, file_path):
+        """The latest job record for an uploaded file, or None (reads the whole journal)."""
+        found = None
+        for record in self.read_from(0):
+            if record.get("file_path") == file_path:
+                found = record
+        return found
+
+    def read_from(self, offset):
+        """Job records written at or after byte `offset`."""
+        if not os.path.exists(self.path):
+            return []
+        if os.path.getsize(self.path) < offset:
+            offset = 0  # Journal replaced since the snapshot: read it all
+        records = []
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    print(f"WARNING: Skipping unreadable line in {self.path}")
+        return records
+
+
+class PrintQueue:
+    """Two-stage print queue served by one background worker thread.
+
+    `prepare_job(job)` runs first, in arrival order, and must set
+    `job.pages`, `job.sides` and `job.sheets`; `print_job(job)` runs when
+    the scheduler picks the job. Jobs are prepared while fewer than
+    `prepare_ahead` prepared jobs are waiting, so the scheduler has a choice
+    without the printer waiting behind an upload rush. Either may raise JobFailed.
+    `on_finished(job)`, if given, is called on the worker thread once a job
+    is done or has failed. With a `journal`, every submitted job is
+    appended to it.
+    """
+
+    def __init__(self, prepare_job, print_job, scheduler=None, on_finished=None, journal=None,
+                 prepare_ahead=DEFAULT_PREPARE_AHEAD):
+        self._prepare_job = prepare_job
+        self.prepare_ahead = max(1, prepare_ahead)
+        self._print_job = print_job
+        self._on_finished = on_finished
+        self.journal = journal
+        self.scheduler = scheduler or Scheduler()
+        self._cond = threading.Condition()
+        self._pending = deque()  # Waiting to be prepared
+        self._ready = []         # Prepared, waiting for the printer
+        self._active = None
+        self._finishing = None   # Finished, on_finished() not done yet
+        self._jobs = OrderedDict()
+        self._version = 0
+        self._samples = deque(maxlen=THROUGHPUT_SAMPLES)  # (pages, seconds)
+        self._history = deque(maxlen=HISTORY_SIZE)
+        self._worker = None
+
+    # --- Worker ---
+
+    def start(self):
+        """Start the worker thread (idempotent)."""
+        with self._cond:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="print-worker", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._ready:
+                    self._cond.wait()
+                if self._pending and len(self._ready) < self.prepare_ahead:
+                    # Prepare what has arrived before choosing what to print,
+                    # so the scheduler sees real page counts
+                    job = self._pending.popleft()
+                    stage = self._prepare_job
+                else:
+                    job = self.scheduler.pick(self._ready, time.time())
+                    self._ready.remove(job)
+                    self.scheduler.dispatched(job)
+                    job.started_at = time.time()
+                    stage = self._print_job
+                self._active = job
+                self._bump()
+
+            outcome = self._run_stage(stage, job)
+
+            with self._cond:
+                self._active = None
+                finished = not (outcome is None and stage is self._prepare_job)
+                if not finished:
+                    job.state = QUEUED
+                    self._ready.append(job)
+                else:
+                    outcome = outcome or {"state": DONE}
+                    for key, value in outcome.items():
+                        setattr(job, key, value)
+                    job.finished_at = time.time()
+                    if job.started_at is not None:
+                        self._record(job)
+                    self._trim()
+                    self._finishing = job
+                self._bump()
+
+            if finished and self._on_finished is not None:
+                try:
+                    self._on_finished(job)
+                except Exception as e:
+                    print(f"Error recording job {job.id}: {e}")
+            if finished:
+                with self._cond:
+                    self._finishing = None
+
+    def _run_stage(self, stage, job):
+        """Run one pipeline stage; None on success, else the failure fields."""
+        try:
+            stage(job)
+            return None
+        except JobFailed as e:
+            return {"state": FAILED, "error": str(e), "quota_info": e.quota_info}
+        except Exception as e:
+            print(f"Error processing job {job.id}: {e}")
+            import traceback
+            traceback.print_exc()
+            return {"state": FAILED,
+                    "error": f"Server error: {str(e)}. Please try again or contact organizers."}
+
+    def _record(self, job):
+        # Caller holds the lock
+        if job.state == DONE and job.sides:
+            self._samples.append((job.sides, job.finished_at - job.started_at))
+        self._history.append({
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "pages": job.sides or 0,
+            "team": job.team,
+            "room": job.room,
+            "spool": dict(job.spool),
+        })
+
+    # --- Producers / job updates ---
+
+    def submit(self, job):
+        """Add a job to the end of the queue and return it."""
+        self.submit_many([job])
+        return job
+
+    def submit_many(self, jobs):
+        """Add several jobs in order, with one journal write and one wake-up."""
+        if not jobs:
+            return jobs
+        with self._cond:
+            if self.journal is not None:
+                self.journal.append(*jobs)
+            for job in jobs:
+                self._jobs[job.id] = job
+                self._pending.append(job)
+            self._bump()
+        return jobs
+
+    def update(self, job, **fields):
+        """Update job fields and wake status listeners."""
+        with self._cond:
+            for key, value in fields.items():
+                setattr(job, key, value)
+            self._bump()
+
+    def _bump(self):
+        # Caller holds the lock
+        self._version += 1
+        self._cond.notify_all()
+
+    def _trim(self):
+        # Drop the oldest finished jobs once the table grows too large
+        finished = [job_id for job_id, job in self._jobs.items() if job.state in FINISHED_STATES]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def reserved_sheets(self, team):
+        """Sheets of a team's prepared jobs that have not been charged yet."""
+        with self._cond:
+            jobs = self._ready + ([self._active] if self._active is not None else [])
+            return sum(j.sheets or 0 for j in jobs
+                       if j.team == team and j.state != CONVERTING and not j.quota_charged)
+
+    def unfinished_jobs(self):
+        """Jobs waiting or in progress."""
+        with self._cond:
+            return list(self._pending) + self._ready + ([self._active] if self._active is not None else [])
+
+    # --- Restart ---
+
+    def snapshot(self):
+        """Unfinished jobs, journal position and learned state, taken atomically."""
+        with self._cond:
+            jobs = list(self._pending) + self._ready
+            jobs += [job for job in (self._active, self._finishing) if job is not None]
+            return {
+                "jobs": [job.to_record() for job in jobs],
+                "journal_offset": self.journal.offset if self.journal is not None else 0,
+                "samples": list(self._samples),
+                "history": list(self._history),
+                "scheduler": {"policy": self.scheduler.name, "state": self.scheduler.state()},
+            }
+
+    def recover(self, snapshot=None, is_finished=None):
+        """Re-queue the jobs that were unfinished when the server stopped.
+
+        Starts from `snapshot` (see snapshot()) and replays the journal
+        written after it; without one the whole journal is replayed.
+        `is_finished(job)` filters out jobs that completed after all. Jobs
+        that were converting or printing start over, so a job cut off
+        mid-print is printed again rather than lost. Returns the jobs
+        re-queued.
+        """
+        records = OrderedDict()
+        offset = 0
+        if snapshot:
+            offset = snapshot["journal_offset"]
+            for record in snapshot["jobs"]:
+                records[record["id"]] = record
+        if self.journal is not None:
+            for record in self.journal.read_from(offset):
+                records[record["id"]] = record
+
+        resumed = []
+        for record in records.values():
+            job = PrintJob.from_record(record)
+            if is_finished is not None and is_finished(job):
+                continue
+            if not os.path.exists(job.file_path):
+                print(f"Cannot resume job {job.id}: {job.file_path} is gone")
+                continue
+            job.state = QUEUED
+            job.started_at = job.finished_at = None
+            job.error = None
+            if not job.quota_charged:
+                # Prepare again from the upload
+                job.pdf_path = job.pages = job.sides = job.sheets = None
+                job.spool = {}
+            resumed.append(job)
+
+        with self._cond:
+            if snapshot:
+                self._samples.extend(snapshot["samples"])
+                self._history.extend(snapshot["history"])
+                if snapshot["scheduler"]["policy"] == self.scheduler.name:
+                    self.scheduler.restore(snapshot["scheduler"]["state"])
+            for job in resumed:
+                self._jobs[job.id] = job
+                self._pending.append(job)
+            self._bump()
+        return resumed
+
+    # --- Status ---
+
+    def seconds_per_page(self):
+        """Recent printer throughput as seconds per printed side."""
+        with self._cond:
+            return self._seconds_per_page()
+
+    def _seconds_per_page(self):
+        pages = sum(p for p, _ in self._samples)
+        seconds = sum(s for _, s in self._samples)
+        if pages <= 0:
+            return DEFAULT_SECONDS_PER_PAGE
+        return seconds / pages
+
+    def _pages_per_job(self):
+        if not self._samples:
+            return DEFAULT_PAGES_PER_JOB
+        return sum(p for p, _ in self._samples) / len(self._samples)
+
+    def _job_seconds(self, job, now):
+        """Estimated seconds of printer time left for one job."""
+        pages = job.sides if job.sides else self._pages_per_job()
+        estimate = pages * self._seconds_per_page()
+        if job.started_at is not None:
+            estimate -= now - job.started_at
+        return max(0.0, estimate)
+
+    def _ahead(self, job, now):
+        """Jobs expected to print before `job`, under the current policy."""
+        active = self._active
+        printing = [active] if active is not None and active.state == PRINTING else []
+        if job is active and job.state == PRINTING:
+            return []
+        if job in self._ready:
+            return printing + self.scheduler.ahead(self._ready, job, now)
+        # Not prepared yet: everything already prepared, plus earlier arrivals
+        earlier = list(self._pending)[:self._pending.index(job)] if job in self._pending else []
+        return printing + self._ready + earlier
+
+    def _status(self, job):
+        data = job.to_dict()
+        if job.state in FINISHED_STATES:
+            data["queue_position"] = 0
+            data["estimated_wait"] = 0
+            return data
+
+        now = time.time()
+        ahead = self._ahead(job, now)
+        data["queue_position"] = len(ahead)
+        data["estimated_wait"] = round(sum(self._job_seconds(j, now) for j in ahead)
+                                       + self._job_seconds(job, now), 1)
+        return data
+
+    def status(self, job_id):
+        """Snapshot of a job with queue position and estimated wait, or None."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return self._status(job)
+
+    def version(self):
+        """Counter bumped on every queue change."""
+        with self._cond:
+            return self._version
+
+    def wait_for_update(self, version, timeout=None):
+        """Block until the queue changes after `version`; return the new version."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._version != version, timeout=timeout)
+            return self._version
+
+    def estimated_drain(self):
+        """Estimated seconds until every waiting and in-progress job has printed."""
+        with self._cond:
+            now = time.time()
+            jobs = list(self._pending) + self._ready
+            if self._active is not None:
+                jobs.append(self._active)
+            return sum(self._job_seconds(j, now) for j in jobs)
+
+    def depth(self):
+        """Number of jobs waiting or in progress."""
+        with self._cond:
+            return len(self._pending) + len(self._ready) + (1 if self._active is not None else 0)
+
+    def spool_report(self):
+        """Spool size reduction and spooling speed over recently printed jobs."""
+        with self._cond:
+            spools = [r["spool"] for r in self._history if "spool_seconds" in r["spool"]]
+        original = sum(s.get("original_bytes", 0) for s in spools)
+        optimized = sum(s.get("optimized_bytes", 0) for s in spools)
+        spool_seconds = sum(s["spool_seconds"] for s in spools)
+        return {
+            "jobs": len(spools),
+            "original_bytes": original,
+            "optimized_bytes": optimized,
+            "saved_percent": round(100 * (original - optimized) / original, 1) if original else 0,
+            "optimize_seconds": round(sum(s.get("seconds", 0) for s in spools), 3),
+            "spool_seconds": round(spool_seconds, 3),
+            "spool_mb_per_second": round(optimized / 1e6 / spool_seconds, 2) if spool_seconds else None,
+        }
+
+    def scheduling_report(self):
+        """Waiting times under the current policy, and every policy replayed on the same jobs."""
+        with self._cond:
+            history = list(self._history)
+            seconds_per_page = self._seconds_per_page()
+        waits = [r["started_at"] - r["created_at"] for r in history]
+        return {
+            "policy": self.scheduler.name,
+            "seconds_per_page": round(seconds_per_page, 2),
+            "observed": wait_stats(waits),
+            "simulated": {
+                name: simulate(name, history, seconds_per_page, max_wait=self.scheduler.max_wait)
+                for name in SCHEDULERS
+            },
+        }
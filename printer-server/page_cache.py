@@ -0,0 +1,83 @@
+"""
+Response caching helpers: pre-rendered, pre-compressed pages and
+fingerprinted static assets.
+"""
+
+import gzip
+import hashlib
+
+from flask import Response, request
+from werkzeug.security import safe_join
+
+STATIC_MAX_AGE = 365 * 24 * 3600  # Fingerprinted assets never change under the same URL
+GZIP_ETAG_SUFFIX = "-gz"  # Marks the ETag of the gzip-encoded variant of a cached page
+
+_fingerprints = {}  # static file path -> content hash
+
+
+class CachedPage:
+    """A rendered body kept both plain and gzip-compressed."""
+
+    def __init__(self, body, etag):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.body = body
+        self.gzipped = gzip.compress(body, compresslevel=9)
+        self.etag = etag
+
+
+def etag_for(*parts):
+    """Short, stable ETag built from the given parts."""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def serve_cached(page, mimetype):
+    """Response for a cached page, gzip-encoded when the client accepts it.
+
+    Answers 304 Not Modified when the client's ETag still matches. The
+    two encodings are different bytes, so each has its own strong ETag.
+    """
+    use_gzip = 'gzip' in request.accept_encodings
+    response = Response(page.gzipped if use_gzip else page.body, mimetype=mimetype)
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(page.etag + GZIP_ETAG_SUFFIX if use_gzip else page.etag)
+    return response.make_conditional(request)
+
+
+def static_fingerprint(static_folder, filename):
+    """Content hash of a static file, computed once per process."""
+    path = safe_join(static_folder, filename)
+    if path is None:
+        return None
+    fingerprint = _fingerprints.get(path)
+    if fingerprint is None:
+        try:
+            with open(path, 'rb') as f:
+                fingerprint = hashlib.sha1(f.read()).hexdigest()[:10]
+        except OSError:
+            return None
+        _fingerprints[path] = fingerprint
+    return fingerprint
+
+
+def init_static_fingerprints(app):
+    """Add ?v=<hash> to static URLs and serve those URLs as immutable."""
+
+    @app.url_defaults
+    def add_static_fingerprint(endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            fingerprint = static_fingerprint(app.static_folder, values['filename'])
+            if fingerprint:
+                values['v'] = fingerprint
+
+    @app.after_request
+    def static_cache_headers(response):
+        if request.endpoint == 'static' and response.status_code == 200:
+            version = request.args.get('v')
+            filename = (request.view_args or {}).get('filename', '')
+            if version and version == static_fingerprint(app.static_folder, filename):
+                response.headers['Cache-Control'] = f'public, max-age={STATIC_MAX_AGE}, immutable'
+        return response
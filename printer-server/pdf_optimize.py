@@ -0,0 +1,286 @@
+"""
+PDF size reduction before spooling.
+
+The optimiser rewrites a PDF through a fresh PdfWriter, which drops objects
+no page references, and additionally:
+    - shares identical fonts and XObjects (images, forms) between pages
+    - Flate-compresses page content streams
+    - downsamples images whose resolution exceeds a DPI cap (needs Pillow)
+
+The result is only used when it is actually smaller than the input.
+"""
+
+import io
+import os
+import time
+import zlib
+import hashlib
+
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.filters import ASCII85Decode, ASCIIHexDecode
+from PyPDF2.generic import (
+    ArrayObject, DecodedStreamObject, DictionaryObject, IndirectObject, NameObject,
+    NumberObject, StreamObject
+)
+
+try:
+    from PIL import Image
+    PILLOW_AVAILABLE = True
+except ImportError:
+    PILLOW_AVAILABLE = False
+
+DEFAULT_MAX_IMAGE_DPI = 150
+DEFAULT_JPEG_QUALITY = 80
+MAX_DIGEST_DEPTH = 12  # Object nesting followed when comparing resources
+
+
+def _digest(obj, hasher, depth=0):
+    """Feed a canonical serialisation of a PDF object into `hasher`."""
+    if depth > MAX_DIGEST_DEPTH:
+        hasher.update(b"<deep>")
+        return
+    if isinstance(obj, IndirectObject):
+        obj = obj.get_object()
+    if isinstance(obj, StreamObject):
+        hasher.update(b"stream")
+        hasher.update(obj._data)
+    if isinstance(obj, DictionaryObject):
+        hasher.update(b"<<")
+        for key in sorted(obj.keys()):
+            if key in ("/Length", "/Parent"):
+                continue
+            hasher.update(key.encode("utf-8", "replace"))
+            _digest(obj[key], hasher, depth + 1)
+        hasher.update(b">>")
+    elif isinstance(obj, ArrayObject):
+        hasher.update(b"[")
+        for item in obj:
+            _digest(item, hasher, depth + 1)
+        hasher.update(b"]")
+    elif not isinstance(obj, StreamObject):
+        hasher.update(repr(obj).encode("utf-8", "replace"))
+
+
+def _resource_dicts(page, category):
+    """The page's /Font or /XObject resource dictionary, if any."""
+    resources = page.get("/Resources")
+    if resources is None:
+        return None
+    resources = resources.get_object()
+    entries = resources.get(category)
+    return entries.get_object() if entries is not None else None
+
+
+def _dedupe_resources(pages):
+    """Point identical fonts and XObjects on all pages at one shared object.
+
+    Returns the number of references that were redirected.
+    """
+    canonical = {}
+    redirected = 0
+    for page in pages:
+        for category in ("/Font", "/XObject"):
+            entries = _resource_dicts(page, category)
+            if not entries:
+                continue
+            for name, ref in list(entries.items()):
+                if not isinstance(ref, IndirectObject):
+                    continue
+                hasher = hashlib.sha1(category.encode("utf-8"))
+                _digest(ref, hasher)
+                key = hasher.digest()
+                first = canonical.setdefault(key, ref)
+                if first.idnum != ref.idnum or first.generation != ref.generation:
+                    entries[NameObject(name)] = first
+                    redirected += 1
+    return redirected
+
+
+ASCII_FILTERS = {"/ASCII85Decode": ASCII85Decode, "/ASCIIHexDecode": ASCIIHexDecode}
+
+
+def _filters(stream):
+    """The stream's filter chain as a list of names."""
+    filters = stream.get("/Filter")
+    if filters is None:
+        return []
+    if isinstance(filters, IndirectObject):
+        filters = filters.get_object()
+    if isinstance(filters, ArrayObject):
+        return [str(f) for f in filters]
+    return [str(filters)]
+
+
+def _strip_ascii_filters(stream):
+    """Remove leading ASCII85/ASCIIHex layers (they inflate binary data by 25-100%).
+
+    Returns bytes saved.
+    """
+    filters = _filters(stream)
+    if not filters or filters[0] not in ASCII_FILTERS or "/DecodeParms" in stream:
+        return 0
+    data = stream._data
+    while filters and filters[0] in ASCII_FILTERS:
+        data = ASCII_FILTERS[filters.pop(0)].decode(data)
+        if isinstance(data, str):
+            data = data.encode("latin-1")
+    saved = len(stream._data) - len(data)
+    stream._data = data
+    if filters:
+        stream[NameObject("/Filter")] = (NameObject(filters[0]) if len(filters) == 1
+                                         else ArrayObject(NameObject(f) for f in filters))
+    else:
+        del stream["/Filter"]
+    return saved
+
+
+def _image_mode(image):
+    colorspace = image.get("/ColorSpace")
+    if isinstance(colorspace, IndirectObject):
+        colorspace = colorspace.get_object()
+    if colorspace == "/DeviceRGB":
+        return "RGB"
+    if colorspace == "/DeviceGray":
+        return "L"
+    return None
+
+
+def _downsample_image(image, page_width_in, page_height_in, max_dpi, jpeg_quality):
+    """Resample one image XObject in place if it exceeds `max_dpi`.
+
+    The page size is used as the largest size the image can be shown at,
+    which gives a lower bound on its real resolution, so images are never
+    reduced below the cap as printed. Returns bytes saved.
+    """
+    if image.get("/Subtype") != "/Image" or image.get("/BitsPerComponent") != 8:
+        return 0
+    if "/SMask" in image or "/Mask" in image or "/ImageMask" in image or "/Decode" in image:
+        return 0
+    mode = _image_mode(image)
+    filters = _filters(image)
+    codec = filters[-1] if filters else None
+    if mode is None or codec not in ("/DCTDecode", "/FlateDecode") \
+            or any(f not in ASCII_FILTERS for f in filters[:-1]):
+        return 0
+
+    width, height = int(image["/Width"]), int(image["/Height"])
+    scale = max(max_dpi * page_width_in / width, max_dpi * page_height_in / height)
+    if scale >= 1:
+        return 0
+    new_size = (max(1, int(width * scale)), max(1, int(height * scale)))
+
+    # get_data() undoes the ASCII and Flate layers; DCT data comes back as JPEG
+    if codec == "/DCTDecode":
+        picture = Image.open(io.BytesIO(image.get_data()))
+        if picture.mode != mode:
+            return 0
+    else:
+        picture = Image.frombytes(mode, (width, height), image.get_data())
+    picture = picture.resize(new_size, Image.LANCZOS)
+
+    if codec == "/DCTDecode":
+        out = io.BytesIO()
+        picture.save(out, format="JPEG", quality=jpeg_quality, optimize=True)
+        data = out.getvalue()
+    else:
+        data = zlib.compress(picture.tobytes(), 9)
+
+    saved = len(image._data) - len(data)
+    if saved <= 0:
+        return 0
+    image._data = data
+    image[NameObject("/Filter")] = NameObject(codec)
+    image[NameObject("/Width")] = NumberObject(new_size[0])
+    image[NameObject("/Height")] = NumberObject(new_size[1])
+    if "/DecodeParms" in image:
+        del image["/DecodeParms"]
+    return saved
+
+
+def _optimize_images(pages, max_dpi, jpeg_quality):
+    """Strip ASCII layers from images and downsample oversized ones.
+
+    Downsampling is skipped without Pillow or when `max_dpi` is falsy.
+    Returns the number of images downsampled.
+    """
+    done = set()
+    changed = 0
+    for page in pages:
+        entries = _resource_dicts(page, "/XObject")
+        if not entries:
+            continue
+        box = page.mediabox
+        page_width_in = float(box.width) / 72
+        page_height_in = float(box.height) / 72
+        for ref in entries.values():
+            if not isinstance(ref, IndirectObject) or ref.idnum in done:
+                continue
+            done.add(ref.idnum)
+            image = ref.get_object()
+            if image.get("/Subtype") != "/Image":
+                continue
+            try:
+                if PILLOW_AVAILABLE and max_dpi and _downsample_image(
+                        image, page_width_in, page_height_in, max_dpi, jpeg_quality):
+                    changed += 1
+                else:
+                    _strip_ascii_filters(image)
+            except Exception as e:
+                print(f"Skipping image optimisation: {e}")
+    return changed
+
+
+def _compress_contents(writer):
+    """Flate-compress page content streams that are stored unfiltered.
+
+    (PageObject.compress_content_streams() corrupts writer pages in
+    PyPDF2 3.0, so the stream is replaced here directly.)
+    """
+    for page in writer.pages:
+        contents = page.get("/Contents")
+        if contents is None:
+            continue
+        parts = contents.get_object()
+        parts = parts if isinstance(parts, ArrayObject) else [parts]
+        if all(_filters(part.get_object()) for part in parts):
+            continue
+        stream = DecodedStreamObject()
+        stream.set_data(page.get_contents().get_data())
+        page[NameObject("/Contents")] = writer._add_object(stream.flate_encode())
+
+
+def optimize_pdf(pdf_path, output_pdf, max_image_dpi=DEFAULT_MAX_IMAGE_DPI,
+                 jpeg_quality=DEFAULT_JPEG_QUALITY):
+    """Write a smaller copy of `pdf_path` to `output_pdf`.
+
+    Returns a stats dict: original_bytes, optimized_bytes, seconds,
+    shared_resources, images_downsampled and `used` (False when the result
+    was not smaller, in which case `output_pdf` is not left behind).
+    """
+    started = time.perf_counter()
+    original_bytes = os.path.getsize(pdf_path)
+
+    reader = PdfReader(pdf_path)
+    pages = list(reader.pages)
+    shared = _dedupe_resources(pages)
+    images = _optimize_images(pages, max_image_dpi, jpeg_quality)
+
+    writer = PdfWriter()
+    for page in pages:
+        writer.add_page(page)
+    _compress_contents(writer)
+    with open(output_pdf, "wb") as f:
+        writer.write(f)
+
+    optimized_bytes = os.path.getsize(output_pdf)
+    used = optimized_bytes < original_bytes
+    if not used:
+        os.remove(output_pdf)
+    return {
+        "original_bytes": original_bytes,
+        "optimized_bytes": optimized_bytes if used else original_bytes,
+        "seconds": round(time.perf_counter() - started, 3),
+        "shared_resources": shared,
+        "images_downsampled": images,
+        "used": used,
+    }
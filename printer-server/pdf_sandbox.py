@@ -0,0 +1,250 @@
+"""
+Sandboxed PDF inspection and processing.
+
+Uploaded PDFs are opened in separate worker processes, not in the server:
+the first read (page count, decoded contents) and every later step that
+parses the upload again (page subsetting, header stamping, n-up imposition,
+optimisation, which decodes images) run there.
+A crafted or broken file (deep object trees, huge xref tables,
+decompression bombs) can then only hurt a disposable worker:
+    - every request has a wall-clock timeout, after which the worker is killed
+    - on POSIX, workers cap their address space and the CPU time per request
+      (the resource module is not available on Windows, so only the
+      timeout applies there)
+    - the first read gets a short, fixed time limit; processing steps get
+      that limit plus an allowance per page, since stamping or imposing a
+      long valid document legitimately takes longer than reading it
+    - workers are recycled after a fixed number of requests
+
+Protocol: one JSON line per request on the worker's stdin and one JSON line
+per reply on its stdout:
+    {"task": "inspect", "args": ["/path/file.pdf"], "kwargs": {}, "cpu_seconds": 10}
+    {"result": {"pages": 12, "content_bytes": 48213}}   or   {"error": "invalid", "detail": "..."}
+"""
+
+import atexit
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+
+try:
+    import resource
+    RESOURCE_LIMITS = True
+except ImportError:
+    RESOURCE_LIMITS = False
+
+DEFAULT_WORKERS = 2
+DEFAULT_TIMEOUT = 10         # Wall-clock seconds per PDF
+DEFAULT_MEMORY_MB = 512      # Address-space cap per worker
+DEFAULT_CPU_SECONDS = 10     # CPU time per PDF
+DEFAULT_SECONDS_PER_PAGE = 0.25  # Extra wall-clock and CPU seconds per page for processing steps
+MAX_TASKS_PER_WORKER = 100   # Restart workers after this many PDFs
+DETAIL_LENGTH = 200          # Characters of the parser error passed back
+
+
+class PdfRejected(ValueError):
+    """The PDF could not be inspected; the message is user-facing."""
+
+
+# --- Worker process ---
+
+def _limit_memory(memory_mb):
+    limit = memory_mb * 1024 * 1024
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def _limit_cpu(cpu_seconds):
+    """Allow `cpu_seconds` more CPU time; the kernel kills the worker past that."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = int(usage.ru_utime + usage.ru_stime + cpu_seconds) + 1
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _inspect(path):
+    """Parse the PDF fully: page tree, and every page's decoded content."""
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(path)
+    content_bytes = 0
+    for page in reader.pages:
+        contents = page.get("/Contents")
+        if contents is None:
+            continue
+        contents = contents.get_object()
+        parts = contents if isinstance(contents, list) else [contents]
+        for part in parts:
+            content_bytes += len(part.get_object().get_data())
+    return {"pages": len(reader.pages), "content_bytes": content_bytes}
+
+
+def _tasks():
+    """Functions a worker runs, by name (imported in the worker only)."""
+    from pdf_utils import subset_pdf, stamp_pdf_header
+    from imposition import impose_pdf
+    from pdf_optimize import optimize_pdf
+    return {"inspect": _inspect, "subset_pdf": subset_pdf, "stamp_pdf_header": stamp_pdf_header,
+            "impose_pdf": impose_pdf, "optimize_pdf": optimize_pdf}
+
+
+def _serve(memory_mb, cpu_seconds):
+    """Worker loop: answer inspection requests until stdin closes."""
+    replies = sys.stdout
+    sys.stdout = sys.stderr  # Keep stray prints off the protocol channel
+    tasks = _tasks()
+    if RESOURCE_LIMITS:
+        _limit_memory(memory_mb)
+
+    for line in sys.stdin:
+        try:
+            request = json.loads(line)
+            if RESOURCE_LIMITS:
+                _limit_cpu(request.get("cpu_seconds", cpu_seconds))
+            reply = {"result": tasks[request["task"]](*request["args"], **request["kwargs"])}
+        except MemoryError:
+            reply = {"error": "memory"}
+        except Exception as e:
+            reply = {"error": "invalid", "detail": str(e)[:DETAIL_LENGTH]}
+        replies.write(json.dumps(reply) + "\n")
+        replies.flush()
+
+
+# --- Server side ---
+
+class _Worker:
+    """One sandbox process plus a thread collecting its replies."""
+
+    def __init__(self, memory_mb, cpu_seconds):
+        self.proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), str(memory_mb), str(cpu_seconds)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            text=True, encoding="utf-8", bufsize=1
+        )
+        self.replies = queue.Queue()
+        self.tasks = 0
+        threading.Thread(target=self._read, name="pdf-sandbox-reader", daemon=True).start()
+
+    def _read(self):
+        for line in self.proc.stdout:
+            self.replies.put(line)
+        self.replies.put(None)  # Worker exited
+
+    def request(self, task, args, kwargs, timeout, cpu_seconds):
+        """Send one task; the decoded reply, None if the worker died, or raise queue.Empty."""
+        self.tasks += 1
+        self.proc.stdin.write(json.dumps({"task": task, "args": args, "kwargs": kwargs,
+                                          "cpu_seconds": cpu_seconds}) + "\n")
+        self.proc.stdin.flush()
+        line = self.replies.get(timeout=timeout)
+        return json.loads(line) if line is not None else None
+
+    def close(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+
+
+class SandboxPool:
+    """Bounded pool of sandbox workers, started on first use."""
+
+    def __init__(self, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT,
+                 memory_mb=DEFAULT_MEMORY_MB, cpu_seconds=DEFAULT_CPU_SECONDS,
+                 seconds_per_page=DEFAULT_SECONDS_PER_PAGE):
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.cpu_seconds = cpu_seconds
+        self.seconds_per_page = seconds_per_page
+        self._slots = threading.BoundedSemaphore(workers)
+        self._idle = []
+        self._lock = threading.Lock()
+        self.stats = {"inspected": 0, "processed": 0, "rejected": 0, "timeouts": 0, "killed": 0}
+        atexit.register(self.close)
+
+    def _checkout(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return _Worker(self.memory_mb, self.cpu_seconds)
+
+    def _checkin(self, worker):
+        if worker.tasks >= MAX_TASKS_PER_WORKER:
+            worker.close()
+            return
+        with self._lock:
+            self._idle.append(worker)
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def inspect(self, path):
+        """Page count and decoded content size of a PDF, read in a sandbox.
+
+        Returns {"pages": n, "content_bytes": m}; raises PdfRejected.
+        """
+        result = self._request("inspect", [os.path.abspath(path)], {}, self.timeout, self.cpu_seconds, "read")
+        self._count("inspected")
+        return result
+
+    def run(self, func, *args, pages=0, **kwargs):
+        """Call a PDF processing step (subset_pdf, stamp_pdf_header, impose_pdf
+        or optimize_pdf) in a sandbox worker; returns its result.
+
+        `pages` is the page count of the input, which scales the time and CPU
+        limits. Paths must be absolute and arguments JSON-serialisable.
+        Raises PdfRejected.
+        """
+        allowance = pages * self.seconds_per_page
+        result = self._request(func.__name__, list(args), kwargs, self.timeout + allowance,
+                               self.cpu_seconds + allowance, "process")
+        self._count("processed")
+        return result
+
+    def _request(self, task, args, kwargs, timeout, cpu_seconds, action):
+        # `action` ("read" or "process") words the rejection messages
+        with self._slots:
+            worker = self._checkout()
+            try:
+                reply = worker.request(task, args, kwargs, timeout, cpu_seconds)
+            except queue.Empty:
+                worker.close()
+                self._count("timeouts")
+                raise PdfRejected(f"PDF took too long to {action} (over {timeout:g}s). "
+                                  f"Please export it again or print fewer pages.")
+            except Exception:
+                worker.close()
+                raise
+
+            if reply is None:
+                # Killed by the CPU limit (or crashed)
+                worker.close()
+                self._count("killed")
+                raise PdfRejected(f"PDF is too complex to {action}. Please export it again or print fewer pages.")
+            self._checkin(worker)
+
+        if "error" in reply:
+            self._count("rejected")
+            if reply["error"] == "memory":
+                raise PdfRejected(f"PDF needs too much memory to {action}. Please export it again or print fewer pages.")
+            print(f"PDF rejected by sandbox ({task}): {reply.get('detail', '')}")
+            raise PdfRejected("Invalid or corrupted PDF file")
+        return reply["result"]
+
+    def close(self):
+        """Stop all idle workers."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.close()
+
+
+if __name__ == "__main__":
+    _serve(int(sys.argv[1]), float(sys.argv[2]))
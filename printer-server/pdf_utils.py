@@ -2,11 +2,17 @@
 PDF processing utilities for the print server.
 """
 
+import io
 import os
-from PyPDF2 import PdfReader
-from reportlab.lib.pagesizes import letter
+import codecs
+from collections import OrderedDict
+from xml.sax.saxutils import escape
+from PyPDF2 import PdfReader, PdfWriter
+from reportlab.lib.pagesizes import letter, landscape
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Preformatted
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Paragraph
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER
 
@@ -34,87 +40,315 @@ def validate_pdf(file_path):
         return False
 
 
-def text_to_pdf_with_header(text_path, output_pdf, team_info):
-    """Convert text/code file to PDF with team header."""
+MAX_PAGE_RANGE_PARTS = 50  # Comma-separated parts accepted in a page selection
+
+
+def parse_page_ranges(spec):
+    """Parse a page selection such as "1-3, 7, 10-" into (first, last) pairs.
+
+    Pages are 1-based; `last` is None for an open range ("10-" means page 10
+    to the end). An empty selection returns None (print everything).
+    Raises ValueError for malformed input.
+    """
+    spec = (spec or "").replace(" ", "")
+    if not spec:
+        return None
+    parts = spec.split(",")
+    if len(parts) > MAX_PAGE_RANGE_PARTS:
+        raise ValueError(f"Too many page ranges (at most {MAX_PAGE_RANGE_PARTS})")
+    ranges = []
+    for part in parts:
+        first, dash, last = part.partition("-")
+        if not first.isdigit() or (last and not last.isdigit()):
+            raise ValueError(f"Invalid page range: '{part}'. Use e.g. 1-3, 7, 10-")
+        first = int(first)
+        last = (int(last) if last else None) if dash else first
+        if first < 1 or (last is not None and last < first):
+            raise ValueError(f"Invalid page range: '{part}'")
+        ranges.append((first, last))
+    return ranges
+
+
+def select_pages(ranges, total):
+    """Zero-based indices of the selected pages, in document order without repeats."""
+    selected = set()
+    for first, last in ranges:
+        last = total if last is None else last
+        if first > total or last > total:
+            raise ValueError(f"Page range {first}-{last} is outside the document ({total} pages)")
+        selected.update(range(first - 1, last))
+    return sorted(selected)
+
+
+def subset_pdf(pdf_path, output_pdf, indices):
+    """Copy only the pages at `indices` into `output_pdf`.
+
+    Pages are copied as-is (content streams and resources are shared, not
+    re-rendered); objects used only by dropped pages are left out.
+    """
+    reader = PdfReader(pdf_path)
+    writer = PdfWriter()
+    for index in indices:
+        writer.add_page(reader.pages[index])
+    with open(output_pdf, 'wb') as f:
+        writer.write(f)
+    return len(indices)
+
+
+# Header strip stamped onto uploaded PDFs
+STAMP_FONT = 'Helvetica-Bold'
+STAMP_FONT_SIZE = 8
+STAMP_TOP_OFFSET = 24      # Baseline distance from the top edge (clear of printer margins)
+OVERLAY_CACHE_SIZE = 256   # Cached (team, page box) overlays
+
+_overlay_cache = OrderedDict()  # (team, room, desk, box) -> overlay page
+
+
+def header_line(team_info):
+    """One-line team header used on stamped PDFs."""
+    parts = ["Breaking Code 2.0"]
+    if team_info['room']:
+        parts.append(f"Room: {team_info['room']}")
+    if team_info['desk']:
+        parts.append(f"Desk: {team_info['desk']}")
+    parts.append(f"Team: {team_info['team']}")
+    return " | ".join(parts)
+
+
+def _render_overlay(team_info, box):
+    """Draw the header strip for a page box (left, bottom, right, top) into a one-page PDF."""
+    left, bottom, right, top = box
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=(right, top))
+    text = header_line(team_info)
+    text_width = stringWidth(text, STAMP_FONT, STAMP_FONT_SIZE)
+    x = left + ((right - left) - text_width) / 2
+    y = top - STAMP_TOP_OFFSET
+    pdf.setFillColor('white')
+    pdf.setStrokeColor('black')
+    pdf.rect(x - 6, y - 4, text_width + 12, STAMP_FONT_SIZE + 7, stroke=1, fill=1)
+    pdf.setFillColor('black')
+    pdf.setFont(STAMP_FONT, STAMP_FONT_SIZE)
+    pdf.drawString(x, y, text)
+    pdf.save()
+    buffer.seek(0)
+    return PdfReader(buffer).pages[0]
+
+
+def get_header_overlay(team_info, box):
+    """Cached header overlay page for a team and page box."""
+    key = (team_info['team'], team_info['room'], team_info['desk'], box)
+    overlay = _overlay_cache.get(key)
+    if overlay is None:
+        overlay = _render_overlay(team_info, box)
+        _overlay_cache[key] = overlay
+        if len(_overlay_cache) > OVERLAY_CACHE_SIZE:
+            _overlay_cache.popitem(last=False)
+    else:
+        _overlay_cache.move_to_end(key)
+    return overlay
+
+
+def stamp_pdf_header(pdf_path, output_pdf, team_info):
+    """Stamp the team header onto every page of a PDF.
+
+    Rotated pages are normalised first so the header lands on the visual
+    top edge. Returns the number of pages written.
+    """
+    reader = PdfReader(pdf_path)
+    writer = PdfWriter()
+    for page in reader.pages:
+        if page.rotation:
+            page.transfer_rotation_to_content()
+        box = tuple(round(float(v), 2) for v in page.mediabox)
+        page.merge_page(get_header_overlay(team_info, box))
+        writer.add_page(page)
+    with open(output_pdf, 'wb') as f:
+        writer.write(f)
+    return len(reader.pages)
+
+
+class PageLimitExceeded(ValueError):
+    """Raised when a text file would render to more pages than allowed."""
+
+    def __init__(self, max_pages):
+        super().__init__(f"File has more than {max_pages} pages")
+        self.max_pages = max_pages
+
+
+# Text rendering layout (matches the former SimpleDocTemplate/Preformatted output)
+TEXT_PAGE_SIZE = letter
+TEXT_MARGIN = inch + 6         # Page margin plus frame padding
+TEXT_INDENT = 20               # Code indent on both sides
+TEXT_FONT = 'Courier'
+TEXT_FONT_SIZE = 8
+TEXT_LEADING = 8.8
+TEXT_DENSE_FONT_SIZE = 7       # Two-column layout
+TEXT_DENSE_LEADING = 7.7
+TEXT_COLUMN_GAP = 18
+TEXT_TAB_SIZE = 4
+ENCODING_SAMPLE_SIZE = 64 * 1024  # Bytes inspected to pick the text encoding
+
+
+def detect_encoding(sample):
+    """Guess the encoding of a text file from its first bytes.
+
+    UTF-8 (with or without BOM) when the sample decodes cleanly, otherwise
+    cp1252, which covers Windows editors' output and reads any Latin-1 text.
+    """
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
     try:
-        # Read the text file with multiple encoding fallbacks
-        content = None
-        encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-        for encoding in encodings:
+        # Not final: the sample may end in the middle of a multi-byte character
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'cp1252'
+
+
+def iter_text_lines(text_path):
+    """Yield decoded lines of a text file, reading it once in binary.
+
+    The encoding is detected from the first bytes; if a later line is not
+    valid UTF-8 after all, decoding switches to cp1252 from that line on.
+    """
+    with open(text_path, 'rb', buffering=ENCODING_SAMPLE_SIZE) as f:
+        encoding = detect_encoding(f.peek(ENCODING_SAMPLE_SIZE)[:ENCODING_SAMPLE_SIZE])
+        decoder = codecs.getincrementaldecoder(encoding)()
+        for raw in f:
             try:
-                with open(text_path, 'r', encoding=encoding) as f:
-                    content = f.read()
-                break
+                line = decoder.decode(raw)
             except UnicodeDecodeError:
-                continue
-        
-        if content is None:
-            # Last resort: read as binary and ignore errors
-            with open(text_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-        
-        # Limit content size to prevent memory issues
-        max_chars = 100000  # ~100KB of text
-        if len(content) > max_chars:
-            content = content[:max_chars] + "\n\n[Content truncated - file too large]\n"
-        
-        # Create PDF
-        doc = SimpleDocTemplate(output_pdf, pagesize=letter)
-        story = []
-        styles = getSampleStyleSheet()
+                encoding = 'cp1252'
+                decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+                line = decoder.decode(raw)
+            yield line.rstrip('\r\n')
+
+
+def _wrap_line(line, width):
+    """Split one source line into printable segments of at most `width` chars."""
+    line = line.expandtabs(TEXT_TAB_SIZE)
+    if not line:
+        return ['']
+    return [line[i:i + width] for i in range(0, len(line), width)]
+
+
+def _header_flowables(text_path, team_info):
+    """Team header and file name paragraphs drawn at the top of the first page."""
+    styles = getSampleStyleSheet()
+    
+    # Header style
+    header_style = ParagraphStyle(
+        'CustomHeader',
+        parent=styles['Heading1'],
+        fontSize=12,
+        textColor='black',
+        spaceAfter=6,
+        alignment=TA_CENTER,
+        borderWidth=2,
+        borderColor='black',
+        borderPadding=10,
+        backColor='lightgrey'
+    )
+    
+    # Create header text
+    header_text = f"<b>Breaking Code 2.0</b><br/>"
+    if team_info['room']:
+        header_text += f"Room: {escape(team_info['room'])} | "
+    if team_info['desk']:
+        header_text += f"Desk: {escape(team_info['desk'])} | "
+    header_text += f"Team: {escape(team_info['team'])}"
+    
+    # File name
+    filename_style = ParagraphStyle(
+        'Filename',
+        parent=styles['Normal'],
+        fontSize=10,
+        textColor='darkblue'
+    )
+    filename = escape(os.path.basename(text_path))
+    
+    return [
+        (Paragraph(header_text, header_style), header_style.spaceAfter + 0.2*inch),
+        (Paragraph(f"<b>File:</b> {filename}", filename_style), 0.15*inch),
+    ]
+
+
+def text_to_pdf_with_header(text_path, output_pdf, team_info, max_pages=None, columns=1):
+    """Convert text/code file to PDF with team header.
+
+    The file is streamed line by line straight onto the page canvas, so
+    memory stays bounded by the page count. With `max_pages`, rendering
+    stops as soon as the output would need more pages and
+    PageLimitExceeded is raised without writing the PDF.
+
+    `columns=2` gives a dense listing: two columns of smaller type on a
+    landscape page.
+    
+    Returns the number of pages written.
+    """
+    try:
+        if columns == 2:
+            page_size = landscape(TEXT_PAGE_SIZE)
+            font_size, leading = TEXT_DENSE_FONT_SIZE, TEXT_DENSE_LEADING
+        else:
+            columns = 1
+            page_size = TEXT_PAGE_SIZE
+            font_size, leading = TEXT_FONT_SIZE, TEXT_LEADING
+        width, height = page_size
+        top = height - TEXT_MARGIN
+        bottom = TEXT_MARGIN
+        left = TEXT_MARGIN
+        frame_width = width - 2 * TEXT_MARGIN
+        column_width = (frame_width - TEXT_COLUMN_GAP * (columns - 1)) / columns
+        text_width = column_width - 2 * TEXT_INDENT
+        chars_per_line = max(1, int(text_width // stringWidth('M', TEXT_FONT, font_size)))
         
-        # Header style
-        header_style = ParagraphStyle(
-            'CustomHeader',
-            parent=styles['Heading1'],
-            fontSize=12,
-            textColor='black',
-            spaceAfter=6,
-            alignment=TA_CENTER,
-            borderWidth=2,
-            borderColor='black',
-            borderPadding=10,
-            backColor='lightgrey'
-        )
+        pdf = canvas.Canvas(output_pdf, pagesize=page_size)
+        pages = 1
         
-        # Create header text
-        header_text = f"<b>Breaking Code 2.0</b><br/>"
-        if team_info['room']:
-            header_text += f"Room: {team_info['room']} | "
-        if team_info['desk']:
-            header_text += f"Desk: {team_info['desk']} | "
-        header_text += f"Team: {team_info['team']}"
+        # Header block on the first page
+        y = top
+        for flowable, space_after in _header_flowables(text_path, team_info):
+            _, h = flowable.wrapOn(pdf, frame_width, top - bottom)
+            flowable.drawOn(pdf, left, y - h)
+            y -= h + space_after
         
-        story.append(Paragraph(header_text, header_style))
-        story.append(Spacer(1, 0.2*inch))
+        column_top = y - font_size
+        column = 0
         
-        # File name
-        filename_style = ParagraphStyle(
-            'Filename',
-            parent=styles['Normal'],
-            fontSize=10,
-            textColor='darkblue'
-        )
-        story.append(Paragraph(f"<b>File:</b> {os.path.basename(text_path)}", filename_style))
-        story.append(Spacer(1, 0.15*inch))
+        def begin_column():
+            x = left + column * (column_width + TEXT_COLUMN_GAP) + TEXT_INDENT
+            text = pdf.beginText(x, column_top)
+            text.setFont(TEXT_FONT, font_size, leading)
+            return text
         
-        # Content style (code formatting)
-        code_style = ParagraphStyle(
-            'Code',
-            parent=styles['Code'],
-            fontSize=8,
-            fontName='Courier',
-            leftIndent=20,
-            rightIndent=20
-        )
+        text = begin_column()
+        y = column_top
         
-        # Add content as preformatted text
-        story.append(Preformatted(content, code_style))
+        for line in iter_text_lines(text_path):
+            for segment in _wrap_line(line, chars_per_line):
+                if y < bottom:
+                    pdf.drawText(text)
+                    column += 1
+                    if column == columns:
+                        if max_pages is not None and pages >= max_pages:
+                            raise PageLimitExceeded(max_pages)
+                        pdf.showPage()
+                        pages += 1
+                        column = 0
+                        column_top = top - font_size
+                    text = begin_column()
+                    y = column_top
+                text.textLine(segment)
+                y -= leading
         
-        # Build PDF
-        doc.build(story)
-        return True
+        pdf.drawText(text)
+        pdf.save()
+        return pages
         
+    except PageLimitExceeded:
+        raise
     except Exception as e:
         print(f"Error converting text to PDF: {e}")
         raise Exception(f"Failed to convert text file: {str(e)}")
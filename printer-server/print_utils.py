@@ -19,6 +19,21 @@ else:
     WINDOWS_PRINTING = False
 
 
+# Windows printer status bits that mean jobs will not come out
+PRINTER_NOT_READY = (
+    0x00000002 |  # PRINTER_STATUS_ERROR
+    0x00000008 |  # PRINTER_STATUS_PAPER_JAM
+    0x00000010 |  # PRINTER_STATUS_PAPER_OUT
+    0x00000040 |  # PRINTER_STATUS_PAPER_PROBLEM
+    0x00000080 |  # PRINTER_STATUS_OFFLINE
+    0x00001000 |  # PRINTER_STATUS_NOT_AVAILABLE
+    0x00040000 |  # PRINTER_STATUS_NO_TONER
+    0x00100000 |  # PRINTER_STATUS_USER_INTERVENTION
+    0x00400000    # PRINTER_STATUS_DOOR_OPEN
+)
+PRINTER_ATTRIBUTE_WORK_OFFLINE = 0x00000400
+
+
 def get_default_printer():
     """Get default printer name."""
     if WINDOWS_PRINTING:
@@ -30,6 +45,25 @@ def get_default_printer():
     return "Simulated Printer"
 
 
+def printer_ready(printer_name=None):
+    """True when the printer is reachable and reports no error state."""
+    if not WINDOWS_PRINTING:
+        return True
+    try:
+        printer_name = printer_name or get_default_printer()
+        if not printer_name:
+            return False
+        handle = win32print.OpenPrinter(printer_name)
+        try:
+            info = win32print.GetPrinter(handle, 2)
+        finally:
+            win32print.ClosePrinter(handle)
+        return not (info["Status"] & PRINTER_NOT_READY or info["Attributes"] & PRINTER_ATTRIBUTE_WORK_OFFLINE)
+    except Exception as e:
+        print(f"Error checking printer status: {e}")
+        return False
+
+
 def list_available_printers():
     """List all available printers."""
     if not WINDOWS_PRINTING:
@@ -45,8 +79,14 @@ def list_available_printers():
         return []
 
 
-def print_pdf_windows(pdf_path, printer_name=None, retry_count=0, print_retries=3, print_timeout=60):
-    """Print PDF using Windows printing with retry logic."""
+def print_pdf_windows(pdf_path, printer_name=None, retry_count=0, print_retries=3, print_timeout=60, duplex=False):
+    """Print PDF using Windows printing with retry logic.
+    
+    Duplex is requested through SumatraPDF; the fallback methods print with
+    the printer's own default, so a duplex job fails rather than falling
+    back (it was charged for double-sided sheets). Returns
+    {"method": ..., "duplex": bool}.
+    """
     if not printer_name:
         printer_name = get_default_printer()
     
@@ -79,11 +119,14 @@ def print_pdf_windows(pdf_path, printer_name=None, retry_count=0, print_retries=
         for sumatra_path in sumatra_paths:
             if os.path.exists(sumatra_path):
                 try:
-                    cmd = [sumatra_path, "-print-to", printer_name, "-silent", pdf_path]
+                    cmd = [sumatra_path, "-print-to", printer_name, "-silent"]
+                    if duplex:
+                        cmd += ["-print-settings", "duplex"]
+                    cmd.append(pdf_path)
                     result = subprocess.run(cmd, check=True, timeout=print_timeout, 
                                           capture_output=True, text=True)
                     print(f"Printed via SumatraPDF: {pdf_path} -> {printer_name}")
-                    return True
+                    return {"method": "sumatra", "duplex": duplex}
                 except subprocess.TimeoutExpired:
                     last_error = "Print job timed out"
                     print(f"SumatraPDF timeout, trying alternative method...")
@@ -92,6 +135,9 @@ def print_pdf_windows(pdf_path, printer_name=None, retry_count=0, print_retries=
                     print(f"SumatraPDF failed: {e}, trying alternative method...")
                 break
         
+        if duplex:
+            raise Exception(f"Duplex printing needs SumatraPDF ({last_error or 'not installed'})")
+        
         # Method 2: Direct printer API (more reliable than ShellExecute)
         try:
             import time
@@ -108,7 +154,7 @@ def print_pdf_windows(pdf_path, printer_name=None, retry_count=0, print_retries=
                     win32print.EndPagePrinter(hprinter)
                     win32print.EndDocPrinter(hprinter)
                     print(f"Printed via Win32 API: {pdf_path} -> {printer_name}")
-                    return True
+                    return {"method": "win32", "duplex": False}
                 except Exception as e:
                     win32print.EndDocPrinter(hprinter)
                     raise e
@@ -132,7 +178,7 @@ def print_pdf_windows(pdf_path, printer_name=None, retry_count=0, print_retries=
             import time
             time.sleep(2)
             print(f"Printed via ShellExecute: {pdf_path} -> {printer_name}")
-            return True
+            return {"method": "shellexecute", "duplex": False}
         except Exception as e:
             last_error = str(e)
             print(f"ShellExecute failed: {e}")
@@ -146,24 +192,29 @@ def print_pdf_windows(pdf_path, printer_name=None, retry_count=0, print_retries=
             print(f"Print attempt {retry_count + 1} failed, retrying...")
             import time
             time.sleep(2)  # Wait before retry
-            return print_pdf_windows(pdf_path, printer_name, retry_count + 1, print_retries, print_timeout)
+            return print_pdf_windows(pdf_path, printer_name, retry_count + 1, print_retries, print_timeout, duplex)
         else:
             print(f"Printing failed after {print_retries} attempts")
             raise Exception(f"Failed to print after {print_retries} attempts: {str(e)}")
 
 
-def print_pdf_simulated(pdf_path):
+def print_pdf_simulated(pdf_path, duplex=False):
     """Simulate printing (for testing on non-Windows)."""
-    print(f"[SIMULATED] Would print: {pdf_path}")
-    return True
+    print(f"[SIMULATED] Would print{' (duplex)' if duplex else ''}: {pdf_path}")
+    return {"method": "simulated", "duplex": duplex}
 
 
-def print_pdf(pdf_path, print_retries=3, print_timeout=60):
-    """Print PDF file."""
+def print_pdf(pdf_path, print_retries=3, print_timeout=60, duplex=False):
+    """Print PDF file; returns {"method": ..., "duplex": whether it was printed double-sided}."""
     if WINDOWS_PRINTING:
-        return print_pdf_windows(pdf_path, print_retries=print_retries, print_timeout=print_timeout)
+        return print_pdf_windows(pdf_path, print_retries=print_retries, print_timeout=print_timeout, duplex=duplex)
     else:
-        return print_pdf_simulated(pdf_path)
+        return print_pdf_simulated(pdf_path, duplex)
+
+
+def duplex_supported():
+    """Whether print_pdf can print double-sided here (real printing needs SumatraPDF)."""
+    return not WINDOWS_PRINTING or check_sumatra_pdf() is not None
 
 
 def check_sumatra_pdf():
@@ -0,0 +1,282 @@
+"""
+Quota leases held by a print node (see quota_service.py).
+
+A node keeps at most one lease per team. reserve() takes sheets from it
+locally; only when the lease is used up or expired does it ask the quota
+service for a new one. Usage is reported to the service in the
+background.
+
+The node's leases are saved to a file before reserve() returns, so a
+crash can only lose knowledge of sheets that were not printed yet (they
+stay charged: quota is over-counted, never overdrawn). After a restart
+the saved leases are no longer used; their usage is reported as final.
+
+Expiry is measured on the node's monotonic clock from when the lease was
+requested, minus a margin, so the node always stops before the service
+considers the lease expired.
+
+usage() gives contest-wide figures for display and early checks: the
+service's usage (fetched at most every few seconds, and again after each
+report) plus the sheets this node has taken but not reported yet.
+"""
+
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+DEFAULT_LEASE_SHEETS = 10    # Sheets asked for per lease
+DEFAULT_REPORT_INTERVAL = 5  # Seconds between usage reports
+DEFAULT_TIMEOUT = 3          # Seconds per request to the quota service
+DEFAULT_USAGE_MAX_AGE = 5    # Seconds the service's usage figures are reused for
+EXPIRY_MARGIN = 0.1          # Fraction of the lease time given up for clock drift and latency
+
+
+class QuotaUnavailable(Exception):
+    """The quota service could not be reached."""
+
+
+class LeaseClient:
+    """Per-team sheet allowances leased from the central quota service."""
+
+    def __init__(self, authority_url, node, state_file, lease_sheets=DEFAULT_LEASE_SHEETS,
+                 report_interval=DEFAULT_REPORT_INTERVAL, timeout=DEFAULT_TIMEOUT):
+        self.authority_url = authority_url.rstrip("/")
+        self.node = node
+        self.state_file = state_file
+        self.lease_sheets = lease_sheets
+        self.report_interval = report_interval
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._leases = {}   # team -> lease in use
+        self._retired = {}  # lease_id -> lease waiting for its final report
+        self._pending = {}  # team -> lease_id of a grant whose reply never arrived
+        self._usage = None  # (monotonic time, GET /quota body) last fetched from the service
+        self._wake = threading.Event()
+        self._thread = None
+        self.stats = {"reserved": 0, "local": 0, "grants": 0, "refused": 0, "reports": 0, "unreachable": 0}
+        self._load()
+
+    # --- State file ---
+
+    def _load(self):
+        if not os.path.exists(self.state_file):
+            return
+        with open(self.state_file, 'r') as f:
+            state = json.load(f)
+        # Leases from before a restart are not used again, only reported
+        for lease in list(state["leases"].values()) + list(state["retired"].values()):
+            self._retired[lease["lease_id"]] = lease
+        for team, lease_id in state["pending"].items():
+            self._retired[lease_id] = {"lease_id": lease_id, "team": team, "sheets": 0, "used": 0, "reported": 0}
+
+    def _save(self):
+        # Caller holds the lock
+        state = {"node": self.node, "pending": self._pending,
+                 "leases": {team: {k: v for k, v in lease.items() if k != "deadline"}
+                            for team, lease in self._leases.items()},
+                 "retired": self._retired}
+        temp_file = self.state_file + '.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.state_file)
+
+    # --- Quota service ---
+
+    def _call(self, path, payload=None):
+        """POST JSON (GET without a payload); returns (status, body). Raises QuotaUnavailable on network errors."""
+        if payload is None:
+            req = urllib.request.Request(self.authority_url + path)
+        else:
+            req = urllib.request.Request(self.authority_url + path, data=json.dumps(payload).encode("utf-8"),
+                                         headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                body = json.loads(e.read())
+            except ValueError:
+                body = {}
+            if e.code >= 500:
+                raise QuotaUnavailable(f"Quota service error {e.code}")
+            return e.code, body
+        except (OSError, ValueError) as e:
+            self.stats["unreachable"] += 1
+            raise QuotaUnavailable(f"Quota service unreachable: {e}")
+
+    def _report(self, lease, final):
+        """Send a lease's usage; returns True once the service has it."""
+        status, _ = self._call(f"/leases/{lease['lease_id']}", {"used": lease["used"], "final": final})
+        self.stats["reports"] += 1
+        return status == 200 or (final and status == 404)  # 404: already finished
+
+    # --- Reserving ---
+
+    def reserve(self, team, sheets):
+        """Take `sheets` from the team's allowance.
+
+        Returns {"granted": bool, "available": sheets left for the team}.
+        Raises QuotaUnavailable if a new lease was needed and the quota
+        service could not be reached (nothing is printed without quota).
+        """
+        with self._lock:
+            self.stats["reserved"] += 1
+            lease = self._leases.get(team)
+            if lease is not None and time.monotonic() < lease["deadline"] and \
+                    lease["sheets"] - lease["used"] >= sheets:
+                lease["used"] += sheets
+                self._save()
+                self.stats["local"] += 1
+                return {"granted": True, "available": lease["available"] + lease["sheets"] - lease["used"]}
+
+            if lease is not None:
+                # Hand back what is left before asking for more
+                self._retired[lease["lease_id"]] = self._leases.pop(team)
+                self._save()
+                try:
+                    if self._report(lease, final=True):
+                        del self._retired[lease["lease_id"]]
+                        self._usage = None
+                        self._save()
+                except QuotaUnavailable:
+                    pass  # Reported later; the unused sheets stay held until then
+
+            lease_id = self._pending.get(team) or f"{self.node}-{uuid.uuid4().hex[:12]}"
+            self._pending[team] = lease_id
+            self._save()
+            requested_at = time.monotonic()
+            status, body = self._call("/leases", {"lease_id": lease_id, "team": team, "node": self.node,
+                                                  "sheets": max(sheets, self.lease_sheets), "min_sheets": sheets})
+            del self._pending[team]
+            if status == 409:
+                self._save()
+                self.stats["refused"] += 1
+                return {"granted": False, "available": body.get("available", 0)}
+            if status != 201:
+                self._save()
+                raise QuotaUnavailable(body.get("error", f"Quota service answered {status}"))
+            lease = {"lease_id": lease_id, "team": team, "sheets": body["sheets"], "used": sheets, "reported": 0,
+                     "available": body["available"],
+                     "deadline": requested_at + body["expires_in"] - body["ttl"] * EXPIRY_MARGIN}
+            self._leases[team] = lease
+            self._usage = None
+            self._save()
+            self.stats["grants"] += 1
+            self._wake.set()
+            return {"granted": True, "available": lease["available"] + lease["sheets"] - lease["used"]}
+
+    # --- Background reporting ---
+
+    def start(self):
+        """Start the reporting thread (idempotent)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="quota-lease-reporter", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.report_interval)
+            self._wake.clear()
+            try:
+                self.report_now()
+            except Exception as e:
+                print(f"Quota lease report failed: {e}")
+
+    def report_now(self):
+        """Report usage of every lease and finish the expired ones."""
+        with self._lock:
+            now = time.monotonic()
+            for team, lease in list(self._leases.items()):
+                if now >= lease["deadline"]:
+                    self._retired[lease["lease_id"]] = self._leases.pop(team)
+            self._save()
+            active = [dict(lease) for lease in self._leases.values() if lease["used"] > lease["reported"]]
+            retired = [dict(lease) for lease in self._retired.values()]
+
+        for lease in active:
+            try:
+                if self._report(lease, final=False):
+                    with self._lock:
+                        current = self._leases.get(lease["team"])
+                        if current is not None and current["lease_id"] == lease["lease_id"]:
+                            current["reported"] = max(current["reported"], lease["used"])
+                            self._save()
+                        self._usage = None
+            except QuotaUnavailable:
+                return
+        for lease in retired:
+            try:
+                if self._report(lease, final=True):
+                    with self._lock:
+                        self._retired.pop(lease["lease_id"], None)
+                        self._usage = None
+                        self._save()
+            except QuotaUnavailable:
+                return
+
+    def release_all(self):
+        """Stop using every lease and report them as final (e.g. on shutdown)."""
+        with self._lock:
+            for team in list(self._leases):
+                lease = self._leases.pop(team)
+                self._retired[lease["lease_id"]] = lease
+            self._save()
+        try:
+            self.report_now()
+        except Exception as e:
+            print(f"Could not release quota leases: {e}")
+
+    # --- Usage ---
+
+    def usage(self, max_age=DEFAULT_USAGE_MAX_AGE):
+        """Contest-wide sheets per team: {"max": n, "teams": {team: {"used": n, "available": n}}}.
+
+        Teams that have not used or leased anything are missing. Figures
+        fetched less than `max_age` seconds ago are reused; if the service
+        cannot be reached the last ones are used, and QuotaUnavailable is
+        raised only when there are none.
+        """
+        with self._lock:
+            fetched = self._usage
+        if fetched is None or time.monotonic() - fetched[0] > max_age:
+            try:
+                status, body = self._call("/quota")
+                if status != 200:
+                    raise QuotaUnavailable(body.get("error", f"Quota service answered {status}"))
+                fetched = (time.monotonic(), body)
+                with self._lock:
+                    self._usage = fetched
+            except QuotaUnavailable:
+                if fetched is None:
+                    raise
+
+        maximum = fetched[1]["max"]
+        teams = {team: {"used": usage["used"], "available": usage["available"]}
+                 for team, usage in fetched[1]["teams"].items()}
+        with self._lock:
+            now = time.monotonic()
+            for lease in list(self._leases.values()) + list(self._retired.values()):
+                usage = teams.setdefault(lease["team"], {"used": 0, "available": maximum})
+                # The service counts sheets not reported yet as held by the lease
+                usage["used"] += lease["used"] - lease["reported"]
+                if lease.get("deadline", 0) > now:
+                    usage["available"] += lease["sheets"] - lease["used"]
+        for usage in teams.values():
+            usage["available"] = max(0, min(usage["available"], maximum - usage["used"]))
+        return {"max": maximum, "teams": teams}
+
+    def leases(self):
+        """Leases in use and waiting for their final report."""
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "active": [dict({k: v for k, v in lease.items() if k != "deadline"},
+                                expires_in=round(lease["deadline"] - now, 1)) for lease in self._leases.values()],
+                "retired": list(self._retired.values()),
+            }
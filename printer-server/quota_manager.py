@@ -4,18 +4,54 @@ Quota management for the print server.
 
 import os
 import json
+import hashlib
+
+from utils import file_stamp, load_seat_plan
+
+
+_quota_cache = {}     # quota_file -> (stamp, quota)
+_snapshot_cache = {}  # (quota_file, seat_plan_file, max_pages) -> snapshot
+_writes = {}          # quota_file -> number of saves made by this process
+
+
+def quota_stamp(quota_file):
+    """Change marker for the quota file, bumped on every save."""
+    return (_writes.get(quota_file, 0), file_stamp(quota_file))
 
 
 def load_quota(quota_file):
-    """Load quota from JSON file."""
+    """Load quota from JSON file.
+
+    The parsed file is cached and only re-read when it changes; callers get
+    their own copy.
+    """
+    stamp = quota_stamp(quota_file)
+    cached = _quota_cache.get(quota_file)
+    if cached and cached[0] == stamp:
+        return dict(cached[1])
+
+    quota = {}
     if os.path.exists(quota_file):
         try:
             with open(quota_file, 'r') as f:
-                return json.load(f)
+                quota = json.load(f)
         except Exception as e:
             print(f"Error loading quota file: {e}")
             return {}
-    return {}
+    _quota_cache[quota_file] = (stamp, quota)
+    return dict(quota)
+
+
+def quota_cache_state():
+    """Parsed quota files keyed by their on-disk stamp, for a startup snapshot."""
+    return {quota_file: (stamp[1], quota) for quota_file, (stamp, quota) in _quota_cache.items()}
+
+
+def restore_quota_cache(state):
+    """Reuse parsed quota files from a snapshot where the file is unchanged."""
+    for quota_file, (stamp, quota) in state.items():
+        if stamp is not None and file_stamp(quota_file) == stamp:
+            _quota_cache[quota_file] = (quota_stamp(quota_file), quota)
 
 
 def save_quota(quota, quota_file):
@@ -35,6 +71,8 @@ def save_quota(quota, quota_file):
                 os.remove(quota_file + '.tmp')
             except:
                 pass
+    finally:
+        _writes[quota_file] = _writes.get(quota_file, 0) + 1
 
 
 def get_team_quota(team_name, quota_file):
@@ -58,3 +96,54 @@ def reset_team_quota(team_name, quota_file):
         del quota[team_name]
         save_quota(quota, quota_file)
     return True
+
+
+def get_quota_snapshot(quota_file, seat_plan_file, max_pages, usage=None):
+    """Per-team quota rows for the dashboard and API.
+
+    `usage` ({team: {"used": n, "available": n}}, e.g. from a quota service)
+    replaces the quota file's figures when given. The snapshot is rebuilt
+    only when the figures or the seat plan change. Returns a dict with
+    `etag`, `teams` (rows sorted by team name), `by_team` and `by_room`
+    indexes into those rows.
+    """
+    key = (quota_file, seat_plan_file, max_pages, usage is not None)
+    if usage is None:
+        stamp = (quota_stamp(quota_file), file_stamp(seat_plan_file))
+    else:
+        stamp = (json.dumps(usage, sort_keys=True), file_stamp(seat_plan_file))
+    cached = _snapshot_cache.get(key)
+    if cached and cached['stamp'] == stamp:
+        return cached
+
+    if usage is None:
+        quota = load_quota(quota_file)
+        usage = {team: {"used": used, "available": max_pages - used} for team, used in quota.items()}
+    rows = []
+    for seat in sorted(load_seat_plan(seat_plan_file), key=lambda r: r['team']):
+        team_usage = usage.get(seat['team'], {"used": 0, "available": max_pages})
+        used = team_usage["used"]
+        rows.append({
+            "team": seat['team'],
+            "room": seat['room'],
+            "desk": seat['desk'],
+            "used": used,
+            "remaining": team_usage["available"],
+            "percentage": (used / max_pages * 100) if max_pages > 0 else 0
+        })
+
+    by_room = {}
+    for row in rows:
+        by_room.setdefault(row['room'], []).append(row)
+
+    digest = hashlib.sha1(json.dumps([max_pages, rows]).encode('utf-8')).hexdigest()[:16]
+    snapshot = {
+        "stamp": stamp,
+        "etag": f"quota-{digest}",
+        "teams": rows,
+        "by_team": {row['team']: row for row in rows},
+        "by_room": by_room,
+        "rendered": {}  # Cached response bodies keyed by view name
+    }
+    _snapshot_cache[key] = snapshot
+    return snapshot
@@ -0,0 +1,248 @@
+"""
+Central quota service for running one print server per lab.
+
+Print nodes (automated.py with QUOTA_AUTHORITY_URL set) do not charge
+quota on their own. They take page-allowance leases from this service and
+spend them locally, so most jobs need no round-trip:
+
+    POST /leases            {"lease_id", "team", "node", "sheets", "min_sheets"}
+                            Grant up to `sheets` (at least `min_sheets`) of the
+                            team's remaining quota, or 409 if that much is not left.
+    POST /leases/<id>       {"used": n, "final": false}
+                            Report the sheets printed under the lease so far
+                            (a running total, so repeating a report is harmless).
+                            With "final": true the unused rest goes back to the team.
+
+Granted sheets count against the team until the node reports what it
+used. A lease that expires without a final report keeps holding all of
+its unreported sheets, because the service cannot know whether they were
+printed: a node that crashes or loses its link can therefore never cause
+a team to go over quota. Nodes send final reports when a lease expires
+and after a restart; organisers can settle a lease of a node that is gone
+for good with /settle-lease/<id>.
+
+Lease ids are chosen by the node, so a grant retried after a lost reply
+returns the same lease instead of holding the sheets twice.
+
+Run on one machine all nodes can reach:
+
+    python quota_service.py
+"""
+
+from flask import Flask, request
+import argparse
+import json
+import os
+import threading
+import time
+
+from quota_manager import load_quota, save_quota
+
+# --- Configuration ---
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+QUOTA_FILE = os.path.join(SCRIPT_DIR, "quota.json")
+LEASES_FILE = os.path.join(SCRIPT_DIR, "leases.json")
+MAX_PAGES = 50  # Maximum sheets per team (must match the print nodes)
+LEASE_TTL = 120  # Seconds a node may print against a lease
+MAX_LEASE_SHEETS = 20  # Largest allowance handed out at once
+PORT = 8090
+
+
+class QuotaExhausted(Exception):
+    """Not enough quota left for the requested lease."""
+
+    def __init__(self, usage):
+        super().__init__(f"Only {usage['available']} sheets left")
+        self.usage = usage
+
+
+class QuotaAuthority:
+    """Authoritative per-team usage plus the outstanding leases.
+
+    Charged sheets live in the quota file (same format as a single
+    server's quota.json); outstanding leases in the leases file. Every
+    change is saved before it is acknowledged: the quota file first, so a
+    crash in between can only over-count.
+    """
+
+    def __init__(self, quota_file, leases_file, max_pages, ttl=LEASE_TTL, max_lease=MAX_LEASE_SHEETS):
+        self.quota_file = quota_file
+        self.leases_file = leases_file
+        self.max_pages = max_pages
+        self.ttl = ttl
+        self.max_lease = max_lease
+        self._lock = threading.Lock()
+        self._leases = {}  # lease_id -> lease
+        if os.path.exists(leases_file):
+            with open(leases_file, 'r') as f:
+                self._leases = json.load(f)
+        self.stats = {"granted": 0, "refused": 0, "reports": 0, "released": 0}
+
+    def _save_leases(self):
+        temp_file = self.leases_file + '.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump(self._leases, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.leases_file)
+
+    def _usage(self, team, quota=None):
+        # Caller holds the lock
+        quota = load_quota(self.quota_file) if quota is None else quota
+        used = quota.get(team, 0)
+        held = sum(lease["sheets"] - lease["used"] for lease in self._leases.values() if lease["team"] == team)
+        return {"team": team, "used": used, "held": held,
+                "available": max(0, self.max_pages - used - held), "max": self.max_pages}
+
+    def usage(self, team):
+        with self._lock:
+            return self._usage(team)
+
+    def grant(self, lease_id, team, node, sheets, min_sheets=1):
+        """Grant a lease of up to `sheets`; raises QuotaExhausted below `min_sheets`."""
+        with self._lock:
+            lease = self._leases.get(lease_id)
+            if lease is not None:
+                # Retried request
+                return dict(lease, expires_in=lease["expires_at"] - time.time(), **self._usage(team))
+            usage = self._usage(team)
+            granted = min(sheets, self.max_lease, usage["available"])
+            if granted < max(1, min_sheets):
+                self.stats["refused"] += 1
+                raise QuotaExhausted(usage)
+            now = time.time()
+            lease = {"lease_id": lease_id, "team": team, "node": node, "sheets": granted, "used": 0,
+                     "ttl": self.ttl, "granted_at": now, "expires_at": now + self.ttl}
+            self._leases[lease_id] = lease
+            self._save_leases()
+            self.stats["granted"] += 1
+            return dict(lease, expires_in=self.ttl, **self._usage(team))
+
+    def report(self, lease_id, used, final=False):
+        """Record the sheets used under a lease so far; None for unknown (or finished) leases."""
+        with self._lock:
+            lease = self._leases.get(lease_id)
+            if lease is None:
+                return None
+            used = max(lease["used"], min(int(used), lease["sheets"]))
+            quota = load_quota(self.quota_file)
+            if used > lease["used"]:
+                quota[lease["team"]] = quota.get(lease["team"], 0) + used - lease["used"]
+                save_quota(quota, self.quota_file)
+                lease["used"] = used
+            if final:
+                del self._leases[lease_id]
+                self.stats["released"] += 1
+            self._save_leases()
+            self.stats["reports"] += 1
+            return dict(lease, final=final, **self._usage(lease["team"], quota))
+
+    def leases(self):
+        now = time.time()
+        with self._lock:
+            return [dict(lease, expired=lease["expires_at"] < now) for lease in self._leases.values()]
+
+    def reset(self, team):
+        """Forget a team's charged sheets (outstanding leases keep holding theirs)."""
+        with self._lock:
+            quota = load_quota(self.quota_file)
+            if quota.pop(team, None) is not None:
+                save_quota(quota, self.quota_file)
+            return self._usage(team, quota)
+
+    def snapshot(self):
+        """Usage of every team that has charged or leased sheets."""
+        with self._lock:
+            quota = load_quota(self.quota_file)
+            teams = set(quota) | {lease["team"] for lease in self._leases.values()}
+            return {team: self._usage(team, quota) for team in sorted(teams)}
+
+
+app = Flask(__name__)
+authority = QuotaAuthority(QUOTA_FILE, LEASES_FILE, MAX_PAGES)
+
+
+@app.route("/leases", methods=["GET", "POST"])
+def leases_route():
+    if request.method == "GET":
+        return {"leases": authority.leases()}
+    data = request.get_json(silent=True) or {}
+    try:
+        lease = authority.grant(str(data["lease_id"]), str(data["team"]), str(data.get("node", "")),
+                                int(data["sheets"]), int(data.get("min_sheets", 1)))
+    except (KeyError, ValueError, TypeError):
+        return {"error": "lease_id, team and sheets are required"}, 400
+    except QuotaExhausted as e:
+        return dict(e.usage, error=str(e)), 409
+    return lease, 201
+
+
+@app.route("/leases/<lease_id>", methods=["POST"])
+def report_route(lease_id):
+    data = request.get_json(silent=True) or {}
+    try:
+        lease = authority.report(lease_id, int(data["used"]), bool(data.get("final")))
+    except (KeyError, ValueError, TypeError):
+        return {"error": "used is required"}, 400
+    if lease is None:
+        return {"error": "Unknown or finished lease"}, 404
+    return lease
+
+
+@app.route("/settle-lease/<lease_id>")
+def settle_lease_route(lease_id):
+    """Finish a lease of a node that will not come back (admin function).
+
+    ?used= sets the sheets it printed; by default all of them are charged.
+    """
+    lease = next((lease for lease in authority.leases() if lease["lease_id"] == lease_id), None)
+    if lease is None:
+        return {"error": "Unknown or finished lease"}, 404
+    used = request.args.get("used", type=int, default=lease["sheets"])
+    print(f"Settling lease {lease_id} of {lease['node']} for {lease['team']}: {used}/{lease['sheets']} sheets used")
+    return authority.report(lease_id, used, final=True)
+
+
+@app.route("/quota")
+def quota_route():
+    team = request.args.get("team")
+    if team:
+        return authority.usage(team)
+    return {"max": MAX_PAGES, "teams": authority.snapshot()}
+
+
+@app.route("/reset-quota/<team>")
+def reset_quota_route(team):
+    """Reset quota for a specific team (admin function)."""
+    print(f"Reset quota for team: {team}")
+    return authority.reset(team)
+
+
+@app.route("/health")
+def health_check():
+    return {"status": "ok", "outstanding_leases": len(authority.leases()), **authority.stats}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Central quota service for print nodes.")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--data-dir", help="Folder for quota.json and leases.json (default: next to this script)")
+    parser.add_argument("--max-pages", type=int, default=MAX_PAGES)
+    parser.add_argument("--ttl", type=float, default=LEASE_TTL, help="Lease time in seconds")
+    args = parser.parse_args()
+    if args.data_dir:
+        QUOTA_FILE = os.path.join(args.data_dir, "quota.json")
+        LEASES_FILE = os.path.join(args.data_dir, "leases.json")
+    MAX_PAGES, LEASE_TTL, PORT = args.max_pages, args.ttl, args.port
+    authority = QuotaAuthority(QUOTA_FILE, LEASES_FILE, MAX_PAGES, ttl=LEASE_TTL)
+
+    print("=" * 60)
+    print("Breaking Code 2.0 - Central Quota Service")
+    print("=" * 60)
+    print(f"Quota file: {QUOTA_FILE}")
+    print(f"Leases file: {LEASES_FILE}")
+    print(f"Max pages per team: {MAX_PAGES}")
+    print(f"Lease time: {LEASE_TTL}s, at most {MAX_LEASE_SHEETS} sheets per lease")
+    print(f"\nServer starting on http://0.0.0.0:{PORT}")
+    print("=" * 60)
+    app.run(host="0.0.0.0", port=PORT, threaded=True)
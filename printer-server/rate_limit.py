@@ -0,0 +1,62 @@
+"""
+Token-bucket rate limiting for upload admission.
+"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if available.
+
+        Returns (True, 0) on success, or (False, seconds until enough tokens
+        would be available).
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True, 0
+            if self.rate <= 0:
+                return False, float('inf')
+            return False, (tokens - self.tokens) / self.rate
+
+    def refund(self, tokens=1):
+        """Give back tokens taken for a request that was rejected later."""
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + tokens)
+
+
+class KeyedRateLimiter:
+    """One token bucket per key (e.g. per team), created on first use."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, key):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+            return bucket
+
+    def try_acquire(self, key, tokens=1):
+        return self.bucket(key).try_acquire(tokens)
@@ -0,0 +1,170 @@
+"""
+Background reconciliation of failed and orphaned print jobs.
+
+A reconciler thread wakes up periodically and:
+    - retries prints that failed at the printer (ledger status "manual"),
+      in small batches and only while the printer reports ready. Their
+      quota was charged when they first failed, so retries never charge
+      it again; success moves the files to completed/ as usual.
+    - re-queues orphaned uploads: files left in uploads/<team>/ that no
+      queued job or ledger record owns (the ledger indexes every job's
+      files), e.g. after a crash or restart. They were never charged, so
+      they go through the normal pipeline. Whether a file can be printed,
+      and with which options, is decided by the server (`make_job`), with
+      the same checks as files from the watch folder; files it refuses are
+      left alone and the reconciler never deletes anything itself.
+"""
+
+import os
+import threading
+import time
+
+from job_queue import PrintJob, FAILED, FINISHED_STATES
+from job_ledger import MANUAL
+from utils import original_uploads
+
+DEFAULT_INTERVAL = 30       # Seconds between passes
+DEFAULT_BATCH_SIZE = 5      # Failed prints retried per pass
+DEFAULT_MAX_ATTEMPTS = 5    # After this many attempts a job is left to organisers
+DEFAULT_ORPHAN_GRACE = 300  # Seconds a file must sit untouched before it counts as orphaned
+
+
+class Reconciler:
+    """Periodic retry of failed prints and recovery of orphaned uploads.
+
+    `team_lookup(team)` returns the team's info dict (team, room, desk)
+    or None for folders that do not belong to a team; `printer_ready()`
+    says whether the printer can take work; `make_job(path, team_info)`
+    returns the PrintJob for an orphaned file, or None if it must not be
+    printed.
+    """
+
+    def __init__(self, print_queue, ledger, upload_dir, team_lookup, printer_ready, make_job,
+                 interval=DEFAULT_INTERVAL, batch_size=DEFAULT_BATCH_SIZE,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, orphan_grace=DEFAULT_ORPHAN_GRACE):
+        self.print_queue = print_queue
+        self.ledger = ledger
+        self.upload_dir = upload_dir
+        self.team_lookup = team_lookup
+        self.printer_ready = printer_ready
+        self.make_job = make_job
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.orphan_grace = orphan_grace
+        self._in_flight = {}  # job_id -> retry job
+        self._refused = {}    # path -> mtime of orphaned files make_job refused
+        self._thread = None
+        self._wake = threading.Event()
+        self.stats = {"passes": 0, "retried": 0, "recovered": 0, "orphans_requeued": 0, "orphans_refused": 0,
+                      "printer_ready": None, "last_pass": None}
+
+    def start(self):
+        """Start the reconciler thread (idempotent)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="reconciler", daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Run a pass now instead of waiting for the interval."""
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Reconciler pass failed: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def run_once(self):
+        """One reconciliation pass; returns the stats."""
+        self._collect_finished()
+        self._requeue_orphans()
+        ready = self.printer_ready()
+        self.stats["printer_ready"] = ready
+        if ready and not self._in_flight:
+            self._retry_failed()
+        self.stats["passes"] += 1
+        self.stats["last_pass"] = time.time()
+        return dict(self.stats)
+
+    # --- Failed prints ---
+
+    def _collect_finished(self):
+        for job_id, job in list(self._in_flight.items()):
+            if job.state in FINISHED_STATES:
+                del self._in_flight[job_id]
+                if job.state != FAILED:
+                    self.stats["recovered"] += 1
+
+    def _retry_job(self, record):
+        """Rebuild an already prepared and charged job from its ledger record."""
+        paths = [os.path.join(self.upload_dir, path) for path in record.get("files") or []]
+        if not paths or not all(os.path.exists(path) for path in paths):
+            return None
+        team_info = {"team": record["team"], "room": record.get("room", ""), "desk": record.get("desk", "")}
+        job = PrintJob(record["team"], team_info, record["filename"], paths[0], False,
+                       nup=record.get("nup", 1), duplex=record.get("duplex", False),
+                       page_range=record.get("page_range"))
+        job.id = record["job_id"]
+        job.pdf_path = paths[-1]
+        job.pages = record.get("pages")
+        job.source_pages = record.get("source_pages")
+        job.sides = record.get("sides") or job.pages
+        job.sheets = record.get("sheets") or job.pages
+        job.sha256 = record.get("sha256")
+        job.quota_charged = True
+        job.attempts = record.get("attempts", 1) + 1
+        return job
+
+    def _retry_failed(self):
+        batch = []
+        queued = {job.id for job in self.print_queue.unfinished_jobs()}  # e.g. resumed after a restart
+        for record in self.ledger.with_status(MANUAL):
+            if len(batch) >= self.batch_size:
+                break
+            if record.get("attempts", 1) >= self.max_attempts or record["job_id"] in queued:
+                continue
+            job = self._retry_job(record)
+            if job is None:
+                continue
+            batch.append(job)
+        for job in batch:
+            print(f"Retrying failed print {job.id} for {job.team} (attempt {job.attempts})")
+            self._in_flight[job.id] = self.print_queue.submit(job)
+        self.stats["retried"] += len(batch)
+
+    # --- Orphaned uploads ---
+
+    def _requeue_orphans(self):
+        if not os.path.isdir(self.upload_dir):
+            return
+        queued = {job.file_path for job in self.print_queue.unfinished_jobs()}
+        now = time.time()
+        for team in os.listdir(self.upload_dir):
+            team_folder = os.path.join(self.upload_dir, team)
+            if not os.path.isdir(team_folder):
+                continue
+            team_info = self.team_lookup(team)
+            if team_info is None:
+                continue
+            names = sorted(name for name in os.listdir(team_folder)
+                           if os.path.isfile(os.path.join(team_folder, name)))
+            for name in original_uploads(names):
+                path = os.path.join(team_folder, name)
+                mtime = os.path.getmtime(path)
+                if path in queued or now - mtime < self.orphan_grace or self._refused.get(path) == mtime:
+                    continue
+                if self.ledger.owner(os.path.relpath(path, self.upload_dir)) is not None:
+                    continue  # Waiting for a retry, or printed but not moved
+                # Stale derived files are overwritten by the pipeline
+                job = self.make_job(path, team_info)
+                if job is None:
+                    self._refused[path] = mtime  # Looked at again only if the file changes
+                    self.stats["orphans_refused"] += 1
+                    continue
+                print(f"Re-queueing orphaned upload {path} as job {job.id}")
+                self.print_queue.submit(job)
+                self.stats["orphans_requeued"] += 1
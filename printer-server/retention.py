@@ -0,0 +1,261 @@
+"""
+Retention of printed uploads.
+
+uploads/<team>/completed/ only grows during a contest. A background task
+keeps it small in two tiers:
+    - intermediate files (text files rendered to .pdf, stamped, imposed or
+      optimised copies) of printed jobs are deleted after a short grace
+      period; the original upload is kept
+    - completed files older than a threshold are moved into compressed
+      per-team archive segments and deleted from the upload folder
+
+Archive layout: archive/<team>/segment-0001.gz, segment-0002.gz, ... and
+archive/<team>/index.jsonl. Each archived file is one gzip member
+appended to the team's current segment, so a segment is a valid .gz file
+and a single file can be read back from its offset without touching the
+rest. The index has one JSON line per archived file (path relative to the
+upload folder, segment, offset, length, size, sha256).
+
+Each file is appended and synced to its segment, then its index line is
+written and synced, and only then is the upload deleted. A crash at any
+point leaves the file in the upload folder or in the archive.
+
+The task only runs while the print queue is idle, pauses between files,
+and on Linux runs at a lower CPU priority.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+
+from utils import original_uploads, truncate_torn_tail
+
+DEFAULT_ARCHIVE_AFTER = 6 * 3600    # Seconds after printing before files are archived
+DEFAULT_ARTEFACT_GRACE = 600        # Seconds after printing before intermediate files are deleted
+DEFAULT_INTERVAL = 300              # Seconds between passes
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+DEFAULT_THROTTLE = 0.05             # Seconds to pause after each file
+COMPLETED_FOLDER = "completed"
+INDEX_NAME = "index.jsonl"
+CHUNK_SIZE = 64 * 1024
+COMPRESS_LEVEL = 6
+NICE_INCREMENT = 10                 # Linux: lower priority of the retention thread
+
+
+class UploadArchive:
+    """Per-team compressed archive segments with an index of their files."""
+
+    def __init__(self, archive_dir, segment_bytes=DEFAULT_SEGMENT_BYTES, readonly=False):
+        self.archive_dir = archive_dir
+        self.segment_bytes = segment_bytes
+        self.readonly = readonly
+        self._lock = threading.Lock()
+        self._index = {}   # team -> {path: entry}
+        self.stats = {"archived": 0, "archived_bytes": 0, "stored_bytes": 0}
+
+    def _team_dir(self, team):
+        return os.path.join(self.archive_dir, team)
+
+    def _load(self, team):
+        # Caller holds the lock
+        entries = self._index.get(team)
+        if entries is not None:
+            return entries
+        entries = {}
+        index_file = os.path.join(self._team_dir(team), INDEX_NAME)
+        if os.path.exists(index_file):
+            if not self.readonly:
+                truncate_torn_tail(index_file)
+            with open(index_file, 'rb') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    entries[entry["path"]] = entry
+        self._index[team] = entries
+        return entries
+
+    def teams(self):
+        if not os.path.isdir(self.archive_dir):
+            return []
+        return sorted(name for name in os.listdir(self.archive_dir)
+                      if os.path.isdir(os.path.join(self.archive_dir, name)))
+
+    def get(self, path):
+        """Index entry for a path relative to the upload folder, or None."""
+        team = path.replace(os.sep, "/").split("/", 1)[0]
+        with self._lock:
+            return self._load(team).get(path.replace(os.sep, "/"))
+
+    def entries(self, teams=None):
+        """Index entries of the given teams (all teams by default)."""
+        result = []
+        with self._lock:
+            for team in self.teams():
+                if teams is None or team in teams:
+                    result.extend(self._load(team).values())
+        return sorted(result, key=lambda entry: entry["path"])
+
+    def _current_segment(self, team):
+        # Caller holds the lock
+        team_dir = self._team_dir(team)
+        segments = sorted(name for name in os.listdir(team_dir) if name.startswith("segment-"))
+        if segments:
+            last = os.path.join(team_dir, segments[-1])
+            if os.path.getsize(last) < self.segment_bytes:
+                return segments[-1]
+        return f"segment-{len(segments) + 1:04d}.gz"
+
+    def add(self, team, path, relpath):
+        """Append a file to the team's archive; returns its index entry."""
+        relpath = relpath.replace(os.sep, "/")
+        with self._lock:
+            entries = self._load(team)
+            team_dir = self._team_dir(team)
+            os.makedirs(team_dir, exist_ok=True)
+            segment = self._current_segment(team)
+            st = os.stat(path)
+            digest = hashlib.sha256()
+            gzip = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)
+            with open(os.path.join(team_dir, segment), 'ab') as out, open(path, 'rb') as src:
+                offset = out.seek(0, os.SEEK_END)
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    out.write(gzip.compress(chunk))
+                out.write(gzip.flush())
+                out.flush()
+                os.fsync(out.fileno())
+                length = out.tell() - offset
+            entry = {"path": relpath, "segment": segment, "offset": offset, "length": length,
+                     "size": st.st_size, "mtime": st.st_mtime, "sha256": digest.hexdigest(),
+                     "archived_at": time.time()}
+            with open(os.path.join(team_dir, INDEX_NAME), 'ab') as f:
+                f.write((json.dumps(entry, separators=(',', ':')) + "\n").encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+            entries[relpath] = entry
+            self.stats["archived"] += 1
+            self.stats["archived_bytes"] += st.st_size
+            self.stats["stored_bytes"] += length
+            return entry
+
+    def read_chunks(self, entry):
+        """Yield the decompressed contents of an archived file."""
+        team = entry["path"].split("/", 1)[0]
+        gzip = zlib.decompressobj(31)
+        with open(os.path.join(self._team_dir(team), entry["segment"]), 'rb') as f:
+            f.seek(entry["offset"])
+            remaining = entry["length"]
+            while remaining > 0:
+                data = f.read(min(CHUNK_SIZE, remaining))
+                if not data:
+                    raise IOError(f"Archive segment for {entry['path']} is truncated")
+                remaining -= len(data)
+                chunk = gzip.decompress(data)
+                if chunk:
+                    yield chunk
+        tail = gzip.flush()
+        if tail:
+            yield tail
+
+
+class Retention:
+    """Background task deleting intermediate files and archiving old completed ones.
+
+    `printed_at(relpath)` returns when the job owning a completed file was
+    printed, or None (the file's modification time is used then);
+    `is_idle()` says whether the print queue is empty.
+    """
+
+    def __init__(self, upload_dir, archive, printed_at=None, is_idle=None,
+                 archive_after=DEFAULT_ARCHIVE_AFTER, artefact_grace=DEFAULT_ARTEFACT_GRACE,
+                 interval=DEFAULT_INTERVAL, throttle=DEFAULT_THROTTLE):
+        self.upload_dir = upload_dir
+        self.archive = archive
+        self.printed_at = printed_at
+        self.is_idle = is_idle
+        self.archive_after = archive_after
+        self.artefact_grace = artefact_grace
+        self.interval = interval
+        self.throttle = throttle
+        self._thread = None
+        self.stats = {"passes": 0, "artefacts_removed": 0, "artefact_bytes": 0, "archived": 0,
+                      "skipped_busy": 0, "last_pass": None}
+
+    def start(self):
+        """Start the retention thread (idempotent)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        if sys.platform.startswith("linux") and hasattr(os, "setpriority"):
+            try:
+                # Linux applies priorities per thread
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), NICE_INCREMENT)
+            except OSError:
+                pass
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Retention pass failed: {e}")
+
+    def _busy(self):
+        return self.is_idle is not None and not self.is_idle()
+
+    def _age(self, path, now):
+        printed = self.printed_at(os.path.relpath(path, self.upload_dir)) if self.printed_at else None
+        return now - (printed if printed is not None else os.path.getmtime(path))
+
+    def run_once(self):
+        """One pass over every team's completed folder; returns the stats."""
+        if os.path.isdir(self.upload_dir):
+            for team in sorted(os.listdir(self.upload_dir)):
+                folder = os.path.join(self.upload_dir, team, COMPLETED_FOLDER)
+                if not os.path.isdir(folder):
+                    continue
+                if self._busy():
+                    self.stats["skipped_busy"] += 1
+                    break  # Try again next pass
+                self._clean_team(team, folder)
+        self.stats["passes"] += 1
+        self.stats["last_pass"] = time.time()
+        return dict(self.stats)
+
+    def _clean_team(self, team, folder):
+        now = time.time()
+        names = sorted(name for name in os.listdir(folder) if os.path.isfile(os.path.join(folder, name)))
+        originals = set(original_uploads(names))
+        if self.artefact_grace is not None:
+            for name in names:
+                path = os.path.join(folder, name)
+                if name in originals or self._age(path, now) < self.artefact_grace:
+                    continue
+                size = os.path.getsize(path)
+                os.remove(path)
+                self.stats["artefacts_removed"] += 1
+                self.stats["artefact_bytes"] += size
+            names = sorted(originals)
+        if self.archive_after is None:
+            return
+        for name in names:
+            path = os.path.join(folder, name)
+            if not os.path.exists(path) or self._age(path, now) < self.archive_after:
+                continue
+            if self._busy():
+                return
+            relpath = os.path.relpath(path, self.upload_dir).replace(os.sep, "/")
+            entry = self.archive.get(relpath)
+            st = os.stat(path)
+            if entry is None or (entry["size"], entry["mtime"]) != (st.st_size, st.st_mtime):
+                self.archive.add(team, path, relpath)
+            os.remove(path)  # Archived (or archived before a crash cut this pass short)
+            self.stats["archived"] += 1
+            time.sleep(self.throttle)
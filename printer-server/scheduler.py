@@ -0,0 +1,181 @@
+"""
+Print queue scheduling policies.
+
+A scheduler chooses which prepared job (size known) the printer takes
+next. Job size is the number of printed sides (`job.sides`; an n-up job
+needs fewer sides than it has pages), falling back to `job.pages`. Every
+policy also serves any job that has waited longer than `max_wait` seconds
+first, oldest first, so no job can starve.
+
+Policies:
+    fifo  - first come, first served
+    sjf   - shortest job (fewest printed sides) first, with aging: a job's
+            effective size shrinks by one side for every `aging` seconds it waits
+    fair  - weighted fair sharing of printed sides across rooms, then across
+            teams within a room; FIFO within a team
+"""
+
+import math
+from types import SimpleNamespace
+
+DEFAULT_MAX_WAIT = 600  # Seconds after which a job jumps the queue
+DEFAULT_AGING = 20      # SJF: seconds of waiting worth one printed side
+
+
+def job_size(job):
+    """Printed sides a job occupies the printer for."""
+    return getattr(job, "sides", None) or job.pages
+
+
+class Scheduler:
+    """Base policy: FIFO order plus the max-wait starvation guard."""
+
+    name = "fifo"
+
+    def __init__(self, max_wait=DEFAULT_MAX_WAIT, **options):
+        self.max_wait = max_wait
+
+    def sort_key(self, job, now):
+        """Ordering key among waiting jobs; lower prints sooner."""
+        return (job.created_at,)
+
+    def priority(self, job, now):
+        """Full ordering key: overdue jobs first (oldest first), then sort_key()."""
+        overdue = self.max_wait is not None and now - job.created_at >= self.max_wait
+        if overdue:
+            return (0, job.created_at)
+        return (1,) + tuple(self.sort_key(job, now))
+
+    def pick(self, jobs, now):
+        """The job to print next from a non-empty list."""
+        return min(jobs, key=lambda job: self.priority(job, now))
+
+    def ahead(self, jobs, job, now):
+        """The jobs in `jobs` that would print before `job`."""
+        key = self.priority(job, now)
+        return [other for other in jobs if other is not job and self.priority(other, now) < key]
+
+    def dispatched(self, job):
+        """Called when `job` is handed to the printer."""
+
+    def state(self):
+        """What the policy has learned so far (kept across restarts)."""
+        return {}
+
+    def restore(self, state):
+        """Continue from a state() taken by the same policy."""
+
+
+class ShortestJobFirst(Scheduler):
+    name = "sjf"
+
+    def __init__(self, max_wait=DEFAULT_MAX_WAIT, aging=DEFAULT_AGING, **options):
+        super().__init__(max_wait)
+        self.aging = aging
+
+    def sort_key(self, job, now):
+        waited = now - job.created_at
+        return (job_size(job) - waited / self.aging, job.created_at)
+
+
+class FairShare(Scheduler):
+    name = "fair"
+
+    def __init__(self, max_wait=DEFAULT_MAX_WAIT, room_weights=None, team_weights=None, **options):
+        super().__init__(max_wait)
+        self.room_weights = room_weights or {}
+        self.team_weights = team_weights or {}
+        self.room_service = {}
+        self.team_service = {}
+        # Virtual time: service level of the last flow served. A room or team
+        # that was idle starts from here instead of its old, lower total, so
+        # it cannot claim the printer for its whole absence.
+        self.room_clock = 0.0
+        self.team_clock = 0.0
+
+    def _room_service(self, room):
+        return max(self.room_service.get(room, 0.0), self.room_clock)
+
+    def _team_service(self, team):
+        return max(self.team_service.get(team, 0.0), self.team_clock)
+
+    def sort_key(self, job, now):
+        return (self._room_service(job.room), self._team_service(job.team), job.created_at)
+
+    def dispatched(self, job):
+        room_start = self._room_service(job.room)
+        team_start = self._team_service(job.team)
+        self.room_clock = room_start
+        self.team_clock = team_start
+        self.room_service[job.room] = room_start + job_size(job) / self.room_weights.get(job.room, 1)
+        self.team_service[job.team] = team_start + job_size(job) / self.team_weights.get(job.team, 1)
+
+    def state(self):
+        return {"room_service": dict(self.room_service), "team_service": dict(self.team_service),
+                "room_clock": self.room_clock, "team_clock": self.team_clock}
+
+    def restore(self, state):
+        self.room_service = dict(state.get("room_service", {}))
+        self.team_service = dict(state.get("team_service", {}))
+        self.room_clock = state.get("room_clock", 0.0)
+        self.team_clock = state.get("team_clock", 0.0)
+
+
+SCHEDULERS = {cls.name: cls for cls in (Scheduler, ShortestJobFirst, FairShare)}
+
+
+def make_scheduler(policy, **options):
+    """Create a scheduler by policy name ('fifo', 'sjf' or 'fair')."""
+    try:
+        return SCHEDULERS[policy](**options)
+    except KeyError:
+        raise ValueError(f"Unknown scheduling policy: {policy}. Choose from: {', '.join(SCHEDULERS)}")
+
+
+def wait_stats(waits):
+    """Mean and tail statistics for a list of waiting times in seconds."""
+    if not waits:
+        return {"jobs": 0, "mean": 0, "p50": 0, "p95": 0, "max": 0}
+    ordered = sorted(waits)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1)]
+
+    return {
+        "jobs": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 1),
+        "p50": round(percentile(50), 1),
+        "p95": round(percentile(95), 1),
+        "max": round(ordered[-1], 1),
+    }
+
+
+def simulate(policy, history, seconds_per_page, **options):
+    """Replay recorded jobs through one policy on a single printer.
+
+    `history` holds dicts with created_at, pages (printed sides), team and
+    room. Returns waiting-time and turnaround statistics for the policy.
+    """
+    scheduler = make_scheduler(policy, **options)
+    arrivals = sorted((SimpleNamespace(**record) for record in history), key=lambda j: j.created_at)
+    ready = []
+    waits = []
+    turnarounds = []
+    now = 0.0
+    i = 0
+    while i < len(arrivals) or ready:
+        if not ready:
+            now = max(now, arrivals[i].created_at)
+        while i < len(arrivals) and arrivals[i].created_at <= now:
+            ready.append(arrivals[i])
+            i += 1
+        job = scheduler.pick(ready, now)
+        ready.remove(job)
+        scheduler.dispatched(job)
+        waits.append(now - job.created_at)
+        now += job_size(job) * seconds_per_page
+        turnarounds.append(now - job.created_at)
+
+    stats = wait_stats(waits)
+    stats["mean_turnaround"] = wait_stats(turnarounds)["mean"]
+    return stats
@@ -0,0 +1,103 @@
+"""
+Warm-state snapshots for fast restarts.
+
+The server periodically saves what it would otherwise rebuild on start-up
+(the print queue, the job ledger indexes, parsed seat plan and quota
+caches) into one compressed binary file. On start-up the snapshot is
+loaded and only the journal and ledger lines written after it are
+replayed.
+
+The file is written to a temporary name, synced and renamed over the old
+one, so a crash leaves either the previous or the new snapshot. A missing,
+damaged or outdated snapshot is ignored and the server rebuilds its state
+from the journal and ledger files instead.
+"""
+
+import atexit
+import os
+import pickle
+import threading
+import time
+import zlib
+
+SNAPSHOT_VERSION = 2        # Bump when the layout of the saved state changes
+DEFAULT_INTERVAL = 30       # Seconds between snapshots
+COMPRESS_LEVEL = 1          # zlib level: fast, still shrinks the JSON-like records well
+
+
+def save_snapshot(path, state):
+    """Write `state` atomically; returns the file size in bytes."""
+    data = zlib.compress(pickle.dumps((SNAPSHOT_VERSION, state), protocol=pickle.HIGHEST_PROTOCOL),
+                         COMPRESS_LEVEL)
+    temp_file = path + '.tmp'
+    with open(temp_file, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, path)
+    return len(data)
+
+
+def load_snapshot(path):
+    """The saved state, or None if there is no usable snapshot."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            version, state = pickle.loads(zlib.decompress(f.read()))
+    except Exception as e:
+        print(f"WARNING: Ignoring unreadable snapshot {path}: {e}")
+        return None
+    if version != SNAPSHOT_VERSION:
+        print(f"WARNING: Ignoring snapshot {path} from another server version")
+        return None
+    return state
+
+
+class Snapshotter:
+    """Background thread that saves `collect()` every `interval` seconds.
+
+    With `marker`, a snapshot is only taken when `marker()` changed since
+    the last one (e.g. the journal and ledger positions). A final snapshot
+    is taken when the process exits normally.
+    """
+
+    def __init__(self, path, collect, interval=DEFAULT_INTERVAL, marker=None):
+        self.path = path
+        self.collect = collect
+        self.interval = interval
+        self.marker = marker
+        self._last_marker = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self.stats = {"saved": 0, "bytes": 0, "seconds": None, "last_saved": None, "errors": 0}
+
+    def start(self):
+        """Start the snapshot thread (idempotent)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="snapshotter", daemon=True)
+            self._thread.start()
+            atexit.register(self.save)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.save()
+
+    def save(self, force=False):
+        """Take a snapshot now (if anything changed); returns True if one was written."""
+        with self._lock:
+            try:
+                marker = self.marker() if self.marker is not None else None
+                if not force and marker is not None and marker == self._last_marker:
+                    return False
+                started = time.perf_counter()
+                size = save_snapshot(self.path, self.collect())
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"WARNING: Could not save snapshot {self.path}: {e}")
+                return False
+            self._last_marker = marker
+            self.stats.update(saved=self.stats["saved"] + 1, bytes=size,
+                              seconds=round(time.perf_counter() - started, 3), last_saved=time.time())
+            return True
@@ -0,0 +1,114 @@
+"""
+Team name search index for the upload form typeahead.
+
+The index is built once per seat-plan version: a sorted list of lower-cased
+names answers prefix queries with a binary search, and a trigram table
+narrows substring queries to a few candidates before they are checked.
+"""
+
+from bisect import bisect_left
+
+from utils import load_seat_plan, seat_plan_cache_state, restore_seat_plan_cache
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+_index_cache = {}  # seat_plan_file -> (rows, TeamIndex)
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TeamIndex:
+    """Prefix and substring search over the seat plan's team names."""
+
+    def __init__(self, rows):
+        self.rows = sorted(rows, key=lambda r: (r['team'].lower(), r['team']))
+        self.by_team = {}
+        for row in self.rows:
+            self.by_team.setdefault(row['team'], row)
+        self._keys = [row['team'].lower() for row in self.rows]
+        self._trigram_ids = {}
+        for i, key in enumerate(self._keys):
+            for gram in _trigrams(key):
+                self._trigram_ids.setdefault(gram, []).append(i)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def get(self, team_name):
+        """Seat plan row for an exact team name, or None."""
+        return self.by_team.get(team_name)
+
+    def _prefix_ids(self, query):
+        start = bisect_left(self._keys, query)
+        for i in range(start, len(self._keys)):
+            if not self._keys[i].startswith(query):
+                break
+            yield i
+
+    def _substring_ids(self, query):
+        grams = _trigrams(query)
+        if grams:
+            # Rarest trigram first keeps the candidate list short
+            lists = sorted((self._trigram_ids.get(g, []) for g in grams), key=len)
+            candidates = lists[0]
+        else:
+            candidates = range(len(self._keys))
+        for i in candidates:
+            if query in self._keys[i]:
+                yield i
+
+    def search(self, query, limit=DEFAULT_LIMIT, room=None):
+        """Teams matching `query`, prefix matches first, at most `limit` rows.
+
+        Returns (rows, truncated) where `truncated` is True when more teams
+        matched than were returned.
+        """
+        query = (query or '').strip().lower()
+        limit = max(1, min(limit, MAX_LIMIT))
+        results = []
+        seen = set()
+        for ids in (self._prefix_ids(query), self._substring_ids(query)):
+            for i in ids:
+                if i in seen:
+                    continue
+                row = self.rows[i]
+                if room and row['room'] != room:
+                    continue
+                if len(results) == limit:
+                    return results, True
+                seen.add(i)
+                results.append(row)
+            if not query:
+                break
+        return results, False
+
+
+def get_team_index(seat_plan_file):
+    """Search index for the seat plan, rebuilt only when the CSV changes."""
+    rows = load_seat_plan(seat_plan_file)
+    cached = _index_cache.get(seat_plan_file)
+    if cached and cached[0] is rows:
+        return cached[1]
+    index = TeamIndex(rows)
+    _index_cache[seat_plan_file] = (rows, index)
+    return index
+
+
+def index_cache_state():
+    """Seat plans and their search indexes, for a startup snapshot.
+
+    Both go into one snapshot so that the restored index still refers to
+    the restored rows.
+    """
+    return {"seat_plans": seat_plan_cache_state(), "indexes": dict(_index_cache)}
+
+
+def restore_index_cache(state):
+    """Reuse indexes from a snapshot for seat plans that are unchanged on disk."""
+    restore_seat_plan_cache(state["seat_plans"])
+    for seat_plan_file, (rows, index) in state["indexes"].items():
+        if load_seat_plan(seat_plan_file) is rows:
+            _index_cache[seat_plan_file] = (rows, index)
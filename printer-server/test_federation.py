@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Test script for running several print nodes against one quota service.
+
+Starts quota_service.py and a number of node processes on this machine
+(with their own temporary data folders) and checks that leases never let
+a team go over quota:
+    - nodes competing for one team's quota get exactly the quota between them
+    - most reservations are served from a lease without a round-trip
+    - a node that crashes keeps its leased sheets held, and returns the
+      unused ones when it comes back
+    - nodes keep printing from their leases while the quota service is
+      down, and stop once the lease is used up
+    - expired leases are not used again
+"""
+
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from quota_lease import LeaseClient, QuotaUnavailable
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MAX_PAGES = 50
+
+# Colors for terminal output
+GREEN = '\033[92m'
+RED = '\033[91m'
+BLUE = '\033[94m'
+RESET = '\033[0m'
+
+failures = []
+
+
+def print_status(message, status="info"):
+    """Print colored status message."""
+    if status == "ok":
+        print(f"{GREEN}✓{RESET} {message}")
+    elif status == "error":
+        print(f"{RED}✗{RESET} {message}")
+    else:
+        print(f"{BLUE}ℹ{RESET} {message}")
+
+
+def check(condition, message):
+    print_status(message, "ok" if condition else "error")
+    if not condition:
+        failures.append(message)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get(url):
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return json.loads(response.read())
+
+
+def start_service(data_dir, port, ttl):
+    proc = subprocess.Popen([sys.executable, os.path.join(SCRIPT_DIR, "quota_service.py"), "--port", str(port),
+                             "--data-dir", data_dir, "--max-pages", str(MAX_PAGES), "--ttl", str(ttl)],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            get(f"http://127.0.0.1:{port}/health")
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("Quota service did not start")
+
+
+def run_node(url, name, team, count, state_file, crash=False):
+    """Run a node process that reserves one sheet `count` times; returns its summary."""
+    args = [sys.executable, os.path.abspath(__file__), "--node", url, name, team, str(count), state_file]
+    if crash:
+        args.append("--crash")
+    return subprocess.Popen(args, stdout=subprocess.PIPE, text=True)
+
+
+def node_result(proc):
+    out, _ = proc.communicate(timeout=60)
+    return json.loads(out.strip().splitlines()[-1]) if out.strip() else None
+
+
+def node_main(url, name, team, count, state_file, crash):
+    """Node process: reserve sheets like a print node would, then report and exit."""
+    client = LeaseClient(url, name, state_file, lease_sheets=5, report_interval=0.2)
+    client.report_now()  # Finish leases left by an earlier run
+    granted = refused = 0
+    for _ in range(count):
+        if client.reserve(team, 1)["granted"]:
+            granted += 1
+        else:
+            refused += 1
+    if not crash:
+        client.release_all()
+    print(json.dumps({"granted": granted, "refused": refused, **client.stats}), flush=True)
+    if crash:
+        os._exit(1)  # No final report
+
+
+def main():
+    data_dir = tempfile.mkdtemp(prefix="quota-federation-")
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    service = start_service(data_dir, port, ttl=30)
+    try:
+        print_status(f"Quota service on {url}, data in {data_dir}")
+
+        # 1. Competing nodes
+        print("\nThree nodes, 30 one-sheet jobs each, one team (quota 50):")
+        procs = [run_node(url, f"node{i}", "TeamA", 30, os.path.join(data_dir, f"node{i}.json")) for i in range(3)]
+        results = [node_result(proc) for proc in procs]
+        granted = sum(r["granted"] for r in results)
+        usage = get(f"{url}/quota?team=TeamA")
+        check(granted == MAX_PAGES, f"Nodes were granted {granted} sheets in total (quota {MAX_PAGES})")
+        check(usage["used"] == MAX_PAGES and usage["held"] == 0,
+              f"Service charged {usage['used']} sheets, {usage['held']} still held")
+        grants = sum(r["grants"] for r in results)
+        local = sum(r["local"] for r in results)
+        check(local > grants, f"{local} reservations served from leases, {grants} needed a round-trip")
+
+        # 2. Node crash
+        print("\nNode crashes after using 3 sheets of a 5-sheet lease:")
+        state_file = os.path.join(data_dir, "crashy.json")
+        node_result(run_node(url, "crashy", "TeamB", 3, state_file, crash=True))
+        usage = get(f"{url}/quota?team=TeamB")
+        check(usage["held"] == 5 and usage["available"] == MAX_PAGES - 5,
+              f"Lease still holds {usage['held']} sheets; {usage['available']} available to other nodes")
+        other = node_result(run_node(url, "other", "TeamB", MAX_PAGES, os.path.join(data_dir, "other.json")))
+        check(other["granted"] == MAX_PAGES - 5, f"Another node could only take {other['granted']} sheets")
+        node_result(run_node(url, "crashy", "TeamB", 0, state_file))
+        usage = get(f"{url}/quota?team=TeamB")
+        check(usage["used"] == MAX_PAGES - 2 and usage["held"] == 0,
+              f"After restart the node reported 3 used: {usage['used']} charged, {usage['available']} available")
+
+        # 3. Quota service down
+        print("\nQuota service goes down while a node holds a lease:")
+        client = LeaseClient(url, "offline", os.path.join(data_dir, "offline.json"), lease_sheets=5,
+                             report_interval=0.2)
+        client.reserve("TeamC", 1)
+        service.kill()
+        service.wait()
+        served = 0
+        try:
+            for _ in range(10):
+                client.reserve("TeamC", 1)
+                served += 1
+            unavailable = False
+        except QuotaUnavailable:
+            unavailable = True
+        check(served == 4, f"{served} more sheets printed from the lease without the service")
+        check(unavailable, "Printing stopped once the lease was used up")
+        service = start_service(data_dir, port, ttl=30)
+        client.release_all()
+        usage = get(f"{url}/quota?team=TeamC")
+        check(usage["used"] == 5 and usage["held"] == 0,
+              f"Service restarted from its files and got the usage: {usage['used']} charged")
+
+        # 4. Expiry
+        print("\nLeases expire:")
+        service.kill()
+        service.wait()
+        service = start_service(data_dir, port, ttl=1)
+        client = LeaseClient(url, "slow", os.path.join(data_dir, "slow.json"), lease_sheets=5)
+        client.reserve("TeamD", 1)
+        time.sleep(1.2)
+        client.reserve("TeamD", 1)
+        check(client.stats["grants"] == 2, "A new lease was taken after the first expired")
+        client.release_all()
+        usage = get(f"{url}/quota?team=TeamD")
+        check(usage["used"] == 2 and usage["held"] == 0, f"Expired lease reported: {usage['used']} charged")
+    finally:
+        service.kill()
+        service.wait()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    print()
+    if failures:
+        print_status(f"{len(failures)} check(s) failed", "error")
+        return 1
+    print_status("Leases never let a team go over quota", "ok")
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--node":
+        node_main(sys.argv[2], sys.argv[3], sys.argv[4], int(sys.argv[5]), sys.argv[6], "--crash" in sys.argv)
+    else:
+        sys.exit(main())
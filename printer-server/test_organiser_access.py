@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Test script for the organiser-only admin routes.
+
+Copies the server into a temporary folder (so its uploads and ledgers are
+not touched), imports it there and checks with Flask's test client that
+the admin routes (/export, /files/<team>/<file>, /api/jobs,
+/mark-printed/<id>, /reconcile) are:
+    - refused to a plain request from another machine
+    - allowed from this machine
+    - allowed from another machine with the organiser token
+    - refused from another machine with a wrong token
+and that actions which change state do not answer GET.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+TOKEN = "s3cret-organiser-token"
+LOCAL = {"REMOTE_ADDR": "127.0.0.1"}
+REMOTE = {"REMOTE_ADDR": "10.0.0.7"}
+
+# Colors for terminal output
+GREEN = '\033[92m'
+RED = '\033[91m'
+BLUE = '\033[94m'
+RESET = '\033[0m'
+
+failures = []
+
+
+def print_status(message, status="info"):
+    """Print colored status message."""
+    if status == "ok":
+        print(f"{GREEN}✓{RESET} {message}")
+    elif status == "error":
+        print(f"{RED}✗{RESET} {message}")
+    else:
+        print(f"{BLUE}ℹ{RESET} {message}")
+
+
+def check(condition, message):
+    print_status(message, "ok" if condition else "error")
+    if not condition:
+        failures.append(message)
+
+
+def status(client, url, method="GET", **kwargs):
+    """Request `url` and return the status code, reading and closing any streamed body."""
+    response = client.open(url, method=method, **kwargs)
+    response.get_data()
+    response.close()
+    return response.status_code
+
+
+def check_route(client, name, url, method="GET"):
+    """Run the access checks against one organiser-only URL."""
+    import automated
+
+    print(f"\n{name}:")
+    automated.ORGANISER_TOKEN = None
+    code = status(client, url, method, environ_base=REMOTE)
+    check(code == 403, f"Plain request from another machine refused ({code})")
+    code = status(client, url, method, environ_base=REMOTE, headers={"X-Organiser-Token": TOKEN})
+    check(code == 403, f"Token refused while no organiser token is set ({code})")
+    code = status(client, url, method, environ_base=LOCAL)
+    check(code != 403, f"Request from this machine allowed ({code})")
+    if method != "GET":
+        code = status(client, url, environ_base=LOCAL)
+        check(code == 405, f"GET from this machine not accepted ({code})")
+
+    automated.ORGANISER_TOKEN = TOKEN
+    code = status(client, url, method, environ_base=REMOTE, headers={"X-Organiser-Token": TOKEN})
+    check(code != 403, f"Request with the token header allowed ({code})")
+    separator = "&" if "?" in url else "?"
+    code = status(client, f"{url}{separator}token={TOKEN}", method, environ_base=REMOTE)
+    check(code != 403, f"Request with ?token= allowed ({code})")
+    code = status(client, url, method, environ_base=REMOTE, headers={"X-Organiser-Token": "guess"})
+    check(code == 403, f"Request with a wrong token refused ({code})")
+    automated.ORGANISER_TOKEN = None
+
+
+def inside_main():
+    """Runs in the copied server folder."""
+    import automated
+
+    client = automated.app.test_client()
+    check_route(client, "/export", "/export?format=zip")
+    team_dir = os.path.join(automated.UPLOAD_DIR, "TeamA")
+    os.makedirs(team_dir, exist_ok=True)
+    with open(os.path.join(team_dir, "solution.pdf"), "wb") as f:
+        f.write(b"%PDF-1.4\n")
+    check_route(client, "/files/<team>/<file>", "/files/TeamA/solution.pdf")
+    check_route(client, "/api/jobs", "/api/jobs?status=manual")
+    # Unknown job: organisers get 404, everyone else 403
+    check_route(client, "/mark-printed/<id>", "/mark-printed/no-such-job", method="POST")
+    check_route(client, "/reconcile", "/reconcile", method="POST")
+    return 1 if failures else 0
+
+
+def main():
+    print_status("Testing organiser-only routes")
+    work_dir = tempfile.mkdtemp(prefix="organiser-test-")
+    server_dir = os.path.join(work_dir, "printer-server")
+    try:
+        shutil.copytree(SCRIPT_DIR, server_dir, ignore=shutil.ignore_patterns(
+            "uploads", "archive", "*.jsonl", "*.json", "state.snapshot", "__pycache__"))
+        result = subprocess.run([sys.executable, os.path.join(server_dir, os.path.basename(__file__)), "--inside"],
+                                cwd=server_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    for line in result.stdout.splitlines():
+        if "✓" in line or "✗" in line or line.endswith(":"):
+            print(line)
+
+    print()
+    if result.returncode:
+        print_status("Some check(s) failed", "error")
+        print(result.stdout)
+        return 1
+    print_status("Admin routes are only served to organisers", "ok")
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--inside":
+        sys.exit(inside_main())
+    else:
+        sys.exit(main())
@@ -217,6 +217,7 @@ def main():
     check_file_exists("templates/index.html", "Simple upload page")
     check_file_exists("templates/automated_index.html", "Automated upload page")
     check_file_exists("templates/automated_result.html", "Result page")
+    check_file_exists("templates/automated_status.html", "Job status page")
     check_file_exists("templates/quota_status.html", "Quota page")
     print()
     
@@ -3,84 +3,207 @@ Common utility functions shared between automated and simple servers.
 """
 
 import os
+import re
 import csv
+import hashlib
 import shutil
 
 
-def load_teams(seat_plan_file):
-    """Load team names from CSV file."""
-    teams = []
-    if os.path.exists(seat_plan_file):
+_seat_plan_cache = {}  # seat_plan_file -> (stamp, rows)
+
+# Saved upload names: <timestamp>_<name> (automated.py) or
+# <timestamp>_R<room>_D<desk>_<name> (simple.py, teams in the seat plan)
+UPLOAD_NAME_RE = re.compile(r'^(?P<timestamp>\d{8}_\d{6})(?:_R(?P<room>.*?)_D(?P<desk>[^_]*))?_(?P<filename>.+)$')
+
+
+def file_stamp(path):
+    """Cheap change marker for a file: (mtime_ns, size), or None if missing."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def load_seat_plan(seat_plan_file):
+    """Load seat plan rows as dicts with team, room and desk.
+
+    The parsed rows are cached and only re-read when the CSV changes on disk.
+    """
+    stamp = file_stamp(seat_plan_file)
+    cached = _seat_plan_cache.get(seat_plan_file)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    rows = []
+    if stamp is not None:
         try:
             with open(seat_plan_file, 'r', encoding='utf-8') as f:
                 reader = csv.DictReader(f)
                 for row in reader:
                     team_name = row.get('Team Name', '').strip()
                     if team_name:
-                        teams.append(team_name)
+                        rows.append({
+                            'team': team_name,
+                            'room': row.get('Room', '').strip(),
+                            'desk': row.get('Desk No', '').strip()
+                        })
         except Exception as e:
-            print(f"Error loading teams: {e}")
-    return sorted(teams)
+            print(f"Error loading seat plan: {e}")
+            return rows
+    _seat_plan_cache[seat_plan_file] = (stamp, rows)
+    return rows
+
+
+def seat_plan_cache_state():
+    """Parsed seat plans, for a startup snapshot."""
+    return dict(_seat_plan_cache)
+
+
+def restore_seat_plan_cache(state):
+    """Reuse parsed seat plans from a snapshot where the CSV is unchanged."""
+    for seat_plan_file, (stamp, rows) in state.items():
+        if stamp is not None and file_stamp(seat_plan_file) == stamp:
+            _seat_plan_cache[seat_plan_file] = (stamp, rows)
+
+
+def load_teams(seat_plan_file):
+    """Load team names from CSV file."""
+    return sorted(row['team'] for row in load_seat_plan(seat_plan_file))
 
 
 def get_team_info(team_name, seat_plan_file):
     """Get team information (room, desk) from CSV file."""
-    if os.path.exists(seat_plan_file):
-        try:
-            with open(seat_plan_file, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row.get('Team Name', '').strip() == team_name:
-                        return {
-                            'room': row.get('Room', '').strip(),
-                            'desk': row.get('Desk No', '').strip(),
-                            'team': team_name
-                        }
-        except Exception as e:
-            print(f"Error loading team info: {e}")
+    for row in load_seat_plan(seat_plan_file):
+        if row['team'] == team_name:
+            return {
+                'room': row['room'],
+                'desk': row['desk'],
+                'team': team_name
+            }
     return {'room': '', 'desk': '', 'team': team_name}
 
 
 def load_team_details(seat_plan_file):
     """Load all team details into a dictionary."""
     team_details = {}
-    if os.path.exists(seat_plan_file):
-        try:
-            with open(seat_plan_file, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    team_name = row.get('Team Name', '').strip()
-                    if team_name:
-                        team_details[team_name] = {
-                            'room': row.get('Room', '').strip(),
-                            'desk': row.get('Desk No', '').strip()
-                        }
-        except Exception as e:
-            print(f"Error loading team details: {e}")
+    for row in load_seat_plan(seat_plan_file):
+        team_details[row['team']] = {
+            'room': row['room'],
+            'desk': row['desk']
+        }
     return team_details
 
 
+def parse_upload_name(name, team_details=None):
+    """Split a saved upload name into timestamp, room, desk and original filename.
+
+    Original filenames may contain "_R..._D..." themselves; with the team's
+    seat plan details, a room/desk that does not match them is treated as
+    part of the filename. Returns None if the name has no timestamp.
+    """
+    match = UPLOAD_NAME_RE.match(name)
+    if match is None:
+        return None
+    parsed = match.groupdict()
+    if parsed['room'] is not None and team_details is not None and \
+            (parsed['room'], parsed['desk']) != (team_details['room'], team_details['desk']):
+        parsed = {'timestamp': parsed['timestamp'], 'room': None, 'desk': None,
+                  'filename': name[len(parsed['timestamp']) + 1:]}
+    return parsed
+
+
+def original_uploads(names):
+    """Names that are not derived from another name in the folder.
+
+    Derived files are named after their source plus a suffix
+    (upload.cpp -> upload.cpp.pdf, upload.pdf -> upload.pdf.stamped.pdf).
+    """
+    present = set(names)
+    originals = []
+    for name in names:
+        stem = name
+        derived = False
+        while "." in stem:
+            stem = stem.rsplit(".", 1)[0]
+            if stem in present:
+                derived = True
+                break
+        if not derived:
+            originals.append(name)
+    return originals
+
+
+def reserve_path(folder, filename):
+    """Create an empty file named `filename` in `folder` without clobbering.
+
+    Adds a counter before the extension when the name is taken; the file is
+    created exclusively, so concurrent callers never get the same path.
+    """
+    base, ext = os.path.splitext(filename)
+    candidate = filename
+    counter = 0
+    while True:
+        path = os.path.join(folder, candidate)
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return path
+        except FileExistsError:
+            counter += 1
+            candidate = f"{base}_{counter}{ext}"
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Hex SHA-256 digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def truncate_torn_tail(path, chunk_size=64 * 1024):
+    """Cut a partial last line (from a crash mid-write) off a JSON-lines file.
+
+    Returns the number of bytes removed.
+    """
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'r+b') as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return 0
+        f.seek(size - 1)
+        if f.read(1) == b'\n':
+            return 0
+        end = size
+        while end > 0:
+            start = max(0, end - chunk_size)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline != -1:
+                end = start + newline + 1
+                break
+            end = start
+        f.truncate(end)
+        return size - end
+
+
 def move_to_completed(file_path, team, upload_dir):
-    """Move file to completed directory after successful printing."""
+    """Move file to completed directory after successful printing.
+
+    Returns the new path, or None if the file could not be moved.
+    """
     try:
         team_folder = os.path.join(upload_dir, team)
         completed_folder = os.path.join(team_folder, "completed")
         os.makedirs(completed_folder, exist_ok=True)
         
-        filename = os.path.basename(file_path)
-        dest_path = os.path.join(completed_folder, filename)
-        
-        # If file already exists, add counter to avoid overwrite
-        if os.path.exists(dest_path):
-            base, ext = os.path.splitext(filename)
-            counter = 1
-            while os.path.exists(os.path.join(completed_folder, f"{base}_{counter}{ext}")):
-                counter += 1
-            dest_path = os.path.join(completed_folder, f"{base}_{counter}{ext}")
-        
+        # Claim a free name atomically (a counter is added if it is taken)
+        dest_path = reserve_path(completed_folder, os.path.basename(file_path))
         shutil.move(file_path, dest_path)
         print(f"Moved to completed: {dest_path}")
-        return True
+        return dest_path
     except Exception as e:
         print(f"Warning: Could not move file to completed: {e}")
-        return False
+        return None
@@ -0,0 +1,215 @@
+"""
+Watch the upload folder for files saved by other tools.
+
+simple.py only saves uploads as uploads/<team>/<timestamp>_R<room>_D<desk>_<name>.
+A FolderWatcher notices such files as they land and hands them to a
+callback in batches, so the automated pipeline can print them.
+
+On Linux the watcher uses inotify (through ctypes, no extra package) on
+the upload folder and every team folder in it. Elsewhere it falls back to
+scanning the team folders every few seconds.
+
+A file is only handed over once it has not changed for `settle` seconds,
+so partly written files are never picked up. Files that settle at the
+same time are delivered together. Files already present when the watcher
+starts are left to the reconciler's orphan recovery.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+DEFAULT_SETTLE = 2          # Seconds a file must stay unchanged before it is handed over
+DEFAULT_POLL_INTERVAL = 5   # Seconds between scans when inotify is not available
+SKIP_FOLDERS = ("completed",)
+
+# inotify(7)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+READ_SIZE = 64 * 1024
+
+
+def _load_inotify():
+    """libc with the inotify calls, or None where they are not available."""
+    if not sys.platform.startswith("linux"):
+        return None
+    libc_name = ctypes.util.find_library("c")
+    if libc_name is None:
+        return None
+    try:
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+_libc = _load_inotify()
+INOTIFY_AVAILABLE = _libc is not None
+
+
+class FolderWatcher:
+    """Calls `on_files(paths)` with new files in the team folders under `root`.
+
+    `paths` is a list of absolute paths that settled at about the same
+    time. Exceptions from `on_files` are logged and the watcher keeps going.
+    """
+
+    def __init__(self, root, on_files, settle=DEFAULT_SETTLE, poll_interval=DEFAULT_POLL_INTERVAL,
+                 use_inotify=True):
+        self.root = os.path.abspath(root)
+        self.on_files = on_files
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.backend = "inotify" if use_inotify and INOTIFY_AVAILABLE else "polling"
+        self._pending = {}   # path -> time of the last change seen
+        self._watches = {}   # inotify watch descriptor -> folder
+        self._scanned = {}   # polling: path -> (mtime_ns, size)
+        self._fd = None
+        self._thread = None
+        self.stats = {"backend": self.backend, "events": 0, "batches": 0, "files": 0, "overflows": 0}
+
+    def start(self):
+        """Start the watcher thread (idempotent)."""
+        if self._thread is None or not self._thread.is_alive():
+            os.makedirs(self.root, exist_ok=True)
+            if self.backend == "inotify":
+                self._open_inotify()
+            else:
+                self._scanned = self._scan()
+            self._thread = threading.Thread(target=self._run, name="folder-watcher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            timeout = self._next_timeout()
+            try:
+                if self.backend == "inotify":
+                    self._read_events(timeout)
+                else:
+                    time.sleep(self.poll_interval if timeout is None else min(timeout, self.poll_interval))
+                    self._poll()
+                self._flush()
+            except Exception as e:
+                print(f"Folder watcher error: {e}")
+                time.sleep(1)
+
+    # --- Debouncing ---
+
+    def _touch(self, path):
+        self.stats["events"] += 1
+        self._pending[path] = time.monotonic()
+
+    def _next_timeout(self):
+        """Seconds until the next pending file settles, or None if nothing is pending."""
+        if not self._pending:
+            return None
+        return max(0, min(self._pending.values()) + self.settle - time.monotonic())
+
+    def _flush(self):
+        now = time.monotonic()
+        settled = sorted(path for path, changed in self._pending.items() if now - changed >= self.settle)
+        for path in settled:
+            del self._pending[path]
+        batch = [path for path in settled if os.path.isfile(path)]
+        if not batch:
+            return
+        self.stats["batches"] += 1
+        self.stats["files"] += len(batch)
+        try:
+            self.on_files(batch)
+        except Exception as e:
+            print(f"Error handing over watched files: {e}")
+
+    # --- inotify ---
+
+    def _open_inotify(self):
+        self._fd = _libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._add_watch(self.root)
+        for name in os.listdir(self.root):
+            folder = os.path.join(self.root, name)
+            if os.path.isdir(folder) and name not in SKIP_FOLDERS:
+                self._add_watch(folder)
+
+    def _add_watch(self, folder):
+        wd = _libc.inotify_add_watch(self._fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            print(f"WARNING: Cannot watch {folder}: {os.strerror(ctypes.get_errno())}")
+            return
+        self._watches[wd] = folder
+
+    def _read_events(self, timeout):
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return
+        data = os.read(self._fd, READ_SIZE)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                self._rescan()
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            folder = self._watches.get(wd)
+            if folder is None or not name:
+                continue
+            path = os.path.join(folder, name)
+            if mask & IN_ISDIR:
+                if folder == self.root and name not in SKIP_FOLDERS:
+                    # New team folder: watch it, then pick up files written before the watch existed
+                    self._add_watch(path)
+                    for entry in os.listdir(path):
+                        if os.path.isfile(os.path.join(path, entry)):
+                            self._touch(os.path.join(path, entry))
+            elif folder != self.root:
+                self._touch(path)
+
+    def _rescan(self):
+        """Events were lost: treat every file in the team folders as changed."""
+        self.stats["overflows"] += 1
+        print("WARNING: Folder watcher event queue overflowed, rescanning")
+        for path in self._scan():
+            self._touch(path)
+
+    # --- Polling ---
+
+    def _scan(self):
+        """path -> (mtime_ns, size) for every file in the team folders."""
+        files = {}
+        for team in os.listdir(self.root):
+            folder = os.path.join(self.root, team)
+            if team in SKIP_FOLDERS or not os.path.isdir(folder):
+                continue
+            for entry in os.scandir(folder):
+                if entry.is_file():
+                    st = entry.stat()
+                    files[entry.path] = (st.st_mtime_ns, st.st_size)
+        return files
+
+    def _poll(self):
+        files = self._scan()
+        for path, stamp in files.items():
+            if self._scanned.get(path) != stamp:
+                self._touch(path)
+        self._scanned = files